@@ -0,0 +1,146 @@
+"""
+Loan amortization, computed locally with NumPy.
+
+Supports reducing-balance and flat-rate loans, any tenure, a balloon share
+of the principal due in the last month, and extra payments in harvest
+months. Schedules are evaluated for many scenarios at once (one row per
+rate/tenure/extra combination), so pricing a grid of options costs about
+the same as pricing one.
+"""
+import datetime
+
+import numpy as np
+
+DEFAULT_ANNUAL_RATE = 0.12
+DEFAULT_TENURE_MONTHS = 36
+TENURE_OPTIONS = (12, 24, 36, 48, 60)
+
+# Season by calendar month (1 = January): rabi harvest Mar-Apr, lean May,
+# kharif sowing Jun-Jul, kharif harvest Oct-Nov, rabi sowing Dec.
+SEASON_BY_MONTH = {
+    1: "growing", 2: "growing", 3: "harvest", 4: "harvest", 5: "lean", 6: "sowing",
+    7: "sowing", 8: "growing", 9: "growing", 10: "harvest", 11: "harvest", 12: "sowing",
+}
+HARVEST_MONTHS = tuple(m for m, s in SEASON_BY_MONTH.items() if s == "harvest")
+
+
+def emi(principal, annual_rate, months, method: str = "reducing", balloon_pct=0.0) -> np.ndarray:
+    """Monthly instalment; every argument broadcasts, so pass arrays for a grid."""
+    principal = np.asarray(principal, dtype=float)
+    months = np.asarray(months, dtype=float)
+    r = np.asarray(annual_rate, dtype=float) / 12
+    balloon = principal * np.asarray(balloon_pct, dtype=float)
+
+    if method == "flat":
+        return ((principal - balloon) + principal * r * months) / months
+
+    growth = (1 + r) ** months
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortizing = (principal - balloon / growth) * r * growth / (growth - 1)
+    return np.where(r == 0, (principal - balloon) / months, amortizing)
+
+
+def simulate(principal, annual_rate, months, method: str = "reducing",
+             balloon_pct=0.0, extra=None) -> dict:
+    """
+    Run S schedules side by side. Scalars broadcast to S; `extra` is an
+    (S, max_months) array of additional payments made on top of the EMI.
+    Returns per-month arrays of shape (S, max_months).
+    """
+    extra = None if extra is None else np.atleast_2d(np.asarray(extra, dtype=float))
+    n_scen = 1 if extra is None else extra.shape[0]
+    principal, annual_rate, months, balloon_pct = np.broadcast_arrays(
+        np.asarray(principal, dtype=float).reshape(-1),
+        np.asarray(annual_rate, dtype=float).reshape(-1),
+        np.asarray(months, dtype=int).reshape(-1),
+        np.asarray(balloon_pct, dtype=float).reshape(-1),
+        np.zeros(n_scen),
+    )[:4]
+    n_scen, horizon = principal.shape[0], int(months.max())
+    extra = np.zeros((n_scen, horizon)) if extra is None else np.broadcast_to(extra, (n_scen, horizon))
+    instalment = emi(principal, annual_rate, months, method, balloon_pct)
+    r = annual_rate / 12
+    flat_interest = principal * r
+
+    balance = principal.copy()
+    paid = np.zeros((n_scen, horizon))
+    interest = np.zeros((n_scen, horizon))
+    balances = np.zeros((n_scen, horizon))
+    for t in range(horizon):
+        active = (balance > 0.005) & (t < months)
+        due_int = np.where(method == "flat", flat_interest, balance * r) * active
+        last = (t == months - 1) & active
+        pay = np.where(last, balance + due_int, np.minimum(instalment + extra[:, t], balance + due_int)) * active
+        balance = np.where(active, balance - (pay - due_int), balance)
+        paid[:, t], interest[:, t], balances[:, t] = pay, due_int, np.maximum(balance, 0)
+
+    return {
+        "emi": instalment,
+        "payment": paid,
+        "interest": interest,
+        "balance": balances,
+        "total_interest": interest.sum(axis=1),
+        "total_paid": paid.sum(axis=1),
+        "months_to_close": (paid > 0).sum(axis=1),
+    }
+
+
+def harvest_extra(months: int, amount: float, start: datetime.date | None = None) -> np.ndarray:
+    """Extra-payment row paying `amount` in every harvest month of the tenure."""
+    first = (start or datetime.date.today()).month % 12 + 1  # repayments start next month
+    cal = (first - 1 + np.arange(months)) % 12 + 1
+    return np.where(np.isin(cal, HARVEST_MONTHS), amount, 0.0)
+
+
+def build_schedule(principal: float, annual_rate: float = DEFAULT_ANNUAL_RATE,
+                   months: int = DEFAULT_TENURE_MONTHS, method: str = "reducing",
+                   balloon_pct: float = 0.0, harvest_extra_inr: float = 0.0,
+                   start: datetime.date | None = None) -> dict:
+    start = start or datetime.date.today()
+    extra = harvest_extra(months, harvest_extra_inr, start)
+    # Scenario 0 is the requested plan; 1 adds Rs.500/month for the early-payoff tip.
+    sims = simulate(principal, annual_rate, months, method, balloon_pct,
+                    extra=np.vstack([extra, extra + 500]))
+
+    first = start.month % 12 + 1
+    rows = []
+    for t in range(months):
+        amount = sims["payment"][0, t]
+        if amount <= 0:
+            break
+        cal_month = (first - 1 + t) % 12 + 1
+        rows.append({
+            "month": t + 1,
+            "calendar_month": cal_month,
+            "emi_due": round(float(amount)),
+            "interest": round(float(sims["interest"][0, t])),
+            "principal": round(float(amount - sims["interest"][0, t])),
+            "balance": round(float(sims["balance"][0, t])),
+            "season": SEASON_BY_MONTH[cal_month],
+        })
+
+    return {
+        "method": method,
+        "annual_rate": annual_rate,
+        "monthly_emi": round(float(sims["emi"][0])),
+        "total_months": len(rows),
+        "total_interest_estimate": round(float(sims["total_interest"][0])),
+        "total_paid": round(float(sims["total_paid"][0])),
+        "monthly_breakdown": rows,
+        "early_payoff": {
+            "extra_per_month": 500,
+            "interest_saved": round(float(sims["total_interest"][0] - sims["total_interest"][1])),
+            "months_saved": int(sims["months_to_close"][0] - sims["months_to_close"][1]),
+        },
+    }
+
+
+def tenure_options(principal: float, annual_rate: float = DEFAULT_ANNUAL_RATE,
+                   method: str = "reducing", tenures=TENURE_OPTIONS) -> list[dict]:
+    tenures = np.asarray(tenures)
+    sims = simulate(principal, annual_rate, tenures, method)
+    return [
+        {"tenure_months": int(n), "monthly_emi": round(float(e)),
+         "total_interest": round(float(i)), "total_paid": round(float(p))}
+        for n, e, i, p in zip(tenures, sims["emi"], sims["total_interest"], sims["total_paid"])
+    ]
@@ -0,0 +1,226 @@
+"""
+Batch analysis for cooperatives and field agents.
+
+A batch is a list of FarmerProfiles (JSON, CSV or JSONL). Identical profiles
+are analysed once and their result fanned out to every row. Farmers run
+BATCH_CONCURRENCY at a time per job, and at most BATCH_MAX_IN_FLIGHT across
+all jobs, so a village upload cannot starve interactive /analyse traffic;
+the Groq rate limiter in llm.py still applies to every call underneath.
+
+The job id is a hash of the batch contents, so posting the same file again
+(or calling resume) picks the job up where it stopped: finished farmers are
+replayed from the job, and only the rest are analysed.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+BATCH_MAX_PROFILES = int(os.environ.get("BATCH_MAX_PROFILES", "1000"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", "16"))
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "50"))
+
+_in_flight = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+
+LIST_FIELDS = {"risk_exposure"}
+
+
+def _row_to_dict(row: dict) -> dict:
+    out = {}
+    for k, v in row.items():
+        if k is None:
+            continue
+        k = k.strip()
+        v = v.strip() if isinstance(v, str) else v
+        if v == "" or v is None:
+            continue
+        if k in LIST_FIELDS and isinstance(v, str):
+            v = [part.strip() for part in v.replace("|", ";").split(";") if part.strip()]
+        out[k] = v
+    return out
+
+
+def parse_upload(data: bytes, filename: str, model: type[BaseModel]) -> tuple[list, list]:
+    """
+    Parse a CSV, JSONL or JSON-array upload into ([(line, profile)], errors).
+    Bad rows are reported with their line number instead of failing the
+    whole batch; a JSON document that does not parse, or is not a list,
+    is a 400. CSV lists (risk_exposure) are separated by ';' or '|'.
+    """
+    text = data.decode("utf-8-sig", errors="replace")
+    if filename.lower().endswith((".jsonl", ".ndjson", ".json")):
+        rows = []
+        stripped = text.strip()
+        if filename.lower().endswith(".json") or stripped.startswith("["):
+            try:
+                document = json.loads(stripped)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON at line {e.lineno}, "
+                                                            f"column {e.colno}: {e.msg}.")
+            if not isinstance(document, list):
+                raise HTTPException(status_code=400, detail="A JSON upload must be a list of profiles.")
+            rows = [(i + 1, r) for i, r in enumerate(document)]
+        else:
+            for i, line in enumerate(text.splitlines(), 1):
+                if line.strip():
+                    try:
+                        rows.append((i, json.loads(line)))
+                    except json.JSONDecodeError as e:
+                        rows.append((i, e))
+    else:
+        rows = [(i, _row_to_dict(r)) for i, r in enumerate(csv.DictReader(io.StringIO(text)), 2)]
+    return validate_rows(rows, model)
+
+
+def validate_rows(rows: list, model: type[BaseModel]) -> tuple[list, list]:
+    profiles, errors = [], []
+    for row_no, raw in rows:
+        if isinstance(raw, Exception):
+            errors.append({"row": row_no, "error": f"invalid JSON: {raw}"})
+            continue
+        try:
+            profiles.append((row_no, model.model_validate(raw)))
+        except ValidationError as e:
+            errors.append({"row": row_no, "error": "; ".join(
+                f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}" for err in e.errors())})
+    return profiles, errors
+
+
+class BatchJob:
+    def __init__(self, job_id: str, rows: list[tuple[int, str]], profiles: dict, rejected: list):
+        self.id = job_id
+        self.row_keys = rows              # (row number, key) per valid input row, in order
+        self.profiles = profiles          # unique key -> profile
+        self.rows: dict[str, list[int]] = {}
+        for row_no, k in rows:
+            self.rows.setdefault(k, []).append(row_no)
+        self.rejected = rejected          # rows that failed validation
+        self.results: dict[str, dict] = {}
+        self.errors: dict[str, str] = {}
+        self.created = time.time()
+        self.running = False
+        self.analysed = 0                 # unique profiles finished by this process
+        self.active_s = 0.0               # wall time spent running, across resumes
+
+    def pending(self) -> list[str]:
+        return [k for k in self.profiles if k not in self.results]
+
+    def status(self) -> dict:
+        done = len(self.results)
+        return {
+            "job_id": self.id,
+            "rows": len(self.row_keys) + len(self.rejected),
+            "unique_profiles": len(self.profiles),
+            "duplicates": len(self.row_keys) - len(self.profiles),
+            "rejected_rows": self.rejected,
+            "completed": done,
+            "failed": len(self.errors),
+            "pending": len(self.profiles) - done,
+            "running": self.running,
+            "state": "done" if done == len(self.profiles) else "running" if self.running else "partial",
+            "farmers_per_minute": self.rate(),
+        }
+
+    def rate(self) -> float | None:
+        if not self.active_s or not self.analysed:
+            return None
+        return round(self.analysed / self.active_s * 60, 1)
+
+
+class JobStore:
+    def __init__(self, max_jobs: int = BATCH_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[str, BatchJob] = OrderedDict()
+
+    def get(self, job_id: str) -> BatchJob | None:
+        return self.jobs.get(job_id)
+
+    def open(self, profiles: list[tuple[int, BaseModel]], key_fn: Callable, rejected: list) -> BatchJob:
+        """Create the job for these (row, profile) pairs, or return the existing one to resume."""
+        rows = [(row_no, key_fn(p)) for row_no, p in profiles]
+        job_id = hashlib.sha256("\n".join(f"{r}:{k}" for r, k in rows).encode()).hexdigest()[:16]
+        job = self.jobs.get(job_id)
+        if job is None:
+            unique = {}
+            for (_, k), (_, p) in zip(rows, profiles):
+                unique.setdefault(k, p)
+            job = BatchJob(job_id, rows, unique, rejected)
+            self.jobs[job_id] = job
+            idle = [j.id for j in self.jobs.values() if not j.running]
+            for old_id in idle[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[old_id]
+        self.jobs.move_to_end(job_id)
+        return job
+
+
+jobs = JobStore()
+
+
+async def run_job(job: BatchJob, analyse_one: Callable[[object, str], Awaitable[dict]],
+                  concurrency: int = BATCH_CONCURRENCY):
+    """
+    Yield ("job", status), then one ("result", ...) per unique profile as
+    it finishes (replaying ones finished in an earlier run first), then
+    ("meta", status). Cancelling the consumer cancels in-flight work; what
+    finished stays in the job for the next resume.
+    """
+    if job.running:
+        raise HTTPException(status_code=409,
+                            detail=f"Batch {job.id} is already running; poll GET /analyse-batch/{job.id}.")
+    job.running = True
+    slots = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def one(key: str):
+        async with slots, _in_flight:
+            try:
+                value = await analyse_one(job.profiles[key], key)
+                return key, {"ok": True, "result": value}
+            except Exception as e:  # one farmer failing must not sink the batch
+                detail = getattr(e, "detail", None) or str(e)
+                return key, {"ok": False, "error": detail}
+
+    try:
+        yield "job", job.status()
+        for key, result in list(job.results.items()):
+            yield "result", {"rows": job.rows[key], "key": key, "resumed": True, **result}
+
+        t0 = time.perf_counter()
+        tasks = [asyncio.ensure_future(one(k)) for k in job.pending()]
+        for next_done in asyncio.as_completed(tasks):
+            key, outcome = await next_done
+            now = time.perf_counter()
+            job.analysed += 1
+            job.active_s += now - t0
+            t0 = now
+            if outcome["ok"]:
+                job.results[key] = outcome
+                job.errors.pop(key, None)
+            else:
+                job.errors[key] = outcome["error"]
+            yield "result", {"rows": job.rows[key], "key": key, "resumed": False, **outcome}
+    finally:
+        for task in tasks:
+            task.cancel()
+        job.running = False
+    yield "meta", job.status()
+
+
+def results_by_row(job: BatchJob) -> list[dict]:
+    """One entry per valid input row, in input order, for the non-streaming response."""
+    out = []
+    for row_no, key in job.row_keys:
+        if key in job.results:
+            out.append({"row": row_no, "ok": True, "result": job.results[key]["result"]})
+        else:
+            out.append({"row": row_no, "ok": False, "error": job.errors.get(key, "not analysed yet")})
+    return out
@@ -0,0 +1,113 @@
+"""
+Benchmark the local clause scanner over a corpus of loan agreements.
+
+By default a synthetic corpus is generated: agreements of varying length
+built from boilerplate plus randomly planted risky clauses, so recall can
+be checked too. Pass --corpus DIR to scan real .txt files instead.
+
+    python bench/clause_scan_bench.py --docs 200
+    python bench/clause_scan_bench.py --corpus ~/agreements --json
+"""
+import argparse
+import json
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from clauses import scan  # noqa: E402
+
+BOILERPLATE = [
+    "The Borrower shall use the loan amount only for the purpose stated in the application.",
+    "The Borrower shall keep the Lender informed of any change in address or occupation.",
+    "All notices under this agreement shall be sent to the address given in the schedule.",
+    "This agreement shall be governed by the laws of India and courts at the district headquarters.",
+    "The Borrower confirms that the information given in the application is true and complete.",
+    "The Lender may inspect the crops and assets financed under this agreement at reasonable times.",
+    "The Borrower shall not sell, lease or transfer the financed asset without written consent.",
+    "Disbursement shall be made directly to the supplier against a proper invoice.",
+]
+
+RISKY = {
+    "prepayment_penalty": "Foreclosure charges of {pct}% of the outstanding principal shall be payable on prepayment.",
+    "balloon_payment": "The remaining principal shall be paid as a balloon payment at the end of the tenure.",
+    "floating_rate": "The loan carries a floating rate linked to the MCLR of the Lender.",
+    "cross_collateral": "All other assets of the Borrower shall stand charged as security for this loan.",
+    "waiver_of_rights": "The Borrower irrevocably waives all rights to dispute the statement of account.",
+    "compound_interest": "Interest shall be compounded monthly on the outstanding balance.",
+    "land_collateral": "The loan is secured by mortgage of agricultural land bearing survey no. {n}.",
+    "auto_renewal": "The facility shall be automatically renewed each year unless closed by the Borrower.",
+    "personal_guarantee": "The guarantor shall be jointly and severally liable for all dues.",
+    "penal_interest": "Penal interest at {pct}% per month shall apply on overdue amounts.",
+    "lender_insurance": "The crop shall be insured with the bank as the sole beneficiary.",
+    "no_grace_period": "There is no grace period for any instalment.",
+    "unilateral_terms": "The Lender may change these terms at its sole discretion.",
+}
+
+
+def synth_corpus(n_docs: int, seed: int = 7) -> list[tuple[str, set]]:
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(n_docs):
+        n_clauses = rng.choice([20, 60, 200, 600, 2000])
+        planted = set(rng.sample(sorted(RISKY), rng.randint(0, 6)))
+        lines = [rng.choice(BOILERPLATE) for _ in range(n_clauses)]
+        for name in planted:
+            pos = rng.randrange(len(lines))
+            lines.insert(pos, RISKY[name].format(pct=rng.choice([2, 3, 4, 5]), n=rng.randint(1, 999)))
+        lines.insert(0, f"The rate of interest shall be {rng.choice([9, 12, 18, 24, 36])}% per annum.")
+        text = "LOAN AGREEMENT\n" + "\n".join(f"{i + 1}. {line}" for i, line in enumerate(lines))
+        docs.append((text, planted))
+    return docs
+
+
+def load_corpus(path: str) -> list[tuple[str, set | None]]:
+    return [(p.read_text(errors="ignore"), None) for p in sorted(pathlib.Path(path).glob("*.txt"))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=200)
+    ap.add_argument("--corpus", help="directory of .txt agreements (default: synthetic)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synth_corpus(args.docs)
+    total_chars = sum(len(t) for t, _ in corpus)
+    times, found, planted_total = [], 0, 0
+
+    for _ in range(args.repeat):
+        for text, planted in corpus:
+            t0 = time.perf_counter()
+            result = scan(text)
+            times.append((time.perf_counter() - t0) * 1000)
+            if planted is not None:
+                hit_types = {h["type"] for h in result["hits"]}
+                found += len(planted & hit_types)
+                planted_total += len(planted)
+
+    times.sort()
+    elapsed_s = sum(times) / 1000
+    out = {
+        "docs": len(corpus),
+        "total_mb": round(total_chars / 1e6, 2),
+        "mean_doc_kb": round(total_chars / len(corpus) / 1e3, 1),
+        "p50_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[int(len(times) * 0.95) - 1], 3),
+        "max_ms": round(times[-1], 3),
+        "mb_per_s": round(total_chars * args.repeat / 1e6 / elapsed_s, 1),
+        "recall": round(found / planted_total, 3) if planted_total else None,
+    }
+    if args.json:
+        print(json.dumps(out))
+    else:
+        for k, v in out.items():
+            print(f"{k:>12}: {v}")
+
+
+if __name__ == "__main__":
+    main()
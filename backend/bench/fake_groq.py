@@ -0,0 +1,243 @@
+"""
+Minimal stand-in for the Groq chat completions API, for load testing.
+
+    FAKE_GROQ_LATENCY_S=1.0 uvicorn bench.fake_groq:app --port 9000
+    GROQ_BASE_URL=http://localhost:9000 GROQ_API_KEY=x uvicorn main:app --port 8000
+
+Timing: each call waits FAKE_GROQ_LATENCY_S. With FAKE_GROQ_COMPLETION_TPS
+set, that is only the time to first token, and the answer then takes
+completion_tokens / COMPLETION_TPS more (plus prompt_tokens /
+FAKE_GROQ_PROMPT_TPS when set), which is closer to how Groq behaves for
+long answers. FAKE_GROQ_LATENCY_JITTER scales every wait by a lognormal
+factor with that sigma. FAKE_GROQ_SEED makes the whole run repeatable.
+
+Failures can be injected to exercise retries and the circuit breaker:
+FAKE_GROQ_ERROR_RATE (share of calls answered 503) and
+FAKE_GROQ_RATE_LIMIT_RATE (share answered 429 with Retry-After), or at
+runtime with POST /fake/config {"error_rate": 1.0}. FAKE_GROQ_DOWN_MODELS
+(comma-separated) answers 503 for those models only, to exercise the
+fallback between model tiers.
+
+Answers follow the JSON schema at the end of the prompt, with placeholder
+text. FAKE_GROQ_TRUNCATE_RATE cuts that share of answers off part-way, the
+way Groq does at max_tokens: a 400 json_validate_failed carrying the
+partial text in JSON mode, or a stream that stops with finish_reason=length.
+
+Recorded answers make the content realistic. Run once against the real API
+with FAKE_GROQ_RECORD_TO=recordings.jsonl (the fake then forwards every call
+to FAKE_GROQ_UPSTREAM with the caller's key and appends the answers), and
+later replay them with FAKE_GROQ_RECORDINGS=recordings.jsonl. Answers are
+matched to prompts by the keys of the JSON schema the prompt asks for;
+prompts without a recording get placeholder answers.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+RECORDINGS = os.environ.get("FAKE_GROQ_RECORDINGS", "")
+RECORD_TO = os.environ.get("FAKE_GROQ_RECORD_TO", "")
+UPSTREAM = os.environ.get("FAKE_GROQ_UPSTREAM", "https://api.groq.com")
+
+rng = random.Random(os.environ.get("FAKE_GROQ_SEED") or None)
+
+config = {
+    "latency_s": float(os.environ.get("FAKE_GROQ_LATENCY_S", "1.0")),
+    "latency_jitter": float(os.environ.get("FAKE_GROQ_LATENCY_JITTER", "0")),
+    "prompt_tps": float(os.environ.get("FAKE_GROQ_PROMPT_TPS", "0")),
+    "completion_tps": float(os.environ.get("FAKE_GROQ_COMPLETION_TPS", "0")),
+    "error_rate": float(os.environ.get("FAKE_GROQ_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.environ.get("FAKE_GROQ_RATE_LIMIT_RATE", "0")),
+    "retry_after_s": float(os.environ.get("FAKE_GROQ_RETRY_AFTER_S", "1")),
+    "truncate_rate": float(os.environ.get("FAKE_GROQ_TRUNCATE_RATE", "0")),
+    "down_models": [m for m in os.environ.get("FAKE_GROQ_DOWN_MODELS", "").split(",") if m],
+}
+calls = {"ok": 0, "error": 0, "rate_limited": 0, "truncated": 0, "replayed": 0, "recorded": 0}
+
+app = FastAPI(title="Fake Groq")
+
+
+@app.post("/fake/config")
+async def set_config(request: Request):
+    config.update(await request.json())
+    return {"config": config, "calls": calls}
+
+
+@app.get("/fake/config")
+async def get_config():
+    return {"config": config, "calls": calls}
+
+
+def schema_line(prompt: str) -> str:
+    """The one-line JSON schema a prompt ends with."""
+    schemas = [line for line in prompt.splitlines() if line.startswith("{ ")]
+    return schemas[-1] if schemas else ""
+
+
+def schema_key(prompt: str) -> str:
+    # The schema's key names identify the prompt; its placeholders carry
+    # per-request values (names, amounts) and would never match.
+    return ",".join(re.findall(r'"(\w+)":', schema_line(prompt)))
+
+
+def load_recordings(path: str) -> dict[str, list[str]]:
+    recorded: dict[str, list[str]] = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recorded.setdefault(entry["schema"], []).append(entry["content"])
+    return recorded
+
+
+recordings = load_recordings(RECORDINGS)
+
+
+def injected_failure(model: str) -> JSONResponse | None:
+    if model in config["down_models"]:
+        calls["error"] += 1
+        return JSONResponse({"error": {"message": f"{model} is over capacity", "type": "internal"}},
+                            status_code=503)
+    roll = rng.random()
+    if roll < config["rate_limit_rate"]:
+        calls["rate_limited"] += 1
+        return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests"}}, status_code=429,
+                            headers={"retry-after": str(config["retry_after_s"])})
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        calls["error"] += 1
+        return JSONResponse({"error": {"message": "Service unavailable", "type": "internal"}}, status_code=503)
+    calls["ok"] += 1
+    return None
+
+
+def fake_answer(prompt: str) -> str:
+    """A recorded answer for this prompt, or its JSON schema filled with placeholders."""
+    key, schema = schema_key(prompt), schema_line(prompt)
+    if recordings.get(key):
+        calls["replayed"] += 1
+        return matched_ids(prompt, rng.choice(recordings[key]))
+    if not schema:
+        return json.dumps({"ok": True, "schemes": []})
+    if key.startswith("1,"):
+        # A translation request: echo the numbered phrases, marked as translated.
+        phrases = next((json.loads(line) for line in prompt.splitlines() if line.startswith('{"1"')), {})
+        return json.dumps({k: f"[tr] {v}" for k, v in phrases.items()}, ensure_ascii=False)
+    text = re.sub(r'"<[^"]*>"', '"Sample text."', schema)
+    text = re.sub(r"<[^<>]*>", "1", text).replace("true or false", "true")
+    return matched_ids(prompt, text)
+
+
+def matched_ids(prompt: str, text: str) -> str:
+    try:
+        answer = json.loads(text)
+    except json.JSONDecodeError:
+        return json.dumps({"ok": True, "schemes": []})
+    if isinstance(answer.get("schemes"), list) and answer["schemes"]:
+        # One entry per shortlisted scheme, so the ids match.
+        ids = re.findall(r"^\d+\. (\S+) - ", prompt, re.M)
+        answer["schemes"] = [{**answer["schemes"][0], "scheme_id": sid, "priority": i + 1}
+                             for i, sid in enumerate(ids)]
+    return json.dumps(answer)
+
+
+def truncated(content: str) -> str | None:
+    if rng.random() >= config["truncate_rate"]:
+        return None
+    calls["truncated"] += 1
+    return content[:int(len(content) * rng.uniform(0.3, 0.9))]
+
+
+def delays(usage: dict) -> tuple[float, float]:
+    """(seconds to the first token, seconds from there to the last one)."""
+    if RECORD_TO:
+        return 0.0, 0.0  # the real call already took its time
+    jitter = rng.lognormvariate(0, config["latency_jitter"]) if config["latency_jitter"] else 1.0
+    first = config["latency_s"]
+    if config["prompt_tps"]:
+        first += usage["prompt_tokens"] / config["prompt_tps"]
+    if not config["completion_tps"]:
+        return 0.0, first * jitter  # FAKE_GROQ_LATENCY_S covers the whole call
+    return first * jitter, usage["completion_tokens"] / config["completion_tps"] * jitter
+
+
+async def recorded_call(request: Request, body: dict) -> str:
+    """Ask the real API (without streaming) and keep the answer for replay."""
+    async with httpx.AsyncClient(base_url=UPSTREAM, timeout=120) as http:
+        r = await http.post("/openai/v1/chat/completions", json={**body, "stream": False},
+                            headers={"authorization": request.headers.get("authorization", "")})
+    r.raise_for_status()
+    content = r.json()["choices"][0]["message"]["content"]
+    prompt = body.get("messages", [{}])[-1].get("content", "")
+    with open(RECORD_TO, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"schema": schema_key(prompt), "content": content}) + "\n")
+    calls["recorded"] += 1
+    return content
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    failure = injected_failure(body.get("model", ""))
+    if failure is not None:
+        return failure
+    prompt = body.get("messages", [{}])[-1].get("content", "")
+    content = await recorded_call(request, body) if RECORD_TO else fake_answer(prompt)
+    cut = truncated(content)
+    # Roughly what Groq would bill, so token logging has numbers to show.
+    usage = {"prompt_tokens": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+             "completion_tokens": len(content) // 4}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, cut or content, usage, "length" if cut else "stop"),
+                                 media_type="text/event-stream")
+    await asyncio.sleep(sum(delays(usage)))
+    if cut is not None:
+        return JSONResponse({"error": {
+            "message": "Failed to generate JSON. Please adjust your prompt.", "type": "invalid_request_error",
+            "code": "json_validate_failed", "failed_generation": cut}}, status_code=400)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+@app.get("/openai/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "fake", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+
+async def stream_chunks(body: dict, content: str, usage: dict, finish_reason: str = "stop"):
+    # Spread the generation time over the tokens, like a real generation.
+    first, generation = delays(usage)
+    await asyncio.sleep(first)
+    pieces = [content[i:i + 8] for i in range(0, len(content), 8)] or [""]
+    for piece in pieces:
+        await asyncio.sleep(generation / len(pieces))
+        chunk = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    # Groq sends the usage on the last chunk, under x_groq.
+    chunk["choices"] = [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+    chunk["x_groq"] = {"usage": usage}
+    yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
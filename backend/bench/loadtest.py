@@ -0,0 +1,299 @@
+"""
+Drive a running SahyogAI API with a generated workload and report, per
+endpoint: throughput, latency percentiles (to the last byte, and to the
+first byte for streams), server memory and LLM tokens per request.
+
+Endpoints run one after another so memory and tokens can be put down to
+each. Pair it with bench/fake_groq.py for runs that never touch Groq:
+
+    FAKE_GROQ_SEED=1 FAKE_GROQ_COMPLETION_TPS=250 uvicorn bench.fake_groq:app --port 9000
+    GROQ_BASE_URL=http://localhost:9000 GROQ_API_KEY=x uvicorn main:app --port 8000
+    python bench/loadtest.py -n 200 -c 20 --out results/v1.json
+    python bench/loadtest.py --compare results/v1.json results/v2.json
+
+--out writes the results as JSON (with the git revision and settings), so
+two releases can be diffed with --compare; --max-regression makes that
+exit non-zero when a latency, memory or token figure got worse by more
+than the given percentage.
+"""
+import argparse
+import asyncio
+import json
+import math
+import pathlib
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+
+import workload  # noqa: E402
+
+DEFAULT_ENDPOINTS = "/analyse,/assess-loan,/repayment-plan,/analyse-document,/schemes"
+GET_ENDPOINTS = ("/", "/health", "/ready", "/schemes", "/metrics", "/llm/usage")
+LOAN_ENDPOINTS = ("/assess-loan", "/repayment-plan")
+MEMORY_SAMPLE_S = 0.5
+
+# (metric path in a result, True when higher is better), for --compare.
+COMPARED = [
+    (("rps",), True),
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("ttfb_ms", "p50"), False),
+    (("rss_mb", "peak"), False),
+    (("llm_per_request", "prompt_tokens"), False),
+    (("llm_per_request", "completion_tokens"), False),
+    (("error_rate",), False),
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summary_ms(seconds: list[float]) -> dict:
+    if not seconds:
+        return {}
+    ms = sorted(s * 1000 for s in seconds)
+    return {"mean": round(statistics.fmean(ms), 1), "p50": round(percentile(ms, 0.5), 1),
+            "p95": round(percentile(ms, 0.95), 1), "p99": round(percentile(ms, 0.99), 1),
+            "max": round(ms[-1], 1)}
+
+
+def load_workload(path: str | None, n_profiles: int, n_docs: int, seed: int, repeat_rate: float):
+    if not path:
+        return workload.profiles(n_profiles, seed, repeat_rate), workload.documents(n_docs, seed)
+    profiles, docs = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                if item["kind"] == "profile":
+                    profiles.append(item["body"])
+                else:
+                    docs.append({"filename": item["filename"], "text": item["text"]})
+    return profiles, docs
+
+
+async def server_rss_mb(http: httpx.AsyncClient) -> float | None:
+    try:
+        text = (await http.get("/metrics")).text
+    except httpx.HTTPError:
+        return None
+    m = re.search(r"^process_resident_memory_bytes (\d+)", text, re.M)
+    return round(int(m.group(1)) / 2**20, 1) if m else None
+
+
+async def llm_totals(http: httpx.AsyncClient) -> dict:
+    try:
+        data = (await http.get("/llm/usage")).json()
+        usage = data["usage"]
+    except (httpx.HTTPError, ValueError, KeyError):
+        return {}
+    keys = ("calls", "prompt_tokens", "completion_tokens", "follow_ups", "truncated")
+    totals = {k: sum(row.get(k, 0) for row in usage.values()) for k in keys}
+    # Calls that joined an identical one in flight instead of going upstream.
+    totals["coalesced"] = data.get("coalescing", {}).get("saved_calls", 0)
+    return totals
+
+
+async def fake_calls(fake_url: str | None) -> dict:
+    if not fake_url:
+        return {}
+    async with httpx.AsyncClient(base_url=fake_url, timeout=10) as http:
+        try:
+            return (await http.get("/fake/config")).json()["calls"]
+        except (httpx.HTTPError, ValueError, KeyError):
+            return {}
+
+
+def diff(after: dict, before: dict) -> dict:
+    return {k: v - before.get(k, 0) for k, v in after.items()}
+
+
+async def run_endpoint(http: httpx.AsyncClient, endpoint: str, profiles: list[dict], docs: list[dict],
+                       total: int, concurrency: int, warmup: int, offset: int, fake_url: str | None) -> dict:
+    path = endpoint.partition("?")[0]
+    if path in LOAN_ENDPOINTS:
+        profiles = [p for p in profiles if p.get("loan_purpose")]
+    latencies, ttfbs, statuses = [], [], {}
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, counted: bool = True):
+        i += offset
+        async with sem:
+            if path in GET_ENDPOINTS:
+                request = http.build_request("GET", endpoint)
+            elif path == "/analyse-document":
+                doc = docs[i % len(docs)]
+                request = http.build_request("POST", endpoint,
+                                             files={"file": (doc["filename"], doc["text"].encode(), "text/plain")})
+            else:
+                request = http.build_request("POST", endpoint, json=profiles[i % len(profiles)])
+            t0 = time.perf_counter()
+            ttfb = None
+            try:
+                response = await http.send(request, stream=True)
+                async for _ in response.aiter_raw():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - t0
+                await response.aclose()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if counted:
+                latencies.append(time.perf_counter() - t0)
+                if ttfb is not None:
+                    ttfbs.append(ttfb)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(one(i, counted=False) for i in range(warmup)))
+
+    rss = [await server_rss_mb(http)]
+    llm_before, fake_before = await llm_totals(http), await fake_calls(fake_url)
+    done = asyncio.Event()
+
+    async def sample_memory():
+        while not done.is_set():
+            rss.append(await server_rss_mb(http))
+            try:
+                await asyncio.wait_for(done.wait(), MEMORY_SAMPLE_S)
+            except asyncio.TimeoutError:
+                pass
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(warmup + i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampler
+    rss.append(await server_rss_mb(http))
+
+    llm = diff(await llm_totals(http), llm_before)
+    errors = sum(n for status, n in statuses.items() if not status.startswith(("2", "3")))
+    rss = [r for r in rss if r is not None]
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "rps": round(total / elapsed, 2),
+        "status": statuses,
+        "error_rate": round(errors / total, 4),
+        "latency_ms": summary_ms(latencies),
+        "ttfb_ms": summary_ms(ttfbs),
+        "rss_mb": {"start": rss[0], "peak": max(rss), "end": rss[-1]} if rss else {},
+        "llm_per_request": {k: round(v / total, 1) for k, v in llm.items()},
+    }
+    if fake_url:
+        result["fake_groq_calls"] = diff(await fake_calls(fake_url), fake_before)
+    return result
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=pathlib.Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    profiles, docs = load_workload(args.workload, args.profiles, args.docs, args.seed, args.repeat_rate)
+    endpoints = [e.strip() for e in (args.endpoint or args.endpoints).split(",") if e.strip()]
+    results = {}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=args.concurrency + 4)) as http:
+        for n, endpoint in enumerate(endpoints):
+            # Each endpoint starts further into the workload, so running
+            # /analyse and /analyse?stream=sse does not just hit the cache.
+            r = results[endpoint] = await run_endpoint(http, endpoint, profiles, docs, args.requests,
+                                                       args.concurrency, args.warmup,
+                                                       n * (args.requests + args.warmup), args.fake_url)
+            lat = r["latency_ms"]
+            print(f"{endpoint}: {r['requests']} requests, concurrency {r['concurrency']}, "
+                  f"{r['error_rate']:.1%} errors {r['status']}", file=sys.stderr)
+            print(f"  {r['rps']:.2f} req/s  |  p50 {lat['p50']:.0f}ms  p95 {lat['p95']:.0f}ms  "
+                  f"p99 {lat['p99']:.0f}ms  |  rss {r['rss_mb'].get('peak')}MB  |  "
+                  f"tokens/req {r['llm_per_request'].get('prompt_tokens', 0)}"
+                  f"+{r['llm_per_request'].get('completion_tokens', 0)}", file=sys.stderr)
+    return {
+        "meta": {"revision": git_revision(), "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": platform.python_version(), "url": args.url, "seed": args.seed,
+                 "workload": args.workload or {"profiles": len(profiles), "docs": len(docs),
+                                               "repeat_rate": args.repeat_rate},
+                 "fake_groq": (await fake_config(args.fake_url))},
+        "endpoints": results,
+    }
+
+
+async def fake_config(fake_url: str | None) -> dict | None:
+    if not fake_url:
+        return None
+    async with httpx.AsyncClient(base_url=fake_url, timeout=10) as http:
+        try:
+            return (await http.get("/fake/config")).json()["config"]
+        except (httpx.HTTPError, ValueError, KeyError):
+            return None
+
+
+def compare(old_path: str, new_path: str, max_regression: float | None) -> int:
+    old, new = (json.loads(pathlib.Path(p).read_text()) for p in (old_path, new_path))
+    print(f"{old['meta'].get('revision')} -> {new['meta'].get('revision')}")
+    worst = 0.0
+    for endpoint in new["endpoints"]:
+        if endpoint not in old["endpoints"]:
+            continue
+        print(endpoint)
+        for path, higher_is_better in COMPARED:
+            a, b = old["endpoints"][endpoint], new["endpoints"][endpoint]
+            for key in path:
+                a, b = (a or {}).get(key), (b or {}).get(key)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else (0.0 if a == b else math.inf)
+            worse = -change if higher_is_better else change
+            worst = max(worst, worse)
+            flag = "  worse" if worse > (max_regression or 0) else ""
+            print(f"  {'.'.join(path):<34} {a:>10} -> {b:<10} {change:+6.1f}%{flag}")
+    if max_regression is not None and worst > max_regression:
+        print(f"regression of {worst:.1f}% exceeds {max_regression}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--endpoints", default=DEFAULT_ENDPOINTS,
+                    help="comma-separated, run in turn; may carry a query, e.g. /analyse?stream=sse")
+    ap.add_argument("--endpoint", help="a single endpoint (overrides --endpoints)")
+    ap.add_argument("-n", "--requests", type=int, default=100, help="per endpoint")
+    ap.add_argument("-c", "--concurrency", type=int, default=20)
+    ap.add_argument("--warmup", type=int, default=0, help="uncounted requests per endpoint first")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--workload", help="JSONL from bench/workload.py (default: generate one)")
+    ap.add_argument("--profiles", type=int, default=200)
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--repeat-rate", type=float, default=0.0, help="share of repeated profiles (cache hits)")
+    ap.add_argument("--seed", type=int, default=11)
+    ap.add_argument("--fake-url", help="fake Groq server, to record its settings and call counts")
+    ap.add_argument("--out", help="write the results as JSON here ('-' for stdout)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two --out files")
+    ap.add_argument("--max-regression", type=float, help="with --compare, exit 1 above this %% worse")
+    args = ap.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.max_regression))
+    out = asyncio.run(run(args))
+    if args.out == "-":
+        print(json.dumps(out, indent=2))
+    elif args.out:
+        pathlib.Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(args.out).write_text(json.dumps(out, indent=2) + "\n")
@@ -0,0 +1,67 @@
+"""
+Sanity checks for the loan simulation (simulation.py), for every month a
+loan can start in.
+
+A small loan for a household with money left each month must come out far
+from certain default, whatever the season: falling behind before a harvest
+that clears the arrears is not a default. For the same households, the
+/assess-loan/sweep frontier must find a safe amount for every tenure.
+
+    python bench/simulation_check.py
+    python bench/simulation_check.py --max-default 0.05
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import simulation  # noqa: E402
+from main import FarmerProfile  # noqa: E402
+
+SOLVENT = [
+    FarmerProfile(name="Sita", state="Bihar", land_acres=2, crop_type="rice", income_type="mixed",
+                  monthly_income_inr=25000, household_size=4, existing_debt_inr=30000, risk_exposure=["flood"]),
+    FarmerProfile(name="Gurpreet", state="Punjab", land_acres=6, crop_type="wheat", income_type="seasonal",
+                  monthly_income_inr=40000, household_size=5, existing_debt_inr=0, risk_exposure=["price crash"]),
+    FarmerProfile(name="Ramesh", state="Maharashtra", land_acres=3, crop_type="cotton", income_type="seasonal",
+                  monthly_income_inr=30000, household_size=5, existing_debt_inr=40000,
+                  risk_exposure=["drought", "pest"]),
+]
+SMALL_LOANS = [(5000, 12), (20000, 24)]  # amount, tenure in months
+SWEEP_AMOUNTS = range(5000, 305000, 5000)
+SWEEP_TENURES = (12, 24, 36, 48, 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-default", type=float, default=0.1)
+    args = parser.parse_args()
+
+    failures = []
+    t0 = time.perf_counter()
+    for p in SOLVENT:
+        row = []
+        for start in range(1, 13):
+            for amount, months in SMALL_LOANS:
+                sim = simulation.simulate_loan(p, amount, months=months, start_month=start)
+                row.append(sim["default_probability"])
+                if sim["default_probability"] > args.max_default:
+                    failures.append(f"{p.name}: Rs.{amount:,} over {months} months from month {start} "
+                                    f"defaults in {sim['default_probability']:.1%} of paths")
+            sweep = simulation.sweep(p, SWEEP_AMOUNTS, SWEEP_TENURES, [simulation.DEFAULT_ANNUAL_RATE],
+                                     args.max_default, start_month=start)
+            empty = [f["tenure_months"] for f in sweep["frontier"] if f["max_safe_amount_inr"] is None]
+            if empty:
+                failures.append(f"{p.name}: no safe amount from month {start} for tenures {empty}")
+        print(f"{p.name:10} worst default odds over 12 start months: {max(row):.3f}")
+    print(f"{len(SOLVENT) * 12 * (len(SMALL_LOANS) + 1)} simulations and sweeps in {time.perf_counter() - t0:.1f}s")
+
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
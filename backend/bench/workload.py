@@ -0,0 +1,103 @@
+"""
+Generate realistic FarmerProfile bodies and loan agreements for benchmarks.
+
+Profiles mix the states, crops and income types offered by the frontend.
+Land follows a long-tailed distribution (mostly marginal and small farms),
+and income, debt and loan size follow from the land and crop. Agreements
+come from the clause scanner benchmark's synthetic corpus. The same seed
+always gives the same workload, so runs on different releases compare
+like with like.
+
+    python bench/workload.py --profiles 500 --docs 20 > workload.jsonl
+
+Each line is {"kind": "profile", "body": {...}} or
+{"kind": "document", "filename": ..., "text": ...}; bench/loadtest.py reads
+it with --workload, or generates the same thing itself.
+"""
+import argparse
+import json
+import pathlib
+import random
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+
+from clause_scan_bench import synth_corpus  # noqa: E402
+
+STATES = ["Maharashtra", "Punjab", "Uttar Pradesh", "Madhya Pradesh", "Karnataka",
+          "Rajasthan", "Bihar", "Andhra Pradesh", "Tamil Nadu", "Gujarat"]
+INCOME_TYPES = {"seasonal": 0.6, "mixed": 0.3, "fixed": 0.1}
+RISKS = ["drought", "crop_failure", "flood", "pest_attack", "price_crash", "illness", "market_access"]
+NAMES = ["Ramesh", "Sunita", "Anil", "Lakshmi", "Gurpreet", "Meena", "Suresh", "Kavita",
+         "Raju", "Savitri", "Mohan", "Geeta", "Harish", "Pooja", "Baldev", "Asha"]
+
+# Rough net income per acre per month (INR) for the crop choices in the form.
+CROP_INCOME = {"Rice": 2500, "Wheat": 2800, "Soybean": 2200, "Cotton": 3200, "Sugarcane": 4500,
+               "Maize": 2000, "Vegetables": 6000, "Pulses": 1800, "Groundnut": 2600, "Other": 2400}
+
+LOAN_PURPOSES = {
+    "Seeds and fertiliser for the next season": (20000, 80000),
+    "Drip irrigation": (60000, 250000),
+    "Borewell": (80000, 300000),
+    "Tractor": (300000, 800000),
+    "Dairy cattle": (50000, 200000),
+    "Cold storage share": (100000, 400000),
+    "Clearing moneylender debt": (30000, 150000),
+}
+
+
+def profile(rng: random.Random) -> dict:
+    crop = rng.choice(list(CROP_INCOME))
+    income_type = rng.choices(list(INCOME_TYPES), weights=list(INCOME_TYPES.values()))[0]
+    land = round(min(rng.lognormvariate(0.7, 0.8), 40), 1)
+    monthly = CROP_INCOME[crop] * land * rng.uniform(0.6, 1.4)
+    if income_type != "seasonal":
+        monthly += rng.choice([3000, 6000, 9000])  # wages, dairy or a salary on top
+    purpose = rng.choice(list(LOAN_PURPOSES))
+    low, high = LOAN_PURPOSES[purpose]
+    body = {
+        "name": rng.choice(NAMES),
+        "state": rng.choice(STATES),
+        "land_acres": land,
+        "crop_type": crop,
+        "income_type": income_type,
+        "monthly_income_inr": round(monthly, -2),
+        "household_size": rng.randint(2, 9),
+        "existing_debt_inr": round(rng.choice([0, 0, 1, 2, 4]) * monthly * rng.uniform(1, 4), -3),
+        "risk_exposure": rng.sample(RISKS, rng.randint(1, 3)),
+    }
+    if rng.random() < 0.85:
+        body["loan_purpose"] = purpose
+        body["loan_amount_inr"] = round(rng.uniform(low, high), -3)
+    return body
+
+
+def profiles(n: int, seed: int = 11, repeat_rate: float = 0.0) -> list[dict]:
+    """`repeat_rate` of the profiles repeat an earlier one, as when a farmer resubmits."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        out.append(rng.choice(out) if out and rng.random() < repeat_rate else profile(rng))
+    return out
+
+
+def documents(n: int, seed: int = 11) -> list[dict]:
+    return [{"filename": f"agreement-{i}.txt", "text": text}
+            for i, (text, _) in enumerate(synth_corpus(n, seed=seed))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profiles", type=int, default=200)
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--repeat-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=11)
+    args = ap.parse_args()
+    for body in profiles(args.profiles, args.seed, args.repeat_rate):
+        print(json.dumps({"kind": "profile", "body": body}))
+    for doc in documents(args.docs, args.seed):
+        print(json.dumps({"kind": "document", **doc}))
+
+
+if __name__ == "__main__":
+    main()
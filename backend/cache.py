@@ -0,0 +1,255 @@
+"""
+Response cache for analysis endpoints.
+
+Keys are a SHA-256 over the endpoint name, the normalized request, the prompt
+version and the Groq model, so retries and tab-switch re-posts of the same
+FarmerProfile are served without new Groq calls. Entries expire after a TTL
+and the least recently used ones are evicted once the cache is full.
+
+Backends: "memory" (per process, default), "sqlite" (a file, survives
+restarts and is shared by all workers on the host) or "redis" (shared by
+every host at REDIS_URL; needs `pip install redis`). Pick with
+RESPONSE_CACHE_BACKEND. Expired entries linger for RESPONSE_CACHE_STALE_S
+so get_stale() can serve them while Groq is down. Backend calls are
+coroutines: SQLite runs in a worker thread and Redis uses redis.asyncio, so
+neither blocks the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from llm import PROMPT_VERSION, ROUTING
+from metrics import collector, gauge_lines
+from resilience import REDIS_URL
+
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+RESPONSE_CACHE_TTL_S = float(os.environ.get("RESPONSE_CACHE_TTL_S", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+# Expired entries are kept this much longer and served while Groq is down.
+RESPONSE_CACHE_STALE_S = float(os.environ.get("RESPONSE_CACHE_STALE_S", "604800"))
+
+
+def normalize(value):
+    """Canonical form so near-identical submissions hash the same."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Order does not matter but duplicates do (e.g. counting risk_exposure entries).
+        return sorted(json.dumps(normalize(v), sort_keys=True) for v in value)
+    return value
+
+
+def make_key(namespace: str, payload) -> str:
+    body = json.dumps(
+        {"ns": namespace, "v": PROMPT_VERSION, "model": ROUTING, "data": normalize(payload)},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, max_entries: int, stale_s: float = 0.0):
+        self.max_entries = max_entries
+        self.stale_s = stale_s
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str, stale_ok: bool = False) -> str | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            now = time.time()
+            if expires < now:
+                if expires + self.stale_s < now:
+                    del self._data[key]
+                    return None
+                if not stale_ok:
+                    return None
+            self._data.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    async def size(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int, stale_s: float = 0.0):
+        self.max_entries = max_entries
+        self.stale_s = stale_s
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+
+    def _get_sync(self, key: str, stale_ok: bool) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                if row[1] + self.stale_s < now:
+                    self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    return None
+                if not stale_ok:
+                    return None
+            self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def _set_sync(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._db.execute("DELETE FROM cache WHERE expires < ?", (now - self.stale_s,))
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _size_sync(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    async def get(self, key: str, stale_ok: bool = False) -> str | None:
+        return await asyncio.to_thread(self._get_sync, key, stale_ok)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.to_thread(self._set_sync, key, value, ttl)
+
+    async def size(self) -> int:
+        return await asyncio.to_thread(self._size_sync)
+
+
+class RedisBackend:
+    """
+    Entries are "<expires>:<json>" strings that Redis drops once the stale
+    window is over too. RESPONSE_CACHE_MAX_ENTRIES is not enforced here;
+    give Redis a maxmemory with an LRU policy instead. The entry count is
+    not reported either: counting the keys means a SCAN over the keyspace.
+    """
+    name = "redis"
+    prefix = "sahyog:cache:"
+
+    def __init__(self, url: str, max_entries: int, stale_s: float = 0.0):
+        import redis.asyncio  # optional dependency, only needed for this backend
+        self.max_entries = max_entries
+        self.stale_s = stale_s
+        self._redis = redis.asyncio.Redis.from_url(url)
+
+    async def get(self, key: str, stale_ok: bool = False) -> str | None:
+        raw = await self._redis.get(self.prefix + key)
+        if raw is None:
+            return None
+        expires, _, value = raw.decode().partition(":")
+        if float(expires) < time.time() and not stale_ok:
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._redis.set(self.prefix + key, f"{time.time() + ttl}:{value}",
+                              ex=max(1, round(ttl + self.stale_s)))
+
+    async def size(self) -> None:
+        return None
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self.stale_hits: dict[str, int] = {}
+
+    async def get(self, namespace: str, key: str) -> dict | None:
+        raw = await self.backend.get(key)
+        if raw is None:
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            return None
+        self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        return json.loads(raw)
+
+    async def get_stale(self, namespace: str, key: str) -> dict | None:
+        """Like get(), but also returns an expired entry still within the stale window."""
+        raw = await self.backend.get(key, stale_ok=True)
+        if raw is None:
+            return None
+        self.stale_hits[namespace] = self.stale_hits.get(namespace, 0) + 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: dict) -> None:
+        await self.backend.set(key, json.dumps(value), self.ttl)
+
+    async def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        return {
+            "backend": self.backend.name,
+            "entries": await self.backend.size(),
+            "max_entries": self.backend.max_entries,
+            "ttl_s": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "stale_served": sum(self.stale_hits.values()),
+            "by_endpoint": {
+                ns: {"hits": self.hits.get(ns, 0), "misses": self.misses.get(ns, 0)}
+                for ns in sorted(set(self.hits) | set(self.misses))
+            },
+        }
+
+
+def create_cache() -> ResponseCache:
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        backend = SQLiteBackend(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_STALE_S)
+    elif RESPONSE_CACHE_BACKEND == "redis":
+        backend = RedisBackend(REDIS_URL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_STALE_S)
+    else:
+        backend = MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_STALE_S)
+    return ResponseCache(backend, RESPONSE_CACHE_TTL_S)
+
+
+response_cache = create_cache()
+
+
+@collector
+def cache_metrics() -> list[str]:
+    c = response_cache
+    return (gauge_lines("sahyog_cache_hits_total", "Response cache hits by endpoint.", c.hits, "endpoint", "counter")
+            + gauge_lines("sahyog_cache_misses_total", "Response cache misses by endpoint.", c.misses,
+                          "endpoint", "counter")
+            + gauge_lines("sahyog_cache_stale_served_total", "Expired entries served while Groq was down.",
+                          c.stale_hits, "endpoint", "counter"))
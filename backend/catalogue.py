@@ -0,0 +1,151 @@
+"""
+The scheme catalogue, loaded from a versioned data file (SCHEMES_PATH).
+
+Everything derived from the file is built once per version: the rule index
+(by id, category and state), each scheme's prompt fragment, and the
+/schemes body as compact JSON, gzip and brotli with its ETag. Clients and CDNs
+revalidate with If-None-Match and get a 304 until the version changes.
+
+A request takes `current()` once and uses that snapshot throughout. The
+file is checked every CATALOGUE_RELOAD_S; a changed file is loaded and
+indexed in full before it replaces the old snapshot, and a file that does
+not load leaves the old one in service.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from compression import brotli, choose, compress
+from eligibility import SchemeIndex
+from metrics import collector, gauge_lines
+
+SCHEMES_PATH = os.environ.get("SCHEMES_PATH", os.path.join(os.path.dirname(__file__), "data", "schemes.json"))
+CATALOGUE_RELOAD_S = float(os.environ.get("CATALOGUE_RELOAD_S", "30"))
+CATALOGUE_MAX_AGE_S = int(os.environ.get("CATALOGUE_MAX_AGE_S", "3600"))
+
+
+class Body:
+    """A JSON body, its ETag, and its compressed forms as they are asked for."""
+
+    def __init__(self, value, tag: str, best: bool = False):
+        self.data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+        self.etag = f'"{tag}-{hashlib.sha256(self.data).hexdigest()[:16]}"'
+        self.best = best
+        self.compressed: dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        if encoding not in self.compressed:
+            self.compressed[encoding] = compress(self.data, encoding, self.best)
+        return self.compressed[encoding]
+
+
+def fragment(s: dict) -> str:
+    """The fixed part of a scheme's entry in the scheme prompt."""
+    return (f"{s['id']} - {s['name']} ({s['category']})\n"
+            f"Benefit: {s['benefit_inr']}\n"
+            f"Eligibility: {s['eligibility_criteria']}\n"
+            f"Coverage: {s['coverage_details']}\n"
+            f"Premium/Cost: {s.get('premium_details', 'N/A')}")
+
+
+class Catalogue:
+    def __init__(self, doc: dict, mtime: float = 0.0):
+        self.version = str(doc["version"])
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        # Rules are for the engine only; clients get the scheme fields.
+        self.schemes = [{k: v for k, v in s.items() if k != "rules"} for s in doc["schemes"]]
+        ids = [s["id"] for s in self.schemes]
+        if len(set(ids)) != len(ids):
+            raise ValueError(f"duplicate scheme ids in catalogue {self.version}")
+        self.index = SchemeIndex(self.schemes, {s["id"]: s.get("rules", {}) for s in doc["schemes"]})
+        self.by_id = self.index.schemes
+        self.fragments = {s["id"]: fragment(s) for s in self.schemes}
+        self.body = Body(self.schemes, self.version, best=True)
+        for encoding in ("gzip", "br") if brotli else ("gzip",):
+            self.body.encoded(encoding)
+        self.localized: dict[str, Body] = {}  # lang -> body, once every string is translated
+
+    def select(self, category: str | None = None, state: str | None = None) -> list[dict]:
+        """Schemes in one category and/or offered in one state, in catalogue order."""
+        ids = set(self.by_id)
+        if category:
+            ids &= self.index.in_category(category)
+        if state:
+            ids &= self.index.in_state(state)
+        return [s for s in self.schemes if s["id"] in ids]
+
+
+def load(path: str = SCHEMES_PATH) -> Catalogue:
+    mtime = os.stat(path).st_mtime
+    with open(path, encoding="utf-8") as f:
+        return Catalogue(json.load(f), mtime)
+
+
+_current = load()
+_tried_mtime = _current.mtime  # a file that failed to load is not retried until it changes again
+reloads = {"ok": 0, "failed": 0}
+
+
+def current() -> Catalogue:
+    return _current
+
+
+async def reload(path: str = SCHEMES_PATH) -> bool:
+    """Swap in the file's catalogue if it changed; False if unchanged or unreadable."""
+    global _current, _tried_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+        if mtime == _tried_mtime:
+            return False
+        _tried_mtime = mtime
+        fresh = await asyncio.to_thread(load, path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        reloads["failed"] += 1
+        print(f"[CATALOGUE] Reload of {path} failed, keeping {_current.version}: {e!r}")
+        return False
+    _current = fresh
+    reloads["ok"] += 1
+    print(f"[CATALOGUE] Loaded {fresh.version} ({len(fresh.schemes)} schemes)")
+    return True
+
+
+async def reload_loop(interval: float = CATALOGUE_RELOAD_S) -> None:
+    while interval > 0:
+        await asyncio.sleep(interval)
+        await reload()
+
+
+def respond(request: Request, body: Body, max_age: int = CATALOGUE_MAX_AGE_S) -> Response:
+    """`body` with caching headers: 304 if the client has it, compressed if it accepts that."""
+    headers = {"ETag": body.etag, "Cache-Control": f"public, max-age={max_age}" if max_age else "no-cache",
+               "Vary": "Accept-Encoding"}
+    seen = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if body.etag in seen or "*" in seen:
+        return Response(status_code=304, headers=headers)
+    encoding = choose(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(body.encoded(encoding), media_type="application/json", headers=headers)
+    return Response(body.data, media_type="application/json", headers=headers)
+
+
+def stats() -> dict:
+    cat = _current
+    return {"version": cat.version, "schemes": len(cat.schemes), "path": SCHEMES_PATH,
+            "loaded_at": cat.loaded_at, "bytes": len(cat.body.data),
+            "encoded_bytes": {k: len(v) for k, v in cat.body.compressed.items()},
+            "etag": cat.body.etag, "localized": sorted(cat.localized), "reloads": reloads}
+
+
+@collector
+def catalogue_metrics() -> list[str]:
+    return (gauge_lines("sahyog_catalogue_schemes", "Schemes in the loaded catalogue, by version.",
+                        {_current.version: len(_current.schemes)}, "version")
+            + gauge_lines("sahyog_catalogue_reloads_total", "Catalogue reloads by outcome.",
+                          reloads, "outcome", "counter"))
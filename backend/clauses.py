@@ -0,0 +1,271 @@
+"""
+Local clause-risk scanner for loan documents.
+
+All risky-clause patterns are compiled into one alternation with a named
+group per clause type, and a second combined pattern pulls out the numbers
+that go into key_terms (interest rate, fees, tenure, EMI, penalties,
+collateral). Running a large alternation over every character is slow in
+Python's re, so the text is lowercased once and searched for a small set
+of literal anchor words (every pattern contains at least one); the
+combined patterns then only run in short windows around those anchors.
+Scanning a few hundred KB of text takes milliseconds, so it runs over the
+whole document, and its excerpts are what the LLM prompt gets beyond the
+opening section.
+"""
+import re
+
+_MONEY = r"(?:rs\.?|₹|inr)\s?[\d,]+(?:\.\d+)?(?:\s?(?:lakh|lakhs|crore))?"
+_PCT = r"\d{1,2}(?:\.\d{1,2})?\s?%"
+
+# name: (title, severity, plain explanation, pattern)
+CLAUSE_PATTERNS = {
+    "prepayment_penalty": (
+        "Prepayment penalty", "medium",
+        "You will be charged extra if you repay the loan early.",
+        r"pre-?payment\s+(?:penalty|charges?|fees?)|fore-?closure\s+(?:charges?|penalty|fees?)|pre-?closure\s+(?:charges?|penalty)",
+    ),
+    "balloon_payment": (
+        "Balloon payment", "high",
+        "A large lump sum is due at the end, which can be hard to pay at once.",
+        r"balloon\s+(?:payment|instal?ment)|bullet\s+(?:payment|repayment)|lump[- ]sum\s+(?:payment|repayment)\s+(?:at|on|upon)\s+(?:the\s+)?(?:end|maturity|expiry)",
+    ),
+    "floating_rate": (
+        "Floating interest rate", "high",
+        "The lender can change your interest rate, so your payments may go up.",
+        r"floating\s+(?:rate|interest)|variable\s+(?:rate|interest)|linked\s+to\s+(?:the\s+)?(?:mclr|repo\s+rate|base\s+rate|eblr|benchmark)"
+        r"|interest\s+rate[^.\n]{0,60}(?:revised|reset|changed|varied)[^.\n]{0,40}(?:discretion|time\s+to\s+time)",
+    ),
+    "cross_collateral": (
+        "Cross-collateralisation", "critical",
+        "Your other land, property or loans can be seized if you miss payments on this loan.",
+        r"cross[- ]collaterali[sz]\w*|cross[- ]default|general\s+lien"
+        r"|(?:all|any)\s+other\s+(?:assets|propert(?:y|ies)|loans?)[^.\n]{0,40}(?:charged|secured|liable|lien)",
+    ),
+    "waiver_of_rights": (
+        "Waiver of legal rights", "critical",
+        "You are giving up rights you would normally have to challenge the lender.",
+        r"waive[sd]?\s+(?:all\s+|any\s+|his\s+|her\s+|their\s+)?(?:rights?|claims?|defen[cs]es?|notice)"
+        r"|shall\s+not\s+be\s+entitled\s+to\s+(?:challenge|dispute|contest)|irrevocabl[ey]\s+(?:waive|agree)",
+    ),
+    "compound_interest": (
+        "Compound interest", "high",
+        "Interest is charged on interest, so the debt grows faster than it looks.",
+        r"compound(?:ed|ing)?\s+(?:monthly|quarterly|daily|interest)|interest\s+on\s+(?:the\s+)?(?:unpaid\s+|overdue\s+)?interest|capitali[sz]ed\s+interest",
+    ),
+    "land_collateral": (
+        "Land as collateral", "high",
+        "Your land is pledged; you could lose it if you cannot repay.",
+        r"mortgage\s+of\s+(?:the\s+)?(?:agricultural\s+)?land|(?:land|property|title\s+deeds?)[^.\n]{0,40}(?:pledged|mortgaged|hypothecated|deposited)",
+    ),
+    "auto_renewal": (
+        "Automatic renewal", "medium",
+        "The loan renews by itself unless you cancel, which can keep you in debt.",
+        r"auto(?:matic(?:ally)?)?[- ]?renew\w*|deemed\s+(?:to\s+(?:be|have\s+been)\s+)?renewed",
+    ),
+    "personal_guarantee": (
+        "Personal guarantee", "medium",
+        "Someone else (often family) becomes responsible for your loan.",
+        r"personal\s+guarantee|guarantor\s+shall|jointly\s+and\s+severally",
+    ),
+    "penal_interest": (
+        "Penalty interest", "medium",
+        "Missing a payment adds extra interest or charges on top.",
+        r"penal\s+(?:interest|charges?)|late\s+(?:payment\s+)?(?:fees?|charges?|penalty)|default\s+interest",
+    ),
+    "lender_insurance": (
+        "Insurance that benefits the lender", "medium",
+        "You pay for insurance, but the money goes to the lender.",
+        r"insur(?:ance|ed)[^.\n]{0,60}(?:lender|bank)\s+as\s+(?:the\s+)?(?:sole\s+)?(?:beneficiary|loss\s+payee)|assign(?:ment)?\s+of\s+(?:the\s+)?insurance",
+    ),
+    "no_grace_period": (
+        "No grace period", "high",
+        "Even one day late can count as a default.",
+        r"no\s+grace\s+period|without\s+any\s+(?:notice|grace)|immediately\s+due\s+and\s+payable",
+    ),
+    "unilateral_terms": (
+        "Lender can change terms alone", "high",
+        "The lender can change the agreement without asking you.",
+        r"sole\s+(?:and\s+absolute\s+)?discretion|without\s+(?:any\s+)?(?:prior\s+)?notice\s+to\s+the\s+borrower",
+    ),
+}
+
+# Patterns are written in lower case and matched against lowercased text.
+CLAUSE_RE = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, (_, _, _, pattern) in CLAUSE_PATTERNS.items())
+)
+
+# Key-term extraction: group name == key_terms field; group "v_<field>" is the value.
+TERM_PATTERNS = {
+    "interest_rate": rf"(?:rate\s+of\s+interest|interest\s+(?:rate|@|at|of))[^.\n%]{{0,40}}?(?P<v_interest_rate>{_PCT}(?:\s*(?:p\.?\s?a\.?|per\s+(?:annum|month|year)|annually|monthly))?)",
+    "processing_fee": rf"processing\s+(?:fees?|charges?)[^.\n]{{0,40}}?(?P<v_processing_fee>{_MONEY}|{_PCT})",
+    "tenure": r"(?:tenure|tenor|term|period)\s+of\s+(?:the\s+)?(?:loan\s+)?(?:shall\s+be\s+|is\s+)?(?P<v_tenure>\d{1,3}\s*(?:months?|years?))",
+    "emi_amount": rf"(?:emi|equated\s+monthly\s+instal?ment|monthly\s+instal?ment)s?[^.\n]{{0,40}}?(?P<v_emi_amount>{_MONEY})",
+    "prepayment_penalty": rf"(?:pre-?payment|fore-?closure|pre-?closure)[^.\n]{{0,60}}?(?P<v_prepayment_penalty>{_PCT}|{_MONEY})",
+    "late_payment_penalty": rf"(?:penal|late\s+payment|default)\s+(?:interest|charges?|fees?)[^.\n]{{0,60}}?(?P<v_late_payment_penalty>{_PCT}(?:\s*(?:p\.?\s?a\.?|per\s+(?:annum|month)))?|{_MONEY})",
+    "collateral": r"(?:secured\s+by|collateral(?:\s+security)?\s*(?:of|:)|mortgage\s+of|hypothecation\s+of|pledge\s+of)\s+(?P<v_collateral>[^.;\n]{5,80})",
+}
+
+TERM_RE = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in TERM_PATTERNS.items())
+)
+
+# Literal words at least one of which appears in any match of the patterns above.
+ANCHORS = (
+    "payment", "closure", "balloon", "bullet", "lump", "floating", "variable", "linked",
+    "revised", "reset", "changed", "varied", "cross", "lien", "other", "waive", "entitled",
+    "irrevocabl", "compound", "interest", "capitali", "mortgage", "pledge", "hypothecat",
+    "deposited", "renew", "guarantee", "guarantor", "severally", "penal", "late", "default",
+    "insur", "grace", "without", "payable", "discretion", "processing", "tenure", "tenor",
+    "term", "period", "emi", "instal", "secured", "collateral",
+)
+WINDOW_BEFORE = 100  # longest pattern prefix before its anchor
+WINDOW_AFTER = 260   # longest pattern suffix after its anchor
+
+
+def _excerpt(text: str, start: int, end: int, radius: int = 240) -> tuple[int, int]:
+    """Expand a match to its line, or failing that its sentence, within `radius` chars."""
+    lo = max(0, start - radius)
+    hi = min(len(text), end + radius)
+    left = text.rfind("\n", lo, start)
+    if left == -1:
+        left = text.rfind(". ", lo, start)
+        left = left + 1 if left != -1 else lo
+    right = text.find("\n", end, hi)
+    if right == -1:
+        right = text.find(". ", end, hi)
+        right = right + 1 if right != -1 else hi
+    return left, right
+
+
+def _lower(text: str) -> str:
+    low = text.lower()
+    if len(low) != len(text):
+        # A few Unicode characters lowercase to two; keep offsets aligned.
+        low = "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+    return low
+
+
+def _windows(low: str) -> list[tuple[int, int]]:
+    spans = []
+    for anchor in ANCHORS:
+        i = low.find(anchor)
+        while i != -1:
+            spans.append((max(0, i - WINDOW_BEFORE), i + len(anchor) + WINDOW_AFTER))
+            i = low.find(anchor, i + len(anchor))
+    spans.sort()
+    merged = []
+    for lo, hi in spans:
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def scan(text: str) -> dict:
+    low = _lower(text)
+    windows = _windows(low)
+
+    hits = {}
+    for lo, hi in windows:
+        for m in CLAUSE_RE.finditer(low, lo, hi):
+            name = m.lastgroup
+            hit = hits.get(name)
+            if hit is None:
+                title, severity, explanation, _ = CLAUSE_PATTERNS[name]
+                ex_lo, ex_hi = _excerpt(text, m.start(), m.end())
+                hits[name] = {
+                    "type": name,
+                    "title": title,
+                    "severity": severity,
+                    "plain_explanation": explanation,
+                    "clause_text": " ".join(text[ex_lo:ex_hi].split()),
+                    "offset": m.start(),
+                    "span": (ex_lo, ex_hi),
+                    "count": 1,
+                }
+            else:
+                hit["count"] += 1
+
+    key_terms = {}
+    for lo, hi in windows:
+        for m in TERM_RE.finditer(low, lo, hi):
+            field = m.lastgroup
+            if field in key_terms:
+                continue
+            # lastgroup is the outermost group that matched: the field name.
+            start, end = m.span(f"v_{field}")
+            if start != -1:
+                key_terms[field] = " ".join(text[start:end].split()).strip(" ,:")
+
+    return {"hits": list(hits.values()), "key_terms": key_terms}
+
+
+def relevant_excerpts(text: str, hits: list, budget: int, skip_before: int = 0) -> str:
+    """Join the hit excerpts (outside the already-included opening) up to `budget` chars."""
+    spans = sorted(h["span"] for h in hits if h["span"][0] >= skip_before)
+    merged = []
+    for lo, hi in spans:
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    out, used = [], 0
+    for lo, hi in merged:
+        piece = " ".join(text[lo:hi].split())
+        if used + len(piece) > budget:
+            break
+        out.append(f"[...] {piece}")
+        used += len(piece) + 6
+    return "\n".join(out)
+
+
+# Each clause type on its own, to see whether an LLM red flag names it.
+CLAUSE_TYPE_RE = {name: re.compile(pattern) for name, (_, _, _, pattern) in CLAUSE_PATTERNS.items()}
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def _mentions(flag: dict, hit: dict) -> bool:
+    """
+    Whether an LLM red flag already covers a scanner hit: it uses the
+    clause's title or wording (the hit's own pattern matches it), or it
+    quotes the same clause (most words of the shorter quote are shared).
+    """
+    text = " ".join(str(flag.get(k) or "") for k in ("title", "clause_text", "plain_explanation")).lower()
+    if hit["title"].lower() in text or CLAUSE_TYPE_RE[hit["type"]].search(text):
+        return True
+    quoted, found = _words(flag.get("clause_text") or ""), _words(hit["clause_text"])
+    shorter = min(len(quoted), len(found))
+    return shorter >= 4 and len(quoted & found) >= 0.6 * shorter
+
+
+def apply_scan(analysis: dict, scanned: dict) -> dict:
+    """
+    Fold scanner results into an LLM analysis: scanned key terms win (they
+    are quoted from the text), and any detected clause the LLM did not
+    mention is added to red_flags.
+    """
+    terms = dict(analysis.get("key_terms") or {})
+    terms.update(scanned["key_terms"])
+    analysis["key_terms"] = terms
+
+    flags = list(analysis.get("red_flags") or [])
+    llm_flags = [f for f in flags if isinstance(f, dict)]
+    for hit in scanned["hits"]:
+        if not any(_mentions(f, hit) for f in llm_flags):
+            flags.append({
+                "title": hit["title"],
+                "severity": hit["severity"],
+                "clause_text": hit["clause_text"],
+                "plain_explanation": hit["plain_explanation"],
+                "potential_impact": None,
+                "recommendation": "Ask the lender to explain or remove this clause before you sign.",
+            })
+    analysis["red_flags"] = flags
+    analysis["detected_clauses"] = [
+        {k: v for k, v in hit.items() if k != "span"} for hit in scanned["hits"]
+    ]
+    return analysis
@@ -0,0 +1,98 @@
+"""
+Response compression, for mobile clients on slow connections.
+
+CompressionMiddleware compresses JSON and text responses of at least
+COMPRESS_MIN_BYTES with brotli when the client accepts it and the package
+is installed (`pip install brotli`), and with gzip otherwise. Streams
+(SSE, NDJSON) pass through untouched, so each event still goes out as soon
+as it is ready, and so do responses that are already encoded, like the
+prebuilt /schemes bodies.
+"""
+import gzip
+import os
+
+try:
+    import brotli  # optional dependency
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "500"))
+COMPRESSIBLE = ("application/json", "text/plain", "text/csv")
+
+
+def choose(accept_encoding: str) -> str | None:
+    """The best encoding the client accepts: "br", "gzip" or None."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """`best` is for bodies built once and served many times; per-response bodies use a faster level."""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, 9 if best else 6, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_bytes: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = choose(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def wrapped(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                response_headers = dict(message.get("headers", []))
+                kind = response_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (b"content-encoding" in response_headers
+                               or not kind.startswith(COMPRESSIBLE))
+                if passthrough:
+                    return await send(message)
+                start = message  # held until we know whether the body is worth compressing
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+            body = message.get("body", b"")
+            if start is not None and message.get("more_body", False):
+                # Streamed in pieces: send as is rather than hold it back.
+                passthrough = True
+                await send(start)
+                return await send(message)
+            if start is not None:
+                headers_out = [(k, v) for k, v in start.get("headers", []) if k != b"content-length"]
+                vary = [v for k, v in headers_out if k == b"vary"]
+                if len(body) >= self.min_bytes:
+                    body = compress(body, encoding)
+                    headers_out.append((b"content-encoding", encoding.encode()))
+                if not any(b"accept-encoding" in v.lower() for v in vary):
+                    headers_out.append((b"vary", b"Accept-Encoding"))
+                headers_out.append((b"content-length", str(len(body)).encode()))
+                await send({**start, "headers": headers_out})
+                start = None
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, wrapped)
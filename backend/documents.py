@@ -0,0 +1,248 @@
+"""
+Upload spooling and text extraction for /analyse-document.
+
+Uploads are copied to a temp file in chunks (hashing as they go) instead of
+being read into memory, and rejected once they pass DOC_MAX_UPLOAD_MB.
+Extraction runs in a process pool so pdfplumber never blocks the event
+loop, reads pages one at a time, and stops as soon as it has collected
+enough text for the analysis.
+
+Long documents can instead be read in full and split into overlapping,
+clause-aligned chunks that are analysed concurrently and merged back into
+the single-document response shape (see chunk_text / merge_analyses).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, UploadFile
+
+DOC_MAX_UPLOAD_MB = float(os.environ.get("DOC_MAX_UPLOAD_MB", "20"))
+DOC_MAX_PAGES = int(os.environ.get("DOC_MAX_PAGES", "300"))
+DOC_MAX_CHARS = int(os.environ.get("DOC_MAX_CHARS", "6000"))
+# Quick mode still extracts this much for the local clause scanner; only
+# DOC_MAX_CHARS of it (opening + flagged excerpts) goes to the LLM.
+DOC_SCAN_MAX_CHARS = int(os.environ.get("DOC_SCAN_MAX_CHARS", "60000"))
+DOC_EXTRACT_WORKERS = int(os.environ.get("DOC_EXTRACT_WORKERS", "2"))
+DOC_FULL_MAX_CHARS = int(os.environ.get("DOC_FULL_MAX_CHARS", "200000"))
+DOC_CHUNK_CHARS = int(os.environ.get("DOC_CHUNK_CHARS", "6000"))
+DOC_CHUNK_OVERLAP = int(os.environ.get("DOC_CHUNK_OVERLAP", "400"))
+DOC_CHUNK_CONCURRENCY = int(os.environ.get("DOC_CHUNK_CONCURRENCY", "4"))
+
+CHUNK_BYTES = 64 * 1024
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=DOC_EXTRACT_WORKERS)
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def spool_upload(file: UploadFile) -> tuple[str, int, str]:
+    """Copy the upload to a temp file. Returns (path, size in bytes, sha256)."""
+    limit = int(DOC_MAX_UPLOAD_MB * 1024 * 1024)
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="sahyog-doc-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(CHUNK_BYTES):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File is too large. The limit is {DOC_MAX_UPLOAD_MB:g} MB."
+                    )
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def _read_raw(path: str, max_chars: int) -> str:
+    with open(path, "rb") as f:
+        return f.read(max_chars * 4).decode("utf-8", errors="ignore")[:max_chars]
+
+
+def extract_text(path: str, ext: str, max_chars: int = DOC_MAX_CHARS, max_pages: int = DOC_MAX_PAGES) -> dict:
+    """
+    Runs in a worker process. Returns the text plus how much of the
+    document was read: {"text", "pages_read", "total_pages", "complete"}.
+    """
+    if ext == "pdf":
+        try:
+            import pdfplumber
+        except ImportError:
+            return {"text": _read_raw(path, max_chars), "pages_read": None, "total_pages": None, "complete": False}
+        with pdfplumber.open(path) as pdf:
+            total = len(pdf.pages)
+            if total > max_pages:
+                return {"error": f"Document has {total} pages. The limit is {max_pages}."}
+            parts, collected = [], 0
+            for page in pdf.pages:
+                text = page.extract_text() or ""
+                page.flush_cache()
+                parts.append(text)
+                collected += len(text) + 1
+                if collected >= max_chars:
+                    break
+            return {"text": "\n".join(parts), "pages_read": len(parts),
+                    "total_pages": total, "complete": len(parts) >= total}
+
+    if ext in ("doc", "docx"):
+        try:
+            import docx
+            doc = docx.Document(path)
+        except Exception:
+            return {"text": _read_raw(path, max_chars), "pages_read": None, "total_pages": None, "complete": False}
+        parts, collected, complete = [], 0, True
+        for para in doc.paragraphs:
+            parts.append(para.text)
+            collected += len(para.text) + 1
+            if collected >= max_chars:
+                complete = False
+                break
+        return {"text": "\n".join(parts), "pages_read": None, "total_pages": None, "complete": complete}
+
+    # txt, md and anything else: decode as text
+    text = _read_raw(path, max_chars + 1)
+    return {"text": text[:max_chars], "pages_read": None, "total_pages": None, "complete": len(text) <= max_chars}
+
+
+async def extract_in_pool(path: str, ext: str, max_chars: int = DOC_MAX_CHARS) -> dict:
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(get_pool(), extract_text, path, ext, max_chars)
+    if "error" in result:
+        raise HTTPException(status_code=413, detail=result["error"])
+    return result
+
+
+# A new block starts at a blank line or at a clause heading such as
+# "12.", "4.2)", "(c)", "Clause 7", "Section 3" or "ARTICLE IV".
+_BLOCK_START = re.compile(
+    r"\n\s*\n|\n(?=\s*(?:\d+(?:\.\d+)*[.)]\s|\([a-z0-9]{1,3}\)\s|(?:clause|section|article|schedule)\s+[\dIVXL]+))",
+    re.IGNORECASE,
+)
+
+
+def _blocks(text: str, max_len: int) -> list[str]:
+    blocks = []
+    for block in _BLOCK_START.split(text):
+        block = block.strip()
+        while len(block) > max_len:
+            # A single clause longer than a chunk: cut at the last sentence end that fits.
+            cut = block.rfind(". ", 0, max_len)
+            cut = cut + 1 if cut > max_len // 2 else max_len
+            blocks.append(block[:cut].strip())
+            block = block[cut:].strip()
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+def chunk_text(text: str, chunk_chars: int = DOC_CHUNK_CHARS, overlap: int = DOC_CHUNK_OVERLAP) -> list[str]:
+    """Pack whole clauses into chunks of up to chunk_chars, repeating up to
+    `overlap` chars of trailing clauses at the start of the next chunk."""
+    chunks, current, size = [], [], 0
+    for block in _blocks(text, chunk_chars - overlap):
+        if current and size + len(block) + 1 > chunk_chars:
+            chunks.append("\n\n".join(current))
+            carry, carried = [], 0
+            for prev in reversed(current):
+                if carried + len(prev) > overlap:
+                    break
+                carry.insert(0, prev)
+                carried += len(prev) + 2
+            current, size = carry, carried
+        current.append(block)
+        size += len(block) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+
+def _key(text) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).strip()
+
+
+def _dedupe(items: list, limit: int) -> list:
+    seen, out = set(), []
+    for item in items:
+        k = _key(item)
+        if k and k not in seen:
+            seen.add(k)
+            out.append(item)
+    return out[:limit]
+
+
+def merge_analyses(parts: list[dict]) -> dict:
+    """Reduce per-chunk analyses into one response in the single-document schema."""
+    parts = [p for p in parts if isinstance(p, dict)]
+    if not parts:
+        return {}
+    worst = max(parts, key=lambda p: p.get("danger_score") or 0)
+
+    flags = {}
+    for part in parts:
+        for flag in part.get("red_flags") or []:
+            k = _key(flag.get("title"))
+            prev = flags.get(k)
+            if prev is None or SEVERITY_RANK.get(flag.get("severity"), 0) > SEVERITY_RANK.get(prev.get("severity"), 0):
+                flags[k] = flag
+    red_flags = sorted(flags.values(), key=lambda f: -SEVERITY_RANK.get(f.get("severity"), 0))
+
+    green = {}
+    for part in parts:
+        for flag in part.get("green_flags") or []:
+            green.setdefault(_key(flag.get("title")), flag)
+
+    key_terms = {}
+    for part in parts:
+        for term, value in (part.get("key_terms") or {}).items():
+            if value and not key_terms.get(term):
+                key_terms[term] = value
+
+    types = Counter(p.get("document_type") for p in parts if p.get("document_type"))
+    overall = max((p.get("overall_risk") for p in parts), key=lambda r: SEVERITY_RANK.get(r, -1))
+
+    return {
+        "document_type": types.most_common(1)[0][0] if types else None,
+        "overall_risk": overall,
+        "risk_summary": worst.get("risk_summary"),
+        # The riskiest section decides how dangerous the document is.
+        "danger_score": max((p.get("danger_score") or 0) for p in parts),
+        "red_flags": red_flags,
+        "green_flags": list(green.values()),
+        "key_terms": key_terms,
+        "questions_to_ask_lender": _dedupe([q for p in parts for q in p.get("questions_to_ask_lender") or []], 6),
+        "verdict": worst.get("verdict"),
+        "immediate_actions": _dedupe([a for p in parts for a in p.get("immediate_actions") or []], 5),
+    }
+
+
+def coverage_pct(extracted: dict, analysed_chars: int, size_bytes: int) -> float:
+    if extracted["complete"] and analysed_chars >= len(extracted["text"]):
+        return 100.0
+    if extracted["total_pages"]:
+        read = extracted["pages_read"] / extracted["total_pages"]
+        return round(100 * read * min(1.0, analysed_chars / max(len(extracted["text"]), 1)), 1)
+    return round(min(100.0, 100 * analysed_chars / max(size_bytes, 1)), 1)
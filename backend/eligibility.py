@@ -0,0 +1,146 @@
+"""
+Rule-based scheme eligibility and ranking.
+
+Each scheme in the catalogue (data/schemes.json, under "rules") has
+structured criteria (land size, state, income ceiling, group requirements)
+that are checked in Python, plus relevance hints (risks it covers, crops
+it suits) used to score it for a given farmer. Only the top-ranked
+eligible schemes are sent to the LLM, which writes the friendly
+explanation; everything else is filled in here.
+
+The index narrows candidates by state and land size first, so ranking
+stays cheap as the catalogue grows.
+"""
+import bisect
+import math
+import os
+from collections import defaultdict
+
+SCHEME_SHORTLIST_SIZE = int(os.environ.get("SCHEME_SHORTLIST_SIZE", "4"))
+SMALL_FARMER_ACRES = 5.0  # ~2 hectares: small and marginal farmers
+
+DEFAULT_RULE = {
+    "min_land_acres": 0.0,
+    "max_land_acres": None,
+    "states": None,  # None = all states
+    "excluded_states": [],
+    "max_annual_income_inr": None,
+    "requires_group": None,  # reason string when an individual cannot apply alone
+    "risk_tags": [],
+    "relevant_crops": [],
+    "small_farmer_priority": False,
+    "debt_boost": 0.0,
+    "vulnerability_boost": 0.0,
+    "base_score": 5.0,
+}
+
+def _norm(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class SchemeIndex:
+    def __init__(self, schemes: list, rules: dict):
+        self.schemes = {s["id"]: s for s in schemes}
+        self.rules = {sid: {**DEFAULT_RULE, **rules.get(sid, {})} for sid in self.schemes}
+
+        self.any_state: set[str] = set()
+        self.by_state: dict[str, set[str]] = defaultdict(set)
+        self.excluded_in_state: dict[str, set[str]] = defaultdict(set)
+        self.by_category: dict[str, set[str]] = defaultdict(set)
+        for sid, rule in self.rules.items():
+            if rule["states"] is None:
+                self.any_state.add(sid)
+            else:
+                for st in rule["states"]:
+                    self.by_state[_norm(st)].add(sid)
+            for st in rule["excluded_states"]:
+                self.excluded_in_state[_norm(st)].add(sid)
+            self.by_category[_norm(self.schemes[sid]["category"])].add(sid)
+
+        # Sorted land bounds: a prefix/suffix slice gives every scheme whose
+        # minimum is below / maximum is above a given holding.
+        self._min_land = sorted((r["min_land_acres"], sid) for sid, r in self.rules.items())
+        self._min_land_keys = [m for m, _ in self._min_land]
+        self._max_land = sorted(
+            (r["max_land_acres"] if r["max_land_acres"] is not None else math.inf, sid)
+            for sid, r in self.rules.items()
+        )
+        self._max_land_keys = [m for m, _ in self._max_land]
+
+    def in_state(self, state: str) -> set[str]:
+        st = _norm(state)
+        return (self.any_state | self.by_state.get(st, set())) - self.excluded_in_state.get(st, set())
+
+    def in_category(self, category: str) -> set[str]:
+        return self.by_category.get(_norm(category), set())
+
+    def candidates(self, state: str, land_acres: float, category: str | None = None) -> set[str]:
+        ids = self.in_state(state)
+        min_ok = {sid for _, sid in self._min_land[:bisect.bisect_right(self._min_land_keys, land_acres)]}
+        max_ok = {sid for _, sid in self._max_land[bisect.bisect_left(self._max_land_keys, land_acres):]}
+        ids &= min_ok & max_ok
+        if category:
+            ids &= self.in_category(category)
+        return ids
+
+    def unavailable(self, p, sid: str) -> dict:
+        """The verdict for a scheme outside candidates(): the state or the land size rules it out."""
+        st = _norm(p.state)
+        if sid in self.excluded_in_state.get(st, set()) or (
+            self.rules[sid]["states"] is not None and sid not in self.by_state.get(st, set())
+        ):
+            reason = f"This scheme is not available in {p.state}."
+        else:
+            reason = "Your land size does not fit this scheme's rules."
+        return {"scheme_id": sid, "eligible": False, "score": 0.0, "reasons": [reason]}
+
+    def evaluate(self, p, sid: str, vulnerability: str) -> dict:
+        """Check and score one of the candidates() for this farmer."""
+        rule = self.rules[sid]
+        reasons = []
+        eligible = True
+
+        if rule["requires_group"]:
+            eligible = False
+            reasons.append(rule["requires_group"])
+        cap = rule["max_annual_income_inr"]
+        if cap is not None and p.monthly_income_inr * 12 > cap:
+            eligible = False
+            reasons.append("Your yearly income is above the limit for this scheme.")
+
+        if not eligible:
+            return {"scheme_id": sid, "eligible": False, "score": 0.0, "reasons": reasons}
+
+        score = rule["base_score"]
+        risks = " ".join(_norm(r) for r in p.risk_exposure)
+        matched = [tag for tag in rule["risk_tags"] if tag in risks]
+        if matched:
+            score += min(3.0, 1.5 * len(matched))
+            reasons.append(f"It helps with the {', '.join(matched)} risk you face.")
+        crop = _norm(f"{p.crop_type} {p.income_type}")
+        if any(c in crop for c in rule["relevant_crops"]):
+            score += 4.0
+            reasons.append(f"It suits {p.crop_type} farming.")
+        if rule["small_farmer_priority"] and p.land_acres <= SMALL_FARMER_ACRES:
+            score += 1.0
+            reasons.append("Small farmers like you get priority.")
+        if rule["debt_boost"] and p.existing_debt_inr > 0:
+            score += rule["debt_boost"]
+            reasons.append("It gives you cheaper credit than most other loans.")
+        score += rule["vulnerability_boost"] * {"high": 1.0, "medium": 0.5}.get(vulnerability, 0.0)
+
+        return {"scheme_id": sid, "eligible": True, "score": round(min(score, 10.0), 1), "reasons": reasons}
+
+    def rank(self, p, vulnerability: str) -> list[dict]:
+        """
+        Candidates by eligibility and score, then the schemes the index ruled
+        out, which the response still lists with the reason but are not scored.
+        """
+        cands = self.candidates(p.state, p.land_acres)
+        results = [self.evaluate(p, sid, vulnerability) for sid in self.schemes if sid in cands]
+        results.sort(key=lambda r: (not r["eligible"], -r["score"]))
+        return results + [self.unavailable(p, sid) for sid in self.schemes if sid not in cands]
+
+
+def shortlist(ranked: list[dict], size: int = SCHEME_SHORTLIST_SIZE) -> list[dict]:
+    return [r for r in ranked if r["eligible"] and r["score"] >= 5.0][:size]
@@ -0,0 +1,195 @@
+"""
+Deterministic stand-ins for the LLM stages, used while Groq is unavailable.
+
+Each builder returns the same shape as its prompt asks Groq for, filled
+from the local arithmetic (estimate_finances, the rule engine, the
+amortization schedule, the clause scanner) with plain template sentences.
+Responses built from them carry meta.fallback and are not cached.
+"""
+
+SEASON_TIPS = {
+    "sowing": ["Buy seed and fertiliser early, before prices rise.",
+               "Keep this month's loan payment aside before spending on inputs."],
+    "growing": ["Spend only on what the crop needs; avoid new loans this month.",
+                "Set aside a little each week so the payment is ready on time."],
+    "harvest": ["Pay the instalment first when the crop is sold.",
+                "If you can, pay an extra instalment now to finish the loan sooner."],
+    "lean": ["Use the money you saved at harvest for this month's payment.",
+             "Talk to the bank early if you think you may miss a payment."],
+}
+
+
+def financial_profile(p, est: dict) -> dict:
+    monthly = p.monthly_income_inr
+    expenses = est["household_exp"] + est["debt_emi"] + est["farm_inputs"]
+    surplus = est["monthly_surplus_estimate_inr"]
+    debt_share = est["debt_emi"] / max(monthly, 1)
+    debt_load = ("critical" if debt_share > 0.4 else "high" if debt_share > 0.25
+                 else "moderate" if debt_share > 0.1 else "low")
+    stability = {"daily": "moderate", "mixed": "moderate"}.get(p.income_type, "volatile")
+    risks = [f"Your income depends on {p.crop_type}, so a bad season hits hard."]
+    if est["debt_emi"]:
+        risks.append(f"About Rs.{est['debt_emi']:,} a month already goes to debt.")
+    risks += [f"You are exposed to {r}." for r in p.risk_exposure[:3 - len(risks)]]
+
+    weather = 70 if {"drought", "flood"} & {r.lower() for r in p.risk_exposure} else 45
+    return {
+        "income_pattern": p.income_type,
+        "income_stability": stability,
+        "debt_load": debt_load,
+        "monthly_surplus_estimate_inr": surplus,
+        "financial_vulnerability": est["financial_vulnerability"],
+        "confidence": "low",
+        "confidence_reason": "Based on what you shared, these are quick estimates; a fuller review will follow.",
+        "key_financial_risks": risks,
+        "profile_summary": (f"Your income of Rs.{monthly:,.0f} a month comes mainly from {p.crop_type}. "
+                            f"After regular costs you may have about Rs.{surplus:,} left each month."),
+        "expense_breakdown": [
+            {"label": "Household", "value": est["household_exp"], "color": "#4a8fd4"},
+            {"label": "Debt EMI", "value": est["debt_emi"], "color": "#e05a4a"},
+            {"label": "Farm Inputs", "value": est["farm_inputs"], "color": "#c87a30"},
+            {"label": "Savings", "value": surplus, "color": "#3a9a64"},
+        ],
+        "risk_scores": [
+            {"label": "Income Risk", "score": {"stable": 30, "moderate": 50}.get(stability, 70),
+             "description": f"{stability.capitalize()} income"},
+            {"label": "Debt Risk", "score": min(100, round(debt_share * 200)), "description": f"{debt_load} debt load"},
+            {"label": "Weather Risk", "score": weather, "description": "Depends on rain and weather"},
+            {"label": "Market Risk", "score": 50, "description": "Crop prices can change"},
+        ],
+        "income_vs_expense": {"income": monthly, "expenses": expenses, "surplus": surplus},
+    }
+
+
+def decision(p, est: dict, schemes: list, loan: dict) -> dict:
+    top = [s for s in schemes if s.get("suitability") in ("recommended", "suitable")][:3]
+    vulnerable = est["financial_vulnerability"] == "high"
+    if top and vulnerable:
+        rec, headline = "scheme_only", f"You should apply for {top[0]['name']} before taking on any new loan."
+    elif top:
+        rec, headline = "scheme_first", f"The best next step for you is to apply for {top[0]['name']}."
+    else:
+        rec, headline = "neither", "You should build some savings before applying for anything new."
+    steps = [{"step": i + 1, "action": s.get("action_required") or f"Apply for {s['name']}.",
+              "why": s.get("reason", "")} for i, s in enumerate(top)]
+    steps.append({"step": len(steps) + 1, "action": "Keep a small amount aside every month for emergencies.",
+                  "why": "It protects you if a season goes badly."})
+    return {
+        "recommendation": rec,
+        "headline": headline,
+        "reasoning": (f"Your financial health shows {est['financial_vulnerability']} vulnerability. "
+                      f"You may have about Rs.{est['monthly_surplus_estimate_inr']:,} left each month. "
+                      "Government schemes give help without adding debt, so start there."),
+        "priority_actions": steps[:3],
+        "what_to_avoid": "Avoid borrowing from moneylenders at high interest.",
+        "documents_needed": ["Aadhaar card", "Land records", "Bank passbook"],
+        "timeline_weeks": 4,
+        "overall_risk_level": est["financial_vulnerability"],
+    }
+
+
+def loan_assessment(p, sim: dict | None = None) -> dict:
+    if not p.loan_purpose or not p.loan_amount_inr:
+        return {"assessed": False, "label": "not_requested", "message": "No loan request provided."}
+    monthly = max(p.monthly_income_inr, 1)
+    est_emi = round(p.loan_amount_inr * 0.03)
+    current_emi = round(p.existing_debt_inr * 0.03)
+    surplus = round(p.monthly_income_inr - p.household_size * 2500 - current_emi - est_emi)
+    debt_ratio = round((current_emi + est_emi) / monthly * 100)
+    safe_capacity = round(p.monthly_income_inr * 0.3 / 0.03)
+    if debt_ratio <= 30 and surplus > 0:
+        label, display = "suitable", "This loan looks affordable"
+    elif debt_ratio <= 50 and surplus > 0:
+        label, display = "risky", "Possible, but be careful"
+    else:
+        label, display = "not_recommended", "This loan is too heavy"
+    if sim and label == "suitable" and not sim["can_weather_one_bad_season"]:
+        label, display = "risky", "Possible, but be careful"
+    result = {
+        "assessed": True,
+        "label": label,
+        "label_display": display,
+        "overall_reasoning": (f"About {debt_ratio}% of your income would go to loan payments. "
+                              f"You would have about Rs.{surplus:,} left each month."),
+        "key_metrics": {
+            "debt_service_ratio": debt_ratio,
+            "loan_to_income_ratio": round(p.loan_amount_inr / (monthly * 12), 2),
+            "risk_adjusted_capacity": safe_capacity,
+        },
+        "repayment_analysis": {"monthly_emi_estimate": est_emi,
+                               "verdict": f"Your monthly payment would be about Rs.{est_emi:,}."},
+        "debt_burden_analysis": {
+            "current_debt_to_income_ratio": round(current_emi / monthly * 100),
+            "post_loan_debt_to_income_ratio": debt_ratio,
+            "available_income_after_all_emis": surplus,
+        },
+        "recommendations": {
+            "primary_recommendation": f"You can safely borrow up to about Rs.{safe_capacity:,}.",
+            "safer_alternatives": ["Kisan Credit Card", "Self-help group loan"],
+        },
+        "confidence": "low",
+        "confidence_reason": "Based on what you shared, this is a quick estimate from your numbers alone.",
+    }
+    if sim:
+        behind = round(sim["default_probability_one_bad_season"] * 100)
+        reserve = round(sim["reserve_needed_inr"]["p90"])
+        result["income_shock_resilience"] = {
+            "primary_risks": p.risk_exposure[:2],
+            "worst_case_scenario": f"After one bad season, the chance of not catching up on payments is about {behind}%.",
+            "verdict": (f"Keep about Rs.{reserve:,} saved for bad months." if reserve
+                        else "Your income should cover the payments even in a bad season."),
+        }
+    return result
+
+
+def loan_choice(point: dict, max_safe: float | None) -> dict:
+    behind = round(point["default_probability"] * 100)
+    headline = ("This loan fits your income." if point["safe"]
+                else "This loan is more than your income can safely carry.")
+    limit = (f"The most you can safely borrow over {point['tenure_months']} months is about Rs.{max_safe:,}."
+             if max_safe else f"No amount in this range is safe over {point['tenure_months']} months.")
+    return {
+        "headline": headline,
+        "explanation": (f"You would pay Rs.{point['monthly_emi']:,} a month. "
+                        f"In about {behind} of 100 simulated futures, you would not catch up on payments. {limit}"),
+        "tips": ["Save part of every harvest for the lean months.",
+                 "If you will miss a payment, tell the bank before the due date."],
+    }
+
+
+def plan_advice(plan: dict) -> dict:
+    payoff = plan["early_payoff"]
+    return {
+        "opening_advice": (f"Your plan is Rs.{plan['monthly_emi']:,} a month for {plan['total_months']} months. "
+                           "Paying on time every month keeps your record clean."),
+        "season_tips": SEASON_TIPS,
+        "harvest_strategy": "When you sell your crop, pay the instalment first. Any extra you pay now finishes the loan sooner.",
+        "lean_season_strategy": "Save a little from every harvest for the lean months. Cut spending that can wait.",
+        "early_payoff_tip": (f"Paying Rs.{payoff['extra_per_month']} more each month saves about "
+                             f"Rs.{payoff['interest_saved']:,} in interest."),
+        "emergency_advice": "If you will miss a payment, tell the bank before the due date and ask for more time.",
+    }
+
+
+def document_analysis(scanned: dict) -> dict:
+    """Risk summary from the clause scanner alone; apply_scan() adds the flags and terms."""
+    weights = {"low": 5, "medium": 12, "high": 20, "critical": 30}
+    hits = scanned["hits"]
+    score = min(100, sum(weights[h["severity"]] for h in hits))
+    overall = "critical" if score >= 70 else "high" if score >= 40 else "medium" if hits else "low"
+    return {
+        "document_type": None,
+        "overall_risk": overall,
+        "risk_summary": (f"A quick check found {len(hits)} clause{'s' if len(hits) != 1 else ''} that can hurt a farmer. "
+                         "A full review was not possible right now, so read the flagged clauses carefully."
+                         if hits else "A quick check found no common risky clauses. A full review was not possible right now."),
+        "danger_score": score,
+        "red_flags": [],
+        "green_flags": [],
+        "key_terms": {},
+        "questions_to_ask_lender": [f"Can you explain the {h['title'].lower()} clause?" for h in hits[:3]],
+        "verdict": ("Do not sign until these clauses are explained or removed." if hits
+                    else "Have someone you trust read the full agreement before you sign."),
+        "immediate_actions": ["Ask the lender for a copy of the agreement to take home.",
+                              "Show it to a bank officer or a legal aid clinic."],
+    }
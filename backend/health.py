@@ -0,0 +1,97 @@
+"""
+Upstream (Groq) health, tracked without spending completion tokens.
+
+Every real LLM call reports its outcome and latency to `upstream`, so the
+status usually comes for free from traffic. When there has been no traffic
+for a whole HEALTH_PROBE_INTERVAL_S, a background task does a cheap probe
+(listing models, which uses no tokens) instead. /ready reports the cached
+status but does not fail on it, since endpoints fall back while Groq is
+down; /health does no I/O at all.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+HEALTH_PROBE_INTERVAL_S = float(os.environ.get("HEALTH_PROBE_INTERVAL_S", "30"))
+HEALTH_PROBE_TIMEOUT_S = float(os.environ.get("HEALTH_PROBE_TIMEOUT_S", "5"))
+HEALTH_WINDOW = int(os.environ.get("HEALTH_WINDOW", "200"))
+HEALTH_MIN_SUCCESS_RATE = float(os.environ.get("HEALTH_MIN_SUCCESS_RATE", "0.5"))
+# The status is "unknown" once nothing has been heard for this long.
+HEALTH_STALE_S = float(os.environ.get("HEALTH_STALE_S", str(3 * HEALTH_PROBE_INTERVAL_S)))
+
+
+class UpstreamHealth:
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self.results = deque(maxlen=window)  # (monotonic time, ok, latency_s)
+        self.last_ok_at = None
+        self.last_error = None
+        self.last_error_at = None
+        self.last_probe_at = None
+        self.started_at = time.monotonic()
+
+    def record(self, ok: bool, latency_s: float, error: str | None = None) -> None:
+        now = time.monotonic()
+        self.results.append((now, ok, latency_s))
+        if ok:
+            self.last_ok_at = now
+        else:
+            self.last_error, self.last_error_at = error, now
+
+    def last_seen(self) -> float | None:
+        return self.results[-1][0] if self.results else None
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        results = list(self.results)
+        latencies = sorted(r[2] for r in results if r[1])
+        success_rate = sum(r[1] for r in results) / len(results) if results else None
+        seen = self.last_seen()
+
+        if seen is None or now - seen > HEALTH_STALE_S:
+            status = "unknown"
+        elif not results[-1][1] and success_rate < HEALTH_MIN_SUCCESS_RATE:
+            status = "down"
+        elif not results[-1][1] or success_rate < HEALTH_MIN_SUCCESS_RATE:
+            status = "degraded"
+        else:
+            status = "up"
+
+        def ago(t):
+            return None if t is None else round(now - t, 1)
+
+        return {
+            "status": status,
+            "success_rate": None if success_rate is None else round(success_rate, 3),
+            "p95_latency_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000) if latencies else None,
+            "window": len(results),
+            "last_ok_s_ago": ago(self.last_ok_at),
+            "last_error": self.last_error,
+            "last_error_s_ago": ago(self.last_error_at),
+            "last_probe_s_ago": ago(self.last_probe_at),
+            "uptime_s": round(now - self.started_at),
+        }
+
+
+upstream = UpstreamHealth()
+
+
+async def probe(client) -> None:
+    """One token-free round trip to Groq, recorded like any other call."""
+    upstream.last_probe_at = time.monotonic()
+    t0 = time.perf_counter()
+    try:
+        await client.models.list(timeout=HEALTH_PROBE_TIMEOUT_S)
+    except Exception as e:
+        upstream.record(False, time.perf_counter() - t0, f"probe: {e}")
+    else:
+        upstream.record(True, time.perf_counter() - t0)
+
+
+async def refresh_loop(get_client) -> None:
+    """Probe only when real traffic has not refreshed the status recently."""
+    while True:
+        seen = upstream.last_seen()
+        if seen is None or time.monotonic() - seen >= HEALTH_PROBE_INTERVAL_S:
+            await probe(get_client())
+        await asyncio.sleep(HEALTH_PROBE_INTERVAL_S)
@@ -0,0 +1,251 @@
+"""
+Background jobs for the slow endpoints, on a single box with no broker.
+
+With ?background=true, /repayment-plan and /analyse-document answer 202 at
+once with a job id. The work is queued in-process and run by JOB_WORKERS
+asyncio workers. Every state change and the final result are written to
+SQLite (JOB_DB_PATH, from a worker thread so the event loop never waits on
+the disk), so a dropped connection loses nothing: the client polls
+GET /jobs/{id} (optionally long-polling with ?wait=) or subscribes to
+GET /jobs/{id}/events. Jobs still queued or running when the process stops
+are marked failed on the next start, since their inputs lived in memory.
+
+With several workers sharing JOB_DB_PATH, each job is run by the worker
+that accepted it (the job's owner, recorded as "<pid>:<process start time>"
+so a reused pid is not mistaken for it), any worker can answer
+GET /jobs/{id}, and a worker starting up only fails the jobs of owners that
+are no longer running.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+
+from fastapi import HTTPException
+
+from metrics import collector, end_trace, gauge_lines, start_trace
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", "200"))
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "jobs.sqlite3")
+JOB_RETENTION_S = float(os.environ.get("JOB_RETENTION_S", "86400"))
+
+FINISHED = ("done", "failed")
+JOB_POLL_S = 0.5
+
+
+def _start_time(pid: int) -> str | None:
+    """When `pid` started, in clock ticks since boot; None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(")")[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+_owners: dict[int, str] = {}
+
+
+def _owner() -> str:
+    """This process as a job owner. Looked up per pid, so forked workers each get their own."""
+    pid = os.getpid()
+    if pid not in _owners:
+        _owners[pid] = f"{pid}:{_start_time(pid) or uuid.uuid4().hex}"
+    return _owners[pid]
+
+
+def _alive(owner) -> bool:
+    pid_text, _, started = str(owner).partition(":")
+    pid = int(pid_text)
+    if pid == os.getpid():
+        # Our own pid on an older row (or a bare pid from before owners had a
+        # start time) is an earlier process that had it.
+        return str(owner) == _owner()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    current = _start_time(pid)
+    # A bare pid (rows from before owners had a start time) can only be checked for liveness.
+    return current is None or not started or current == started
+
+
+class JobQueue:
+    def __init__(self, path: str = JOB_DB_PATH, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE):
+        self.path = path
+        self.n_workers = workers
+        self.max_queue = max_queue
+        self._db = None
+        self._lock = threading.Lock()
+        self._queue: asyncio.Queue | None = None
+        self._work: dict[str, tuple[Callable[[], Awaitable[dict]], str]] = {}
+        self._events: dict[str, asyncio.Event] = {}
+        self._workers: list[asyncio.Task] = []
+        self.running = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+                " created REAL NOT NULL, started REAL, finished REAL,"
+                " result TEXT, error TEXT, status_code INTEGER)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished)")
+        return self._db
+
+    def _exec_sync(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    async def _exec(self, sql: str, args: tuple = ()) -> list:
+        return await asyncio.to_thread(self._exec_sync, sql, args)
+
+    async def start(self) -> None:
+        now = time.time()
+        rows = await self._exec("SELECT DISTINCT owner FROM jobs WHERE status IN ('queued', 'running')")
+        owners = [row[0] for row in rows]
+        for owner in owners:
+            if owner is None or not _alive(owner):
+                await self._exec("UPDATE jobs SET status = 'failed', finished = ?, error = ?, status_code = 503"
+                                 " WHERE status IN ('queued', 'running') AND owner IS ?",
+                                 (now, json.dumps("Interrupted by a server restart. Please resubmit."), owner))
+        await self._exec("DELETE FROM jobs WHERE finished < ?", (now - JOB_RETENTION_S,))
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.n_workers)]
+
+    @property
+    def ready(self) -> bool:
+        """Started, and every worker still running."""
+        return self._queue is not None and bool(self._workers) and not any(t.done() for t in self._workers)
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, work: Callable[[], Awaitable[dict]]) -> dict:
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="Background jobs are not running.")
+        if self._queue.qsize() >= self.max_queue:
+            raise HTTPException(status_code=503, detail="Too many background jobs queued. Please retry shortly.")
+        job_id = uuid.uuid4().hex
+        await self._exec("INSERT INTO jobs (id, kind, status, created, owner) VALUES (?, ?, 'queued', ?, ?)",
+                         (job_id, kind, time.time(), _owner()))
+        self._work[job_id] = (work, kind)
+        self._events[job_id] = asyncio.Event()
+        self._queue.put_nowait(job_id)
+        return {"job_id": job_id, "status": "queued", "queue_depth": self._queue.qsize(),
+                "poll": f"/jobs/{job_id}", "events": f"/jobs/{job_id}/events"}
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            work, kind = self._work.pop(job_id)
+            await self._exec("UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), job_id))
+            self.running += 1
+            trace = start_trace(f"job:{kind}")
+            try:
+                result = await work()
+                await self._exec("UPDATE jobs SET status = 'done', finished = ?, result = ?, status_code = 200"
+                                 " WHERE id = ?", (time.time(), json.dumps(result), job_id))
+            except asyncio.CancelledError:
+                await self._exec("UPDATE jobs SET status = 'failed', finished = ?, error = ?, status_code = 503"
+                                 " WHERE id = ?",
+                                 (time.time(), json.dumps("Server shutting down. Please resubmit."), job_id))
+                raise
+            except HTTPException as e:
+                await self._exec("UPDATE jobs SET status = 'failed', finished = ?, error = ?, status_code = ?"
+                                 " WHERE id = ?", (time.time(), json.dumps(e.detail), e.status_code, job_id))
+            except Exception as e:
+                await self._exec("UPDATE jobs SET status = 'failed', finished = ?, error = ?, status_code = 500"
+                                 " WHERE id = ?", (time.time(), json.dumps(str(e)), job_id))
+            finally:
+                end_trace(trace)
+                self.running -= 1
+                event = self._events.pop(job_id, None)
+                if event:
+                    event.set()
+                self._queue.task_done()
+
+    async def get(self, job_id: str) -> dict | None:
+        rows = await self._exec("SELECT kind, status, created, started, finished, result, error, status_code"
+                                " FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        kind, status, created, started, finished, result, error, status_code = rows[0]
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "wait_ms": round(((started or finished or now) - created) * 1000),
+            "run_ms": round(((finished or now) - started) * 1000) if started else None,
+        }
+        if status == "done":
+            job["result"] = json.loads(result)
+        elif status == "failed":
+            job["status_code"] = status_code
+            job["error"] = json.loads(error)
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> dict | None:
+        """Return the job once it finishes, or its current state after `timeout` seconds."""
+        event = self._events.get(job_id)
+        if event is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(job_id)
+        # Running in another worker (or already done): poll the shared table.
+        deadline = time.monotonic() + timeout
+        job = await self.get(job_id)
+        while job is not None and job["status"] not in FINISHED and time.monotonic() < deadline:
+            await asyncio.sleep(min(JOB_POLL_S, max(0.0, deadline - time.monotonic())))
+            job = await self.get(job_id)
+        return job
+
+    async def stats(self) -> dict:
+        counts = dict(await self._exec("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        recent = await self._exec("SELECT started - created, finished - started FROM jobs"
+                                  " WHERE status = 'done' ORDER BY finished DESC LIMIT 200")
+
+        def pct(values, q):
+            values = sorted(v for v in values if v is not None)
+            return round(values[int(q * (len(values) - 1))] * 1000) if values else None
+
+        waits, runs = [r[0] for r in recent], [r[1] for r in recent]
+        return {
+            "workers": self.n_workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "running": self.running,
+            "max_queue": self.max_queue,
+            "by_status": counts,
+            "wait_ms": {"p50": pct(waits, 0.5), "p95": pct(waits, 0.95)},
+            "run_ms": {"p50": pct(runs, 0.5), "p95": pct(runs, 0.95)},
+        }
+
+
+job_queue = JobQueue()
+
+
+@collector
+def job_metrics() -> list[str]:
+    q = job_queue
+    return (gauge_lines("sahyog_jobs_queued", "Background jobs waiting for a worker.",
+                        {None: q._queue.qsize() if q._queue else 0})
+            + gauge_lines("sahyog_jobs_running", "Background jobs running.", {None: q.running}))
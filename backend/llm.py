@@ -0,0 +1,560 @@
+"""
+Async gateway to Groq.
+
+One shared AsyncGroq client (so HTTP connections are reused across requests),
+a semaphore bounding how many LLM calls are in flight at once, and a per-call
+timeout. Endpoints await call_groq() instead of blocking the event loop.
+Every call goes through the rate limiter, retries and circuit breaker in
+resilience.py; UpstreamUnavailable (503) tells callers they may fall back.
+Prompt and completion tokens are logged and totalled per prompt template.
+Identical JSON calls already in flight are coalesced into one (SingleFlight).
+
+Each prompt template is routed to a model tier (LLM_ROUTES): short
+structured summaries go to the fast GROQ_FAST_MODEL, while document,
+loan and scheme analysis stay on GROQ_MODEL. When a model is unavailable
+(retries used up, or its own breaker open), the call falls back to the
+other tier. With LLM_HEDGE=1, a slow call also gets a hedged second
+attempt (see HedgePolicy). track_models() records which model answered
+each prompt, for the response meta.
+"""
+import asyncio
+import contextlib
+import contextvars
+import copy
+import json
+import os
+import time
+from collections.abc import AsyncIterator
+
+import groq
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from groq import AsyncGroq
+
+from health import upstream
+from metrics import LLM_FALLBACKS, LLM_RETRIES, collector, gauge_lines, record_stage, stage
+from outputs import check_output, repair_json
+from prompts import Rendered, count_tokens
+from resilience import (
+    GROQ_RPM, GROQ_TPM, LLM_MAX_RETRIES, LLM_RETRY_BUDGET_S, CircuitBreaker, HedgePolicy, SingleFlight, make_bucket,
+    retry_after_s, retry_delay,
+)
+
+load_dotenv()
+
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
+if not GROQ_API_KEY:
+    print("WARNING: No GROQ_API_KEY set in .env")
+
+GROQ_MODEL = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
+GROQ_FAST_MODEL = os.environ.get("GROQ_FAST_MODEL", "llama-3.1-8b-instant")
+MODEL_TIERS = {"large": GROQ_MODEL, "fast": GROQ_FAST_MODEL}
+# prompt=tier; prompts not listed (and plain-string prompts, "llm") use "large".
+LLM_ROUTES = dict(pair.split("=", 1) for pair in os.environ.get(
+    "LLM_ROUTES", "profile=fast,decision=fast,repayment=fast,loan_choice=fast").split(",") if "=" in pair)
+LLM_FALLBACK = os.environ.get("LLM_FALLBACK", "1") == "1"
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S", "30"))
+LOG_TOKENS = os.environ.get("LOG_TOKENS", "1") == "1"
+
+# Bump whenever a prompt or the response shape changes, so cached responses
+# built from the old prompts are not served.
+PROMPT_VERSION = "9"
+
+SYSTEM_PROMPT = (
+    "You are a warm, friendly financial advisor helping Indian farmers. "
+    "Always speak directly to the farmer using 'you' and 'your'. "
+    "Use simple, plain language — no jargon or complex terms. "
+    "Be honest but kind, like a trusted friend who knows finance. "
+    "Always respond with valid JSON only. No markdown, no explanation."
+)
+
+_client: AsyncGroq | None = None
+_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+def get_client() -> AsyncGroq:
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONCURRENCY,
+                max_keepalive_connections=LLM_MAX_CONCURRENCY,
+            ),
+            timeout=LLM_TIMEOUT_S,
+        )
+        # Retries are ours (see _create), so the SDK's own are turned off.
+        _client = AsyncGroq(api_key=GROQ_API_KEY, http_client=http_client, max_retries=0)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+class UpstreamUnavailable(HTTPException):
+    """Groq is down, rate limited past our retry budget, or the breaker is open."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=503, detail=detail)
+
+
+class InvalidOutput(HTTPException):
+    """Groq answered, but even after repair and a follow-up some fields are unusable."""
+
+    def __init__(self, label: str, partial: dict, missing: list[str]):
+        super().__init__(status_code=502,
+                         detail=f"Groq returned an incomplete {label} answer: missing {', '.join(missing)}")
+        self.partial = partial
+        self.missing = missing
+
+
+class _CutOff(Exception):
+    """Groq rejected its own JSON-mode answer (json_validate_failed); `text` is what `model` generated."""
+
+    def __init__(self, text: str, model: str):
+        self.text = text
+        self.model = model
+
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+requests_bucket = make_bucket("requests", GROQ_RPM)
+tokens_bucket = make_bucket("tokens", GROQ_TPM)
+# One breaker per model, so an outage of one tier does not stop the other.
+breakers = {model: CircuitBreaker() for model in MODEL_TIERS.values()}
+breaker = breakers[GROQ_MODEL]
+hedging = HedgePolicy()
+in_flight = SingleFlight()
+
+
+def route(label: str) -> list[str]:
+    """The models to try for a prompt, in order."""
+    models = [MODEL_TIERS.get(LLM_ROUTES.get(label, "large"), GROQ_MODEL)]
+    if LLM_FALLBACK:
+        models += [m for m in dict.fromkeys(MODEL_TIERS.values()) if m not in models]
+    return models
+
+
+# Cached responses depend on which model wrote each part.
+ROUTING = ",".join([f"{tier}={model}" for tier, model in MODEL_TIERS.items()]
+                   + [f"{label}={tier}" for label, tier in sorted(LLM_ROUTES.items())])
+
+
+def _failed_generation(e: Exception) -> str | None:
+    body = getattr(e, "body", None)
+    error = body.get("error", body) if isinstance(body, dict) else None
+    if isinstance(error, dict) and error.get("code") == "json_validate_failed":
+        return error.get("failed_generation") or ""
+    return None
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, groq.APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(e, groq.APIStatusError) and e.status_code in RETRYABLE_STATUS
+
+
+SYSTEM_TOKENS = count_tokens(SYSTEM_PROMPT)
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    # The completion is counted at its cap, since that is what the quota reserves.
+    return SYSTEM_TOKENS + count_tokens(prompt) + max_tokens
+
+
+class TokenUsage:
+    """Prompt and completion tokens per prompt template, as reported by Groq."""
+
+    def __init__(self):
+        self.by_label: dict[str, dict] = {}
+
+    def record(self, label: str, prompt_tokens: int, completion_tokens: int, max_tokens: int,
+               estimated: int, finish_reason: str | None) -> None:
+        row = self._row(label)
+        row["calls"] += 1
+        row["prompt_tokens"] += prompt_tokens
+        row["completion_tokens"] += completion_tokens
+        row["estimated_prompt_tokens"] += estimated
+        row["max_completion_tokens"] = max(row["max_completion_tokens"], completion_tokens)
+        row["truncated"] += finish_reason == "length"
+        if LOG_TOKENS:
+            cut = " TRUNCATED" if finish_reason == "length" else ""
+            print(f"[TOKENS] {label} prompt={prompt_tokens} (est {estimated}) "
+                  f"completion={completion_tokens}/{max_tokens}{cut}")
+
+    def _row(self, label: str) -> dict:
+        return self.by_label.setdefault(label, {
+            "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated_prompt_tokens": 0,
+            "max_completion_tokens": 0, "truncated": 0,
+            # Output repair: answers that needed it, follow-up calls and their tokens,
+            # and answers still incomplete afterwards.
+            "repaired": 0, "follow_ups": 0, "follow_up_tokens": 0, "incomplete": 0,
+        })
+
+    def count(self, label: str, event: str, n: int = 1) -> None:
+        self._row(label)[event] += n
+
+    def stats(self) -> dict:
+        out = {}
+        for label, row in self.by_label.items():
+            calls = row["calls"]
+            out[label] = {**row,
+                          "avg_prompt_tokens": round(row["prompt_tokens"] / calls),
+                          "avg_completion_tokens": round(row["completion_tokens"] / calls)}
+        return out
+
+
+token_usage = TokenUsage()
+
+
+def _record_usage(label: str, usage, prompt: str, max_tokens: int, finish_reason: str | None,
+                  completion_text: str = "", follow_up: bool = False) -> None:
+    estimated = SYSTEM_TOKENS + count_tokens(prompt)
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:  # not reported (e.g. a stream cut short): count locally
+        prompt_tokens, completion_tokens = estimated, count_tokens(completion_text)
+    token_usage.record(label, prompt_tokens, completion_tokens, max_tokens, estimated, finish_reason)
+    if follow_up:
+        token_usage.count(label, "follow_ups")
+        token_usage.count(label, "follow_up_tokens", prompt_tokens + completion_tokens)
+
+
+async def _create(prompt: str, max_tokens: int, timeout: float | None, hold_slot: bool = True,
+                  model: str = GROQ_MODEL, **kwargs):
+    """
+    One chat completion behind the rate limiter, the concurrency slots and
+    the model's circuit breaker, retrying 429/5xx/connection errors with
+    backoff. Raises UpstreamUnavailable once the model is considered down.
+    """
+    breaker = breakers[model]
+    if not breaker.allow():
+        raise UpstreamUnavailable("Groq is unavailable right now. Please try again shortly.")
+    deadline = time.monotonic() + LLM_RETRY_BUDGET_S
+    attempt = 0
+    settled = False
+    try:
+        while True:
+            attempt += 1
+            queued = time.perf_counter()
+            await requests_bucket.acquire()
+            await tokens_bucket.acquire(estimate_tokens(prompt, max_tokens))
+            t0 = time.perf_counter()
+            try:
+                async with _slots if hold_slot else contextlib.nullcontext():
+                    t0 = time.perf_counter()
+                    record_stage("llm_queue", t0 - queued)
+                    response = await get_client().chat.completions.create(
+                        model=model,
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt},
+                        ],
+                        temperature=0.2,
+                        max_tokens=max_tokens,
+                        timeout=timeout or LLM_TIMEOUT_S,
+                        **kwargs,
+                    )
+            except Exception as e:
+                record_stage("llm", time.perf_counter() - t0)
+                failed = _failed_generation(e)
+                if failed is not None:
+                    # Groq is fine; the answer just did not fit or did not parse.
+                    upstream.record(True, time.perf_counter() - t0)
+                    breaker.success()
+                    settled = True
+                    raise _CutOff(failed, model)
+                upstream.record(False, time.perf_counter() - t0, str(e))
+                if not _retryable(e):
+                    raise HTTPException(status_code=500, detail=f"Groq API error: {str(e)}")
+                retry_after = retry_after_s(getattr(getattr(e, "response", None), "headers", None))
+                wait = retry_delay(attempt, retry_after)
+                if attempt > LLM_MAX_RETRIES or time.monotonic() + wait > deadline:
+                    breaker.failure()
+                    settled = True
+                    raise UpstreamUnavailable(f"Groq API error after {attempt} attempts: {str(e)}")
+                LLM_RETRIES.inc(str(getattr(e, "status_code", None) or "connection"))
+                if retry_after is not None and getattr(e, "status_code", None) == 429:
+                    # Over quota: empty the bucket so every caller waits, this one included.
+                    await requests_bucket.drain(wait)
+                else:
+                    await asyncio.sleep(wait)
+                continue
+            record_stage("llm", time.perf_counter() - t0)
+            upstream.record(True, time.perf_counter() - t0)
+            breaker.success()
+            settled = True
+            return response
+    finally:
+        if not settled:
+            breaker.release()
+
+
+_answered: contextvars.ContextVar[dict | None] = contextvars.ContextVar("answered", default=None)
+
+
+def track_models() -> dict[str, str]:
+    """
+    The model that answered each prompt label, filled in by the calls this
+    task (and the tasks it spawns afterwards) makes from now on.
+    """
+    models = {}
+    _answered.set(models)
+    return models
+
+
+def _answered_by(label: str, model: str) -> None:
+    models = _answered.get()
+    if models is not None:
+        models[label] = model
+
+
+async def _routed(label: str, call) -> tuple[str, object]:
+    """
+    `call(model)` on the prompt's model, falling back along its route while
+    models are unavailable; returns the model that answered and its result.
+    """
+    models = route(label)
+    for i, model in enumerate(models):
+        try:
+            return model, await call(model)
+        except UpstreamUnavailable as e:
+            if i + 1 == len(models):
+                raise
+            LLM_FALLBACKS.inc(label, model)
+            print(f"[ROUTE] {label}: {model} unavailable ({e.detail}), trying {models[i + 1]}")
+
+
+async def _hedged(prompt: str, max_tokens: int, timeout: float | None, label: str, model: str, **kwargs):
+    """
+    _create, plus a second attempt if the first is slower than usual for
+    this prompt and model (HedgePolicy); the first answer wins and the
+    other attempt is cancelled. A failure only counts once both have failed.
+    """
+    kind = (model, label)
+
+    async def attempt():
+        t0 = time.perf_counter()
+        response = await _create(prompt, max_tokens, timeout, model=model, **kwargs)
+        hedging.record(kind, time.perf_counter() - t0)
+        return response
+
+    hedging.calls += 1
+    attempts = [asyncio.ensure_future(attempt())]
+    try:
+        delay = hedging.delay(kind)
+        if delay is not None:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done and hedging.allow(requests_bucket, tokens_bucket):
+                attempts.append(asyncio.ensure_future(attempt()))
+        pending, error = set(attempts), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=attempts.index):
+                if not isinstance(task.exception(), UpstreamUnavailable):
+                    if task is not attempts[0]:
+                        hedging.won += 1
+                    return task.result()  # an answer, or an error that a retry would not fix
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if task.done() and not task.cancelled():
+                task.exception()  # the losing attempt's error is not news
+            task.cancel()
+
+
+async def _complete_json(prompt: str, max_tokens: int, timeout: float | None, label: str,
+                         follow_up: bool = False):
+    """
+    One JSON-mode call, shared with any identical call already in flight.
+    Each caller gets its own copy of the answer, since callers edit them.
+    """
+    key = (tuple(route(label)), max_tokens, prompt)
+    t0 = time.perf_counter()
+    leader = key not in in_flight
+    model, data = await in_flight.do(key, lambda: _complete_json_once(prompt, max_tokens, timeout, label, follow_up))
+    if not leader:
+        record_stage("llm_shared", time.perf_counter() - t0)
+    _answered_by(label, model)
+    return copy.deepcopy(data)
+
+
+async def _complete_json_once(prompt: str, max_tokens: int, timeout: float | None, label: str,
+                              follow_up: bool = False):
+    """One JSON-mode call, and the model that answered; a cut-off answer is repaired to its last complete value."""
+    try:
+        model, response = await _routed(label, lambda model: _hedged(prompt, max_tokens, timeout, label, model,
+                                                                     response_format={"type": "json_object"}))
+        choice = response.choices[0]
+        text, usage, finish_reason = choice.message.content or "", response.usage, choice.finish_reason
+    except _CutOff as e:
+        model, text, usage, finish_reason = e.model, e.text, None, "length"
+    _record_usage(label, usage, prompt, max_tokens, finish_reason, text, follow_up)
+    with stage("parse"):
+        try:
+            return model, json.loads(text)
+        except json.JSONDecodeError:
+            data = repair_json(text)
+    if data is not None:
+        token_usage.count(label, "repaired")
+    return model, data
+
+
+async def call_groq(prompt: str | Rendered, max_tokens: int = 800, timeout: float | None = None,
+                    label: str = "llm") -> dict:
+    """
+    `prompt` is a string, or a rendered template that brings its own
+    max_tokens, label and output model. A templated answer is checked
+    against the model; fields that are missing or malformed are asked for
+    once more on their own, and if some are still missing InvalidOutput
+    carries the usable part so the caller can fill the rest locally.
+    """
+    if not isinstance(prompt, Rendered):
+        data = await _complete_json(prompt, max_tokens, timeout, label)
+        if data is None:
+            raise HTTPException(status_code=500, detail="Groq returned invalid JSON")
+        return data
+
+    rendered, label = prompt, prompt.name
+    data = await _complete_json(rendered.text, rendered.max_tokens, timeout, label, rendered.is_follow_up)
+    with stage("parse"):
+        data, missing = check_output(rendered.output, data, rendered.only)
+    if missing and data:  # nothing usable at all is not a cut-off; don't pay for it twice
+        follow_up = rendered.follow_up(missing)
+        extra = await _complete_json(follow_up.text, follow_up.max_tokens, timeout, label, follow_up=True)
+        if isinstance(extra, dict):
+            data = {**data, **{k: v for k, v in extra.items() if k in missing}}
+            with stage("parse"):
+                data, missing = check_output(rendered.output, data, rendered.only)
+    if missing:
+        token_usage.count(label, "incomplete")
+        raise InvalidOutput(label, data, missing)
+    return data
+
+
+async def stream_groq(prompt: str | Rendered, max_tokens: int = 800, timeout: float | None = None,
+                      label: str = "llm") -> AsyncIterator[str]:
+    """
+    Yield text deltas as Groq generates them (JSON mode is not used when
+    streaming). Retries only happen before the first token arrives.
+    """
+    if isinstance(prompt, Rendered):
+        prompt, max_tokens, label = prompt.text, prompt.max_tokens, prompt.name
+    async with _slots:  # held for the whole stream, not just the request
+        # Streams fall back like JSON calls, but are not hedged.
+        model, stream = await _routed(label, lambda model: _create(prompt, max_tokens, timeout, hold_slot=False,
+                                                                   model=model, stream=True))
+        _answered_by(label, model)
+        t0 = time.perf_counter()
+        first_token = True
+        usage, finish_reason, received = None, None, []
+        try:
+            async for chunk in stream:
+                x_groq = getattr(chunk, "x_groq", None)
+                usage = getattr(x_groq, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token:
+                        record_stage("llm_first_token", time.perf_counter() - t0)
+                        first_token = False
+                    received.append(delta)
+                    yield delta
+        except Exception as e:
+            upstream.record(False, time.perf_counter() - t0, str(e))
+            raise HTTPException(status_code=500, detail=f"Groq API error: {str(e)}")
+        finally:
+            await stream.close()
+            record_stage("llm_stream", time.perf_counter() - t0)
+            _record_usage(label, usage, prompt, max_tokens, finish_reason, "".join(received))
+
+
+@collector
+def llm_metrics() -> list[str]:
+    usage = token_usage.by_label
+    lines = gauge_lines("sahyog_llm_in_flight", "Groq calls holding a concurrency slot.",
+                        {None: LLM_MAX_CONCURRENCY - _slots._value})
+    lines += gauge_lines("sahyog_llm_breaker_open", "1 while a model's circuit breaker is open or half open.",
+                         {model: int(b.state != "closed") for model, b in breakers.items()}, "model")
+    for kind in ("prompt_tokens", "completion_tokens", "follow_up_tokens"):
+        lines += gauge_lines(f"sahyog_llm_{kind}_total", f"Groq {kind.replace('_', ' ')} by prompt.",
+                             {k: v[kind] for k, v in usage.items()}, "prompt", "counter")
+    for event in ("calls", "truncated", "repaired", "follow_ups", "incomplete"):
+        lines += gauge_lines(f"sahyog_llm_{event}_total", f"Groq answers: {event.replace('_', ' ')}, by prompt.",
+                             {k: v[event] for k, v in usage.items()}, "prompt", "counter")
+    lines += gauge_lines("sahyog_llm_coalesced_total", "Identical Groq calls: sent upstream, or joined to "
+                         "one in flight, or abandoned by every caller.",
+                         {"upstream": in_flight.leaders, "joined": in_flight.joined,
+                          "abandoned": in_flight.abandoned}, "outcome", "counter")
+    lines += gauge_lines("sahyog_llm_hedges_total", "Hedged second attempts: sent, answered first, or "
+                         "skipped by the caps.",
+                         {"sent": hedging.hedged, "won": hedging.won, "skipped": hedging.skipped},
+                         "outcome", "counter")
+    return lines
+
+
+def resilience_stats() -> dict:
+    return {"breaker": breaker.stats(), "breakers": {model: b.stats() for model, b in breakers.items()},
+            "requests_per_minute": requests_bucket.stats(),
+            "tokens_per_minute": tokens_bucket.stats(), "coalescing": in_flight.stats()}
+
+
+class JSONFieldStream:
+    """
+    Incremental parser for a streamed top-level JSON object. feed() returns
+    each (key, value) pair as soon as its value has been fully received.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.field_start = None
+
+    def feed(self, text: str) -> list[tuple[str, object]]:
+        self.buf += text
+        fields = []
+        while self.pos < len(self.buf):
+            ch = self.buf[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.depth > 0
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.field_start = self.pos + 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    fields += self._take(self.pos)
+                    self.field_start = None
+            elif ch == "," and self.depth == 1:
+                fields += self._take(self.pos)
+                self.field_start = self.pos + 1
+            self.pos += 1
+        return fields
+
+    def _take(self, end: int) -> list[tuple[str, object]]:
+        chunk = self.buf[self.field_start:end].strip()
+        if not chunk:
+            return []
+        try:
+            return list(json.loads("{" + chunk + "}").items())
+        except json.JSONDecodeError:
+            return []
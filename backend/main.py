@@ -1,31 +1,76 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import asyncio
+import calendar
+import datetime
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import base64
 import re
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-import json
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
 import os
-from dotenv import load_dotenv
-from groq import Groq
-
-load_dotenv()
-
-app = FastAPI(title="SahyogAI API", version="2.0.0")
 
+from amortization import DEFAULT_ANNUAL_RATE, DEFAULT_TENURE_MONTHS, build_schedule, tenure_options
+from cache import make_key, response_cache
+import catalogue
+from clauses import apply_scan, relevant_excerpts, scan
+from documents import (
+    DOC_CHUNK_CHARS, DOC_CHUNK_CONCURRENCY, DOC_FULL_MAX_CHARS, DOC_MAX_CHARS, DOC_SCAN_MAX_CHARS,
+    chunk_text, close_pool, coverage_pct, extract_in_pool, merge_analyses, spool_upload,
+)
+import fallbacks
+from batch import (
+    BATCH_CONCURRENCY, BATCH_MAX_IN_FLIGHT, BATCH_MAX_PROFILES, jobs, parse_upload, results_by_row, run_job,
+    validate_rows,
+)
+from eligibility import shortlist
+from health import refresh_loop, upstream
+from jobqueue import FINISHED, job_queue
+import metrics
+from metrics import MetricsMiddleware, stage
+from compression import CompressionMiddleware
+import simulation
+from llm import (
+    GROQ_MODEL, InvalidOutput, JSONFieldStream, UpstreamUnavailable, breakers, call_groq, close_client,
+    get_client, hedging, in_flight, resilience_stats, route, stream_groq, token_usage, track_models,
+)
+import projection
+from projection import project, project_events, projected
+import prompts
+from streaming import StreamFormat, stream_response
+import translation
+from translation import Language, localize, localize_events, localize_response, localized
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher = asyncio.create_task(refresh_loop(get_client))
+    reloader = asyncio.create_task(catalogue.reload_loop())
+    preload = asyncio.create_task(translation.preload(catalogue.current().schemes))
+    await job_queue.start()
+    app.state.started = True
+    yield
+    app.state.started = False
+    refresher.cancel()
+    reloader.cancel()
+    preload.cancel()
+    await job_queue.stop()
+    await close_client()
+    close_pool()
+
+
+app = FastAPI(title="SahyogAI API", version="2.0.0", lifespan=lifespan)
+
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
-if not GROQ_API_KEY:
-    print("WARNING: No GROQ_API_KEY set in .env")
-
-client = Groq(api_key=GROQ_API_KEY)
-GROQ_MODEL = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
+app.add_middleware(MetricsMiddleware)
 
 
 class FarmerProfile(BaseModel):
@@ -42,252 +87,156 @@ class FarmerProfile(BaseModel):
     loan_amount_inr: Optional[float] = None
 
 
-def call_groq(prompt: str, max_tokens: int = 800) -> dict:
-    try:
-        response = client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a warm, friendly financial advisor helping Indian farmers. "
-                        "Always speak directly to the farmer using 'you' and 'your'. "
-                        "Use simple, plain language — no jargon or complex terms. "
-                        "Be honest but kind, like a trusted friend who knows finance. "
-                        "Always respond with valid JSON only. No markdown, no explanation."
-                    )
-                },
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=max_tokens,
-            response_format={"type": "json_object"},
-        )
-        text = response.choices[0].message.content.strip()
-        return json.loads(text)
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=500, detail=f"Groq returned invalid JSON: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Groq API error: {str(e)}")
-
-
-SCHEMES_DB = [
-    {
-        "id": "pmfby",
-        "name": "PM Fasal Bima Yojana",
-        "category": "Crop Insurance",
-        "description": "Comprehensive crop insurance against natural calamities, pests, and diseases with minimal premium paid by farmers.",
-        "benefit_inr": "Up to full sum insured (based on crop value and area)",
-        "eligibility_criteria": "All farmers including sharecroppers and tenant farmers growing notified crops in notified areas",
-        "coverage_details": "Covers yield losses due to non-preventable natural risks from pre-sowing to post-harvest. Includes prevented sowing, localized calamities (hailstorm, landslide, inundation), and post-harvest losses",
-        "premium_details": "Kharif: 2% of sum insured, Rabi: 1.5%, Annual commercial/horticultural: 5%. Rest subsidized by government",
-        "application_process": "Apply through nearest bank branch, Common Service Center (CSC), agriculture office, or online portal within cut-off dates (usually 7 days before sowing)"
-    },
-    {
-        "id": "kcc",
-        "name": "Kisan Credit Card",
-        "category": "Credit",
-        "description": "Revolving credit facility for short-term agricultural needs including seeds, fertilizers, pesticides, and allied activities with flexible repayment.",
-        "benefit_inr": "Up to ₹3,00,000 credit limit (can be higher based on landholding and cropping pattern)",
-        "eligibility_criteria": "Farmers (owners/tenants), self-help groups, joint liability groups engaged in agriculture and allied activities. No age limit for individual farmers",
-        "coverage_details": "Covers crop cultivation, post-harvest expenses, maintenance of farm assets, working capital for allied activities, consumption needs. Valid for 5 years with annual review",
-        "premium_details": "Interest: 7% per annum (4% effective rate with 3% subvention). Additional 3% interest subvention for prompt repayment. No processing fee for loans up to ₹3 lakh",
-        "application_process": "Visit nearest bank branch (priority sector lending bank) with land records, Aadhaar, PAN. Can also apply through PM Kisan portal if registered"
-    },
-    {
-        "id": "pmkisan",
-        "name": "PM-KISAN",
-        "category": "Direct Benefit Transfer",
-        "description": "Direct income support of ₹6,000 per year to all landholding farmer families in three equal installments of ₹2,000 each.",
-        "benefit_inr": "₹6,000 per year (₹2,000 per installment, 3 times yearly)",
-        "eligibility_criteria": "All landholding farmer families (including small and marginal). Excludes institutional landholders, government employees, and income tax payees",
-        "coverage_details": "No restrictions on land size. Automatically enrolled in all states (except West Bengal). Money directly transferred to bank account linked with Aadhaar",
-        "premium_details": "Free - no cost to farmers. Government scheme with direct benefit transfer",
-        "application_process": "Self-registration on PM-KISAN portal or through Common Service Centers (CSC). Villages also conduct camps for registration. Needs Aadhaar, bank account, land records"
-    },
-    {
-        "id": "shc",
-        "name": "Soil Health Card Scheme",
-        "category": "Input Subsidy",
-        "description": "Free soil testing and customized fertilizer recommendations to improve soil fertility and reduce input costs while increasing yields.",
-        "benefit_inr": "Saves ₹2,000-8,000/year on fertilizer costs through optimized usage",
-        "eligibility_criteria": "All farmers across India. Issued every 2 years to track soil health changes",
-        "coverage_details": "Tests for 12 parameters: N, P, K (macro-nutrients), S (secondary nutrient), Zn, Fe, Cu, Mn, Bo (micro-nutrients), pH, EC, OC. Provides crop-wise fertilizer recommendations",
-        "premium_details": "Completely free. Government bears cost of soil sample collection, testing, and card printing",
-        "application_process": "Contact village agriculture extension officer or nearest Krishi Vigyan Kendra (KVK). Soil samples collected from your field and tested at government labs"
-    },
-    {
-        "id": "pmksy",
-        "name": "PM Krishi Sinchai Yojana (PMKSY)",
-        "category": "Irrigation",
-        "description": "Per Drop More Crop - promotes micro-irrigation (drip and sprinkler) to enhance water use efficiency and increase crop productivity.",
-        "benefit_inr": "Up to 55% subsidy on drip/sprinkler systems (up to 90% for SC/ST farmers in some states)",
-        "eligibility_criteria": "All farmers with land ownership or lease deed. Priority to small and marginal farmers, SC/ST, women farmers",
-        "coverage_details": "Subsidy for drip irrigation, sprinkler systems, rainwater harvesting structures, farm ponds. Covers cost of equipment, installation, and training",
-        "premium_details": "Small & Marginal Farmers: 55% subsidy, Other Farmers: 45% subsidy, SC/ST/Women in some states: up to 90% subsidy. Varies by state and category",
-        "application_process": "Apply online through state agriculture department portal or visit District Agriculture Office. Need land documents, Aadhaar, bank details, and quotations from approved vendors"
-    },
-    {
-        "id": "nabard_dairy",
-        "name": "NABARD Dairy Entrepreneurship Development Scheme",
-        "category": "Credit",
-        "description": "Comprehensive scheme to promote dairy farming with subsidized credit for purchasing milch animals, farm equipment, and setting up dairy infrastructure.",
-        "benefit_inr": "Up to 33% capital subsidy (SC/ST: 50%) on project cost. Loans up to ₹60 lakh for small units",
-        "eligibility_criteria": "Individual farmers, dairy cooperatives, self-help groups, companies, and entrepreneurs. No upper age limit",
-        "coverage_details": "Covers purchase of high-yielding milch animals (cows, buffaloes), cattle shed construction, milk storage, processing equipment, animal insurance",
-        "premium_details": "Capital subsidy: General: 33.33%, SC/ST/Women: 50%. Interest rates 4-7% (subject to government subsidies). Project cost: ₹10 lakh to ₹60 lakh per unit",
-        "application_process": "Submit project proposal through NABARD consultants or directly to NABARD district office. Need land records, project report, cost estimates, Aadhaar, PAN"
-    },
-    {
-        "id": "pkvy",
-        "name": "Paramparagat Krishi Vikas Yojana (PKVY)",
-        "category": "Input Subsidy",
-        "description": "Promotes organic farming through cluster approach. Provides financial assistance for conversion from chemical to organic farming over 3 years.",
-        "benefit_inr": "₹50,000 per hectare over 3 years (₹31,000 in year 1, ₹10,000 each in years 2&3). Additional ₹50,000 per cluster for infrastructure",
-        "eligibility_criteria": "Clusters of 50 farmers each farming minimum 50 acres. Farmers must commit to organic farming for at least 3 years",
-        "coverage_details": "Covers organic inputs (bio-fertilizers, bio-pesticides), organic certification, residue testing, capacity building, marketing support, packaging material",
-        "premium_details": "Free for participating farmers. Government provides full financial assistance. No farmer contribution required. Cluster-based implementation",
-        "application_process": "Form or join a cluster of 50 farmers through State Agriculture Department. Submit group application with land details, commitment letter, Aadhaar of all members"
-    },
-    {
-        "id": "kisan_rath",
-        "name": "Kisan Rath Mobile App",
-        "category": "Input Subsidy",
-        "description": "Digital platform connecting farmers directly with transporters to move agricultural produce efficiently at transparent rates, reducing transportation costs.",
-        "benefit_inr": "Saves 15-30% on transportation costs. Direct access to verified transporters. Transparent pricing",
-        "eligibility_criteria": "All farmers with produce to transport. Smartphone with internet connection required. Free registration",
-        "coverage_details": "Connects farmers with truck/vehicle owners. Shows real-time vehicle availability, rates. Multiple payment options. Rating system for service quality",
-        "premium_details": "Free app. No registration fee. Pay only for transportation as per negotiated rates. Government doesn't charge any commission",
-        "application_process": "Download Kisan Rath app from Google Play Store or Apple App Store. Register with mobile number and Aadhaar. Post transport requirement or search available vehicles"
-    }
-]
-
-
-def build_financial_profile(p: FarmerProfile) -> dict:
+def estimate_finances(p: FarmerProfile) -> dict:
+    """Local surplus/EMI arithmetic, shared by the profile, scheme and decision stages."""
     household_exp = p.household_size * 2500
     debt_emi = round(p.existing_debt_inr * 0.03)
     monthly = p.monthly_income_inr
     farm_inputs = round(monthly * 0.15)
     surplus = max(0, monthly - household_exp - debt_emi - farm_inputs)
 
-    prompt = f"""Review {p.name}'s finances and speak directly to them using "you" and "your".
-
-THEIR DETAILS:
-- State: {p.state}, Land: {p.land_acres} acres, Crop: {p.crop_type}
-- Monthly income: Rs.{monthly:,.0f} ({p.income_type} income)
-- Household: {p.household_size} people, Debt: Rs.{p.existing_debt_inr:,.0f}
-- Risks: {', '.join(p.risk_exposure)}
-- Pre-calculated monthly costs: household Rs.{household_exp:,} + debt Rs.{debt_emi:,} + farm inputs Rs.{farm_inputs:,}
-- Estimated savings left: Rs.{surplus:,}/month
-
-Write profile_summary and confidence_reason talking directly to {p.name} in simple words.
-
-Return this JSON:
-{{
-  "income_pattern": "seasonal or mixed or daily",
-  "income_stability": "stable or moderate or volatile",
-  "debt_load": "low or moderate or high or critical",
-  "monthly_surplus_estimate_inr": {surplus},
-  "financial_vulnerability": "low or medium or high",
-  "confidence": "high or medium or low",
-  "confidence_reason": "<one sentence starting with 'Based on what you shared...'>",
-  "key_financial_risks": ["<plain risk>", "<plain risk>", "<plain risk>"],
-  "profile_summary": "<2 simple sentences to {p.name} e.g. 'Your income comes mainly from...'>",
-  "expense_breakdown": [
-    {{"label": "Household", "value": {household_exp}, "color": "#4a8fd4"}},
-    {{"label": "Debt EMI",  "value": {debt_emi},     "color": "#e05a4a"}},
-    {{"label": "Farm Inputs","value": {farm_inputs},  "color": "#c87a30"}},
-    {{"label": "Savings",   "value": {surplus},       "color": "#3a9a64"}}
-  ],
-  "risk_scores": [
-    {{"label": "Income Risk",  "score": <0-100>, "description": "<short plain phrase>"}},
-    {{"label": "Debt Risk",    "score": <0-100>, "description": "<short plain phrase>"}},
-    {{"label": "Weather Risk", "score": <0-100>, "description": "<short plain phrase>"}},
-    {{"label": "Market Risk",  "score": <0-100>, "description": "<short plain phrase>"}}
-  ],
-  "income_vs_expense": {{
-    "income": {monthly},
-    "expenses": {household_exp + debt_emi + farm_inputs},
-    "surplus": {surplus}
-  }}
-}}"""
-
-    return call_groq(prompt, max_tokens=700)
-
-
-def assess_schemes(p: FarmerProfile, profile: dict) -> list:
+    savings_rate = surplus / max(monthly, 1)
+    debt_share = debt_emi / max(monthly, 1)
+    if surplus <= 0 or debt_share > 0.4:
+        vulnerability = "high"
+    elif savings_rate < 0.2 or debt_share > 0.2 or len(p.risk_exposure) >= 3:
+        vulnerability = "medium"
+    else:
+        vulnerability = "low"
+
+    return {
+        "household_exp": household_exp,
+        "debt_emi": debt_emi,
+        "farm_inputs": farm_inputs,
+        "monthly_surplus_estimate_inr": surplus,
+        "financial_vulnerability": vulnerability,
+    }
+
+
+async def build_financial_profile(p: FarmerProfile) -> dict:
+    est = estimate_finances(p)
+    household_exp = est["household_exp"]
+    debt_emi = est["debt_emi"]
+    monthly = p.monthly_income_inr
+    farm_inputs = est["farm_inputs"]
+    surplus = est["monthly_surplus_estimate_inr"]
+
+    return await call_groq(prompts.PROFILE.render(
+        name=p.name, state=p.state, land_acres=p.land_acres, crop_type=p.crop_type,
+        monthly=monthly, income_type=p.income_type, household_size=p.household_size,
+        existing_debt_inr=p.existing_debt_inr, risks=", ".join(p.risk_exposure),
+        household_exp=household_exp, debt_emi=debt_emi, farm_inputs=farm_inputs, surplus=surplus,
+        expenses=household_exp + debt_emi + farm_inputs,
+    ))
+
+
+def local_scheme_entry(s: dict, verdict: dict) -> dict:
+    """Fill a scheme card from the catalogue and the rule engine alone."""
+    if verdict["eligible"]:
+        suitability, label = "low_value", "Skip for now"
+        action = s.get("application_process", "")
+        fallback = "You qualify, but other schemes will help you more right now."
+    else:
+        suitability, label = "not_suitable", "Not for you"
+        action = "No action needed for now."
+        fallback = "This scheme does not match your situation."
+    return {
+        "scheme_id": s["id"],
+        **{k: s.get(k, "") for k in ["name", "category", "description", "benefit_inr", "eligibility_criteria",
+                                     "coverage_details", "premium_details", "application_process"]},
+        "eligible": verdict["eligible"],
+        "suitability": suitability,
+        "suitability_label": label,
+        "reason": " ".join(verdict["reasons"]) or fallback,
+        "benefit_effort_score": max(1, round(verdict["score"])),
+        "action_required": action,
+    }
+
+
+def scheme_prompt(cat: catalogue.Catalogue, p: FarmerProfile, vulnerability: str, picked: list) -> prompts.Rendered:
     schemes_info = "\n".join([
-        f"{i+1}. {s['id']} - {s['name']} ({s['category']})\n"
-        f"   Benefit: {s['benefit_inr']}\n"
-        f"   Eligibility: {s['eligibility_criteria']}\n"
-        f"   Coverage: {s['coverage_details']}\n"
-        f"   Premium/Cost: {s.get('premium_details', 'N/A')}"
-        for i, s in enumerate(SCHEMES_DB)
+        f"{i+1}. {cat.fragments[v['scheme_id']]}\n"
+        f"Why it fits: {' '.join(v['reasons']) or 'general benefit'}"
+        for i, v in enumerate(picked)
     ])
+    n = len(picked)
+    return prompts.SCHEMES.render(
+        items=n, n=n, name=p.name, state=p.state, land_acres=p.land_acres, crop_type=p.crop_type,
+        monthly=p.monthly_income_inr, income_type=p.income_type, existing_debt_inr=p.existing_debt_inr,
+        risks=", ".join(p.risk_exposure), vulnerability=vulnerability, schemes_info=schemes_info,
+    )
 
-    prompt = f"""Advise {p.name} about government schemes, speaking directly to them using "you".
-
-THEIR SITUATION:
-- {p.state}, {p.land_acres} acres of {p.crop_type}, Rs.{p.monthly_income_inr:,.0f}/month ({p.income_type})
-- Debt: Rs.{p.existing_debt_inr:,.0f}, Risks: {', '.join(p.risk_exposure)}
-- Financial health: {profile.get('financial_vulnerability', 'medium')} vulnerability
-
-AVAILABLE SCHEMES (assess all {len(SCHEMES_DB)}):
-{schemes_info}
-
-Use friendly direct language: "You can get this because...", "To apply, go to your local..."
-
-For each scheme, consider:
-- Do they meet the eligibility criteria?
-- Is the benefit substantial for their situation?
-- Is it worth the effort to apply?
-- How does it address their specific risks and needs?
-
-Return JSON with key "schemes" containing array of {len(SCHEMES_DB)} items:
-{{
-  "schemes": [
-    {{
-      "scheme_id": "<id>",
-      "name": "<full name from database>",
-      "category": "<category from database>",
-      "description": "<description from database>",
-      "benefit_inr": "<benefit from database>",
-      "eligibility_criteria": "<from database>",
-      "coverage_details": "<from database>",
-      "premium_details": "<from database if exists>",
-      "application_process": "<from database if exists>",
-      "eligible": true or false,
-      "suitability": "recommended or suitable or low_value or not_suitable",
-      "suitability_label": "<plain label like 'Great for you' or 'Worth trying' or 'Skip for now'>",
-      "reason": "<1-2 simple sentences to {p.name} explaining why they should/shouldn't apply>",
-      "benefit_effort_score": <1-10 - how much benefit vs effort to apply>,
-      "priority": <1-{len(SCHEMES_DB)} - ranking based on their situation>,
-      "action_required": "<one action sentence: 'Go to...' or 'Visit...' or 'Call...'>"
-    }}
-  ]
-}}
-
-Include ALL {len(SCHEMES_DB)} schemes in your response, even if some are not suitable."""
-
-    result = call_groq(prompt, max_tokens=1500)
+
+async def scheme_advice(prompt: prompts.Rendered) -> dict:
+    """The LLM's verdict per scheme id; whatever it got through if the list came back incomplete."""
+    try:
+        result = await call_groq(prompt)
+    except InvalidOutput as e:
+        result = e.partial
     raw = result.get("schemes", result) if isinstance(result, dict) else result
     if not isinstance(raw, list):
         raw = []
+    return {item.get("scheme_id"): item for item in raw if isinstance(item, dict)}
+
+
+async def assess_schemes(p: FarmerProfile, profile: dict) -> list:
+    vulnerability = profile.get('financial_vulnerability', 'medium')
+    cat = catalogue.current()
+    with stage("rules"):
+        ranked = cat.index.rank(p, vulnerability)
+        picked = shortlist(ranked)
+
+    llm_items = {}
+    if picked:
+        llm_items = await scheme_advice(scheme_prompt(cat, p, vulnerability, picked))
+        missing = [v for v in picked if v["scheme_id"] not in llm_items]
+        if llm_items and missing:
+            # Cut off part-way through the list: ask again for just the schemes it didn't reach.
+            llm_items.update(await scheme_advice(
+                scheme_prompt(cat, p, vulnerability, missing)._replace(is_follow_up=True)))
+
+    with stage("post"):
+        return merge_scheme_items(cat, ranked, picked, llm_items)
+
+
+def local_schemes(p: FarmerProfile, profile: dict) -> list:
+    """The scheme list from the rule engine alone, for when Groq is unavailable."""
+    cat = catalogue.current()
+    ranked = cat.index.rank(p, profile.get('financial_vulnerability', 'medium'))
+    return merge_scheme_items(cat, ranked, shortlist(ranked), {})
+
+
+def merge_scheme_items(cat: catalogue.Catalogue, ranked: list, picked: list, llm_items: dict) -> list:
+    scheme_map = cat.by_id
+    shortlisted = {v["scheme_id"] for v in picked}
+    out = []
+    for verdict in ranked:
+        sid = verdict["scheme_id"]
+        item = local_scheme_entry(scheme_map[sid], verdict)
+        if sid in llm_items:
+            llm = llm_items[sid]
+            for key in ["suitability", "suitability_label", "reason", "benefit_effort_score", "action_required"]:
+                if llm.get(key):
+                    item[key] = llm[key]
+            item["priority"] = llm.get("priority", 99)
+        elif sid in shortlisted:
+            item["suitability"], item["suitability_label"] = "suitable", "Worth trying"
+            if not verdict["reasons"]:
+                item["reason"] = "You qualify, and this is one of the best fits for you."
+            item["action_required"] = scheme_map[sid].get("application_process", "")
+            item["priority"] = 99
+        else:
+            item["priority"] = 100
+        out.append(item)
 
-    scheme_map = {s["id"]: s for s in SCHEMES_DB}
-    for item in raw:
-        sid = item.get("scheme_id")
-        if sid in scheme_map:
-            # Only update fields that weren't provided by the AI
-            for key in ["name", "category", "description", "benefit_inr", "eligibility_criteria", 
-                       "coverage_details", "premium_details", "application_process"]:
-                if key not in item or not item[key]:
-                    item[key] = scheme_map[sid].get(key, "")
-    
-    return sorted(raw, key=lambda x: x.get("priority", 99))
+    # Shortlisted schemes by the LLM's priority, then the rest in rule-engine order.
+    out.sort(key=lambda x: x["priority"])
+    for i, item in enumerate(out):
+        item["priority"] = i + 1
+    return out
 
 
-def assess_loan_fast(p: FarmerProfile) -> dict:
+async def assess_loan_fast(p: FarmerProfile, sim: dict | None) -> dict:
     if not p.loan_purpose or not p.loan_amount_inr:
         return {"assessed": False, "label": "not_requested", "message": "No loan request provided."}
 
@@ -300,134 +249,48 @@ def assess_loan_fast(p: FarmerProfile) -> dict:
     loan_to_annual = round(p.loan_amount_inr / max(p.monthly_income_inr * 12, 1), 2)
     safe_capacity = round(p.monthly_income_inr * 0.3 / 0.03)
 
-    prompt = f"""Give {p.name} honest, friendly loan advice. Speak directly using "you" and "your".
-Plain language only — like advice from a trusted friend.
-
-THEIR DETAILS:
-- {p.state}, {p.land_acres} acres of {p.crop_type}, {p.income_type} income
-- Monthly income: Rs.{p.monthly_income_inr:,.0f}, Household: {p.household_size} people
-- Existing debt: Rs.{p.existing_debt_inr:,.0f}, Risks: {', '.join(p.risk_exposure)}
-
-LOAN REQUEST: Rs.{p.loan_amount_inr:,.0f} for "{p.loan_purpose}"
-
-NUMBERS (pre-calculated — use these):
-- Monthly loan payment would be: Rs.{est_emi:,}
-- Monthly household costs: Rs.{household_exp:,}
-- Current debt payment: Rs.{current_debt_emi:,}
-- Total going out each month: Rs.{total_outgo:,}
-- Left over after all payments: Rs.{surplus:,}
-- What % of income goes to debt: {debt_ratio}%
-- This loan = {loan_to_annual}x your yearly income
-- You can safely borrow up to: Rs.{safe_capacity:,}
-
-All text fields must talk to {p.name} directly. Keep every sentence short and simple.
-
-Return this JSON:
-{{
-  "assessed": true,
-  "label": "suitable or risky or not_recommended",
-  "label_display": "<plain 5-word verdict>",
-  "overall_reasoning": "<2 simple sentences to {p.name}>",
-  "key_metrics": {{
-    "debt_service_ratio": {debt_ratio},
-    "loan_to_income_ratio": {loan_to_annual},
-    "risk_adjusted_capacity": {safe_capacity}
-  }},
-  "repayment_analysis": {{
-    "monthly_emi_estimate": {est_emi},
-    "income_cycle_match": "excellent or good or poor",
-    "timing_concern": "<1 plain sentence or null>",
-    "seasonal_buffer_needed": <number>,
-    "verdict": "<1 friendly sentence to {p.name}>"
-  }},
-  "cash_flow_analysis": {{
-    "loan_purpose_timing": "<1 sentence: when you'd spend this money>",
-    "revenue_generation_timeline": "<1 sentence: when you'd earn it back>",
-    "timing_mismatch": true or false,
-    "mismatch_detail": "<1 sentence or null>",
-    "cash_flow_pressure_months": [<month numbers 1-12>],
-    "verdict": "<1 friendly sentence>"
-  }},
-  "debt_burden_analysis": {{
-    "current_debt_to_income_ratio": {round(current_debt_emi / max(p.monthly_income_inr,1) * 100)},
-    "post_loan_debt_to_income_ratio": {debt_ratio},
-    "debt_load_category": "safe or manageable or stressed or critical",
-    "available_income_after_all_emis": {surplus},
-    "minimum_safe_buffer": <number>,
-    "meets_buffer_requirement": true or false,
-    "verdict": "<1 friendly sentence>"
-  }},
-  "income_shock_resilience": {{
-    "vulnerability_score": <0-100>,
-    "primary_risks": ["<plain risk>", "<plain risk>"],
-    "months_of_reserves_needed": <number>,
-    "can_weather_one_bad_season": true or false,
-    "worst_case_scenario": "<1 plain honest sentence>",
-    "verdict": "<1 friendly sentence>"
-  }},
-  "loan_purpose_evaluation": {{
-    "purpose_category": "productive or semi-productive or consumptive",
-    "roi_potential": "high or medium or low",
-    "productive_value": "<1 sentence: how this helps you>",
-    "alternative_funding": "<1 sentence about cheaper options, or null>",
-    "purpose_risk": "<1 plain sentence about what could go wrong>",
-    "verdict": "<1 friendly sentence>"
-  }},
-  "risk_factors": [
-    {{"factor": "<plain name>", "severity": "high or medium or low", "impact": "<what it means for you>", "mitigation": "<what you can do>"}}
-  ],
-  "green_flags": ["<something good about your situation>", "<another positive>"],
-  "red_flags": ["<honest concern>", "<another concern>"],
-  "recommendations": {{
-    "primary_recommendation": "<2 honest friendly sentences of advice to {p.name}>",
-    "if_proceeding": "<1 sentence: if you go ahead, do this first>",
-    "safer_alternatives": ["<simpler option>", "<another option>"],
-    "negotiation_tips": ["<tip for the bank>", "<another tip>"]
-  }},
-  "repayment_plan_preview": {{
-    "monthly_emi": {est_emi},
-    "suggested_tenure_months": <24 or 36 or 48 or 60>,
-    "lean_months": [<month numbers when income is low>],
-    "harvest_months": [<month numbers when income is high for {p.crop_type}>],
-    "strategy": "<1 sentence: how to plan repayments around your harvest>",
-    "buffer_to_save": <monthly amount to set aside>
-  }},
-  "confidence": "high or medium or low",
-  "confidence_reason": "<1 sentence starting with 'Based on what you shared...'>"
-}}"""
-
-    return call_groq(prompt, max_tokens=1200)
-
-
-def synthesise_decision(p: FarmerProfile, profile: dict, schemes: list, loan: dict) -> dict:
+    return await call_groq(prompts.LOAN.render(
+        name=p.name, state=p.state, land_acres=p.land_acres, crop_type=p.crop_type,
+        income_type=p.income_type, monthly=p.monthly_income_inr, household_size=p.household_size,
+        existing_debt_inr=p.existing_debt_inr, risks=", ".join(p.risk_exposure),
+        loan_amount_inr=p.loan_amount_inr, loan_purpose=p.loan_purpose, est_emi=est_emi,
+        household_exp=household_exp, current_debt_emi=current_debt_emi, total_outgo=total_outgo,
+        surplus=surplus, debt_ratio=debt_ratio, loan_to_annual=loan_to_annual, safe_capacity=safe_capacity,
+        current_dti=round(current_debt_emi / max(p.monthly_income_inr, 1) * 100),
+        paths=sim["paths"], months=sim["months"], default_pct=round(sim["default_probability"] * 100),
+        missed_pct=round(sim["missed_payment_probability"] * 100),
+        bad_season_pct=round(sim["default_probability_one_bad_season"] * 100),
+        reserve_p90=round(sim["reserve_needed_inr"]["p90"]),
+        hardest_months=", ".join(calendar.month_abbr[m] for m in sim["hardest_months"]) or "none",
+    ))
+
+
+def with_simulation(loan: dict, sim: dict | None) -> dict:
+    """Put the simulated figures in the assessment, in place of anything the LLM wrote for them."""
+    if sim is None or not loan.get("assessed"):
+        return loan
+    loan.setdefault("income_shock_resilience", {}).update({
+        "vulnerability_score": sim["vulnerability_score"],
+        "months_of_reserves_needed": sim["months_of_reserves_needed"],
+        "can_weather_one_bad_season": sim["can_weather_one_bad_season"],
+        "default_probability": sim["default_probability"],
+    })
+    loan.setdefault("repayment_analysis", {})["seasonal_buffer_needed"] = sim["reserve_needed_inr"]["p90"]
+    loan.setdefault("cash_flow_analysis", {})["cash_flow_pressure_months"] = sim["hardest_months"]
+    loan["simulation"] = sim
+    return loan
+
+
+async def synthesise_decision(p: FarmerProfile, profile: dict, schemes: list, loan: dict) -> dict:
     top_schemes = [s for s in schemes if s.get("suitability") in ("recommended", "suitable")][:3]
 
-    prompt = f"""Give {p.name} one clear, friendly recommendation. Speak directly using "you".
-Simple language — like advice from a trusted friend.
-
-SITUATION:
-- Financial health: {profile.get('financial_vulnerability', 'medium')} vulnerability
-- Monthly savings: Rs.{profile.get('monthly_surplus_estimate_inr', 0):,}
-- Best schemes: {', '.join([s['name'] for s in top_schemes]) if top_schemes else 'None found'}
-- Loan assessment: {loan.get('label', 'not assessed')}
-
-Return JSON talking directly to {p.name}:
-{{
-  "recommendation": "scheme_first or loan_first or both_together or scheme_only or neither or loan_only",
-  "headline": "<one bold sentence starting with 'You should...' or 'The best next step for you is...'>",
-  "reasoning": "<3-4 simple sentences to {p.name}>",
-  "priority_actions": [
-    {{"step": 1, "action": "<what you should do>", "why": "<why this helps you>"}},
-    {{"step": 2, "action": "<next step for you>", "why": "<why this matters>"}},
-    {{"step": 3, "action": "<third step>", "why": "<reason>"}}
-  ],
-  "what_to_avoid": "<one sentence starting with 'Avoid...' or 'Do not...'>",
-  "documents_needed": ["<document>", "<document>", "<document>"],
-  "timeline_weeks": <number>,
-  "overall_risk_level": "low or medium or high"
-}}"""
-
-    return call_groq(prompt, max_tokens=500)
+    return await call_groq(prompts.DECISION.render(
+        name=p.name,
+        vulnerability=profile.get('financial_vulnerability', 'medium'),
+        surplus=profile.get('monthly_surplus_estimate_inr', 0),
+        top_schemes=', '.join([s['name'] for s in top_schemes]) if top_schemes else 'None found',
+        loan_label=loan.get('label', 'not assessed'),
+    ))
 
 
 @app.get("/")
@@ -437,141 +300,775 @@ def root():
 
 @app.get("/health")
 def health_check():
+    # Liveness only: answers as long as the process is serving requests.
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+def readiness_check():
+    # Local readiness only. Endpoints fall back to the cache and local rules
+    # while Groq is down, so its cached status is reported but does not fail
+    # the check; never calls Groq itself.
+    snapshot = upstream.snapshot()
+    ready = getattr(app.state, "started", False) and job_queue.ready
+    return JSONResponse(
+        {"ready": ready, "provider": "groq", "model": GROQ_MODEL, "upstream": snapshot,
+         "resilience": resilience_stats()},
+        status_code=200 if ready else 503,
+    )
+
+
+def profile_cache_key(endpoint: str, profile: FarmerProfile, exclude: set | None = None,
+                      extra: dict | None = None) -> str:
+    return make_key(endpoint, {**profile.model_dump(exclude=exclude), **(extra or {})})
+
+
+async def cached_response(namespace: str, key: str, labels: tuple[str, ...]) -> dict | None:
+    """
+    A fresh cache hit, or an expired one while the breakers of every model
+    the endpoint's prompts (`labels`) could be routed to are open.
+    """
+    with stage("cache"):
+        cached = await response_cache.get(namespace, key)
+        if cached is not None:
+            cached["meta"]["cache"] = "hit"
+        elif all(breakers[model].state == "open" for label in labels for model in route(label)):
+            cached = await response_cache.get_stale(namespace, key)
+            if cached is not None:
+                cached["meta"]["cache"] = "stale"
+    return cached
+
+
+async def or_fallback(stage: str, coro, fallback, used: list):
+    """
+    Await an LLM stage; if Groq is unavailable, record the stage and use the
+    local result. An incomplete answer keeps its usable fields and takes
+    the rest from the local result.
+    """
     try:
-        client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[{"role": "user", "content": "reply with {\"ok\":true}"}],
-            max_tokens=10,
-            response_format={"type": "json_object"},
-        )
-        return {"status": "healthy", "provider": "groq", "model": GROQ_MODEL}
-    except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}
+        return await coro
+    except UpstreamUnavailable:
+        used.append(stage)
+        return fallback()
+    except InvalidOutput as e:
+        used.append(stage)
+        local = fallback()
+        return {**local, **e.partial} if isinstance(local, dict) else local
+
+
+async def timed(stage: str, coro, timings: dict):
+    t0 = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[stage] = round((time.perf_counter() - t0) * 1000)
+
+
+ANALYSE_SECTIONS = ("farmer_name", "profile_summary", "scheme_recommendations",
+                    "loan_assessment", "final_decision", "meta")
+
+
+async def analyse_sections(profile: FarmerProfile, key: str):
+    """Yield (section, value) pairs of the /analyse response as each stage finishes."""
+    cached = await cached_response("analyse", key, ("profile", "schemes", "decision"))
+    if cached is not None:
+        # Names differing only in case or spacing share an entry; greet this submitter.
+        cached["farmer_name"] = profile.name
+        for section in ANALYSE_SECTIONS:
+            yield section, cached[section]
+        return
+
+    # Execution plan: the scheme and decision stages only need the local
+    # estimate, so they run as one chain alongside the profile call:
+    #   profile ──────────────────┐
+    #   schemes ──> decision ─────┴──> response
+    t0 = time.perf_counter()
+    timings = {}
+    degraded = []
+    models = track_models()
+    est = estimate_finances(profile)
+    loan = {"assessed": False, "label": "not_requested", "message": "Use the Loan Assessment tab."}
+    result = {"farmer_name": profile.name, "loan_assessment": loan}
+    yield "farmer_name", profile.name
+    yield "loan_assessment", loan
+
+    profile_task = asyncio.ensure_future(timed("profile", or_fallback(
+        "profile", build_financial_profile(profile),
+        lambda: fallbacks.financial_profile(profile, est), degraded), timings))
+    schemes_task = asyncio.ensure_future(timed("schemes", or_fallback(
+        "schemes", assess_schemes(profile, est),
+        lambda: local_schemes(profile, est), degraded), timings))
+
+    async def decide():
+        schemes = await schemes_task
+        return await timed("decision", or_fallback(
+            "decision", synthesise_decision(profile, est, schemes, loan),
+            lambda: fallbacks.decision(profile, est, schemes, loan), degraded), timings)
+
+    decision_task = asyncio.ensure_future(decide())
+    stages = {profile_task: "profile_summary", schemes_task: "scheme_recommendations",
+              decision_task: "final_decision"}
+    try:
+        pending = set(stages)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: ANALYSE_SECTIONS.index(stages[t])):
+                result[stages[task]] = task.result()
+                yield stages[task], result[stages[task]]
+    finally:
+        # Client disconnected or a stage failed: don't leave Groq calls running.
+        for task in stages:
+            task.cancel()
+    timings["total"] = round((time.perf_counter() - t0) * 1000)
+
+    result["meta"] = {"provider": "groq", "models": dict(models), "timings_ms": timings, "cache": "miss"}
+    if degraded:
+        result["meta"]["fallback"] = sorted(degraded)
+    yield "meta", result["meta"]
+    if not degraded:
+        await response_cache.set(key, {section: result[section] for section in ANALYSE_SECTIONS})
+
+
+def analyse_key(profile: FarmerProfile) -> str:
+    # The loan fields don't feed any of these prompts, so they stay out of the key;
+    # a new catalogue version can change the scheme advice, so it goes in.
+    return profile_cache_key("analyse", profile, exclude={"loan_purpose", "loan_amount_inr"},
+                             extra={"catalogue": catalogue.current().version})
 
 
 @app.post("/analyse", response_model=None)
-async def analyse(profile: FarmerProfile):
-    financial_profile = build_financial_profile(profile)
-    schemes = assess_schemes(profile, financial_profile)
-    loan = {"assessed": False, "label": "not_requested", "message": "Use the Loan Assessment tab."}
-    decision = synthesise_decision(profile, financial_profile, schemes, loan)
+async def analyse(profile: FarmerProfile, stream: Optional[StreamFormat] = None, lang: Language = "en",
+                  fields: Optional[str] = None):
+    tree = projection.parse(fields)
+    sections = analyse_sections(profile, analyse_key(profile))
+    if stream:
+        return stream_response(localize_events(project_events(sections, tree), lang), stream)
+    result = {section: value async for section, value in sections}
+    return await localize_response(project({section: result[section] for section in ANALYSE_SECTIONS}, tree), lang)
+
+
+class BatchRequest(BaseModel):
+    profiles: list[dict]
+
+
+async def analyse_one(profile: FarmerProfile, key: str) -> dict:
+    result = {section: value async for section, value in analyse_sections(profile, key)}
+    return {section: result[section] for section in ANALYSE_SECTIONS}
+
+
+async def batch_response(job, stream: Optional[StreamFormat], concurrency: int):
+    events = run_job(job, analyse_one, concurrency)
+    if stream:
+        return stream_response(events, stream)
+    async for _ in events:
+        pass
+    return {**job.status(), "results": results_by_row(job)}
+
+
+async def start_batch(profiles: list, rejected: list, stream: Optional[StreamFormat], concurrency: int):
+    rows = len(profiles) + len(rejected)
+    if rows > BATCH_MAX_PROFILES:
+        raise HTTPException(status_code=413, detail=f"Batch has {rows} rows. The limit is {BATCH_MAX_PROFILES}.")
+    if not profiles:
+        raise HTTPException(status_code=400, detail={"message": "No valid profiles in the batch.",
+                                                     "rejected_rows": rejected})
+    return await batch_response(jobs.open(profiles, analyse_key, rejected), stream, concurrency)
+
+
+@app.post("/analyse-batch", response_model=None)
+async def analyse_batch(
+    body: BatchRequest,
+    stream: Optional[StreamFormat] = None,
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_IN_FLIGHT),
+):
+    """
+    Analyse many farmers at once. Identical profiles are analysed once;
+    with ?stream= each farmer's result is sent as soon as it is ready.
+    Posting the same batch again resumes it.
+    """
+    profiles, rejected = validate_rows(list(enumerate(body.profiles)), FarmerProfile)
+    return await start_batch(profiles, rejected, stream, concurrency)
+
+
+@app.post("/analyse-batch/upload", response_model=None)
+async def analyse_batch_upload(
+    file: UploadFile = File(...),
+    stream: Optional[StreamFormat] = None,
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_IN_FLIGHT),
+):
+    """Same as /analyse-batch, from a CSV (header row = FarmerProfile fields), JSONL or JSON-list file."""
+    profiles, rejected = parse_upload(await file.read(), file.filename or "batch.csv", FarmerProfile)
+    return await start_batch(profiles, rejected, stream, concurrency)
+
+
+@app.get("/analyse-batch/{job_id}")
+def batch_status(job_id: str, results: bool = False):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch. Post it again to resume from the cache.")
+    status = job.status()
+    if results:
+        status["results"] = results_by_row(job)
+    return status
+
+
+@app.post("/analyse-batch/{job_id}/resume", response_model=None)
+async def batch_resume(
+    job_id: str,
+    stream: Optional[StreamFormat] = None,
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_IN_FLIGHT),
+):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch. Post it again to resume from the cache.")
+    return await batch_response(job, stream, concurrency)
+
+
+@app.get("/schemes", response_model=None)
+async def get_schemes(request: Request, lang: Language = "en", category: Optional[str] = None,
+                      state: Optional[str] = None, fields: Optional[str] = None):
+    """
+    The catalogue, optionally narrowed to a category or state or to some
+    fields. The full English list is served from the bytes built at load
+    time; each fully translated language is built once per catalogue version.
+    """
+    cat = catalogue.current()
+    tree = projection.parse(fields)
+    whole = not (category or state or tree)
+    if whole and lang == "en":
+        return catalogue.respond(request, cat.body)
+    body = cat.localized.get(lang) if whole else None
+    if body is None:
+        fallback = []
+        schemes = await localize(cat.schemes if whole else project(cat.select(category, state), tree),
+                                 lang, fallback)
+        body = catalogue.Body(schemes, f"{cat.version}-{lang}", best=whole)
+        if fallback:
+            # Partly English while Groq is down: clients should not keep it.
+            return catalogue.respond(request, body, max_age=0)
+        if whole:
+            cat.localized[lang] = body
+    return catalogue.respond(request, body)
+
+
+@app.get("/schemes/stats")
+def schemes_stats():
+    return catalogue.stats()
+
+
+class TranslateRequest(BaseModel):
+    texts: list[str] = Field(max_length=200)
+    lang: Language = "hi"
+
+
+@app.post("/translate")
+async def translate_texts(body: TranslateRequest):
+    """Translate the given strings (for the frontend's tap-to-translate), through the shared phrase cache."""
+    texts = [t.strip() for t in body.texts]
+    done, unavailable = await translation.translate(list(dict.fromkeys(t for t in texts if t)), body.lang)
+    result = {"lang": body.lang, "translations": [done.get(t, t) for t in texts]}
+    if unavailable:
+        result["fallback"] = ["translation"]
+    return result
+
+
+@app.get("/translate/stats")
+async def translate_stats():
+    return await translation.phrase_cache.stats()
+
+
+@app.get("/jobs/stats")
+async def jobs_stats():
+    return await job_queue.stats()
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = Query(0, ge=0, le=55)):
+    """Job state, timings and (once done) the result. wait=N long-polls up to N seconds."""
+    job = await job_queue.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    return job
+
+
+@app.get("/jobs/{job_id}/events", response_model=None)
+async def job_events(job_id: str, stream: StreamFormat = "sse"):
+    """Subscribe to a job: one status event now, then the finished job."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+
+    async def events():
+        current = job
+        yield "status", {k: v for k, v in current.items() if k != "result"}
+        while current["status"] not in FINISHED:
+            current = await job_queue.wait(job_id, 15)
+            if current["status"] not in FINISHED:
+                yield "status", current  # keeps idle proxies from closing the stream
+        yield "job", current
+
+    return stream_response(events(), stream)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return await response_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text format: request and stage histograms, tokens, cache, breaker, jobs."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/slow")
+def slow_requests():
+    """The latest requests over SLOW_REQUEST_MS, with their stage breakdown (newest first)."""
+    return {"threshold_ms": metrics.SLOW_REQUEST_MS or None, "requests": list(reversed(metrics.slow_requests))}
+
+
+@app.get("/llm/usage")
+def llm_usage():
+    """Tokens used per prompt since start, with each template's input budget and output cap."""
     return {
-        "farmer_name": profile.name,
-        "profile_summary": financial_profile,
-        "scheme_recommendations": schemes,
-        "loan_assessment": loan,
-        "final_decision": decision,
-        "meta": {"provider": "groq", "model": GROQ_MODEL}
+        "usage": token_usage.stats(),
+        "coalescing": in_flight.stats(),
+        "routes": {name: route(name) for name in [*prompts.TEMPLATES, "llm"]},
+        "hedging": hedging.stats(),
+        "templates": {name: {"static_tokens": t.static_tokens, "budget": t.budget or None,
+                             "max_tokens": t.max_tokens()}
+                      for name, t in prompts.TEMPLATES.items()},
     }
 
 
-@app.get("/schemes")
-def get_schemes():
-    return SCHEMES_DB
-
-
 @app.post("/assess-loan")
-async def assess_loan_endpoint(profile: FarmerProfile):
+async def assess_loan_endpoint(profile: FarmerProfile, lang: Language = "en", fields: Optional[str] = None):
     """1 Groq call — 2-4 seconds."""
+    return await localize_response(project(await assess_loan(profile), projection.parse(fields)), lang)
+
+
+async def assess_loan(profile: FarmerProfile) -> dict:
+    # The simulation starts from next month's repayment, so its month is part of the key.
+    start_month = simulation.next_month()
+    key = profile_cache_key("assess-loan", profile, extra={"first_repayment_month": start_month})
+    cached = await cached_response("assess-loan", key, ("loan",))
+    if cached is not None:
+        return cached
+
     try:
         print(f"[LOAN] {profile.name} | Rs.{profile.loan_amount_inr:,} for {profile.loan_purpose}")
-        loan = assess_loan_fast(profile)
+        sim = None
+        if profile.loan_purpose and profile.loan_amount_inr:
+            with stage("simulate"):
+                sim = simulation.simulate_loan(profile, start_month=start_month)
+        degraded = []
+        models = track_models()
+        loan = await or_fallback("loan", assess_loan_fast(profile, sim),
+                                 lambda: fallbacks.loan_assessment(profile, sim), degraded)
+        loan = with_simulation(loan, sim)
         print(f"[LOAN] Done: {loan.get('label', '?')} — {loan.get('label_display', '')}")
-        return {"loan_assessment": loan, "meta": {"provider": "groq", "model": GROQ_MODEL}}
+        result = {"loan_assessment": loan,
+                  "meta": {"provider": "groq", "model": models.get("loan"), "cache": "miss"}}
+        if degraded:
+            result["meta"]["fallback"] = degraded
+        else:
+            await response_cache.set(key, result)
+        return result
     except Exception as e:
         print(f"[LOAN ERROR] {str(e)}")
         raise HTTPException(status_code=500, detail=f"Assessment failed: {str(e)}")
 
 
+SWEEP_MAX_POINTS = int(os.environ.get("SWEEP_MAX_POINTS", "1000"))
+
+
+class Span(BaseModel):
+    """`steps` evenly spaced values from `min` to `max`, both included."""
+    min: float = Field(ge=0)
+    max: float = Field(ge=0)
+    steps: int = Field(1, ge=1, le=100)
+
+    def values(self) -> list[float]:
+        if self.steps == 1 or self.max == self.min:
+            return [self.min]
+        return [self.min + (self.max - self.min) * i / (self.steps - 1) for i in range(self.steps)]
+
+
+class LoanPoint(BaseModel):
+    amount_inr: float = Field(gt=0)
+    tenure_months: int = Field(ge=3, le=120)
+    annual_rate: float = Field(ge=0, le=0.6)
+
+
+class LoanSweepRequest(BaseModel):
+    profile: FarmerProfile
+    amount_inr: Optional[Span] = None  # default: Rs.10,000 up to twice the yearly income, 40 steps
+    tenure_months: Span = Span(min=12, max=60, steps=5)
+    annual_rate: Span = Span(min=DEFAULT_ANNUAL_RATE, max=DEFAULT_ANNUAL_RATE)
+    max_default_probability: float = Field(0.1, gt=0, lt=1)
+    explain: Optional[LoanPoint] = None  # the one point to explain with Groq
+
+
+def sweep_grid(req: LoanSweepRequest) -> tuple[list[float], list[int], list[float]]:
+    amounts = req.amount_inr or Span(min=10000, max=max(20000, req.profile.monthly_income_inr * 24), steps=40)
+    grid = (sorted({round(a, -2) for a in amounts.values() if a > 0}),
+            sorted({round(t) for t in req.tenure_months.values()}),
+            sorted({round(r, 4) for r in req.annual_rate.values()}))
+    if not grid[0]:
+        raise HTTPException(status_code=422, detail="amount_inr must include an amount above zero.")
+    if grid[1][0] < 3 or grid[1][-1] > 120 or grid[2][-1] > 0.6:
+        raise HTTPException(status_code=422, detail="Tenures must be 3-120 months and rates at most 0.6.")
+    if any(span.min > span.max for span in (amounts, req.tenure_months, req.annual_rate)):
+        raise HTTPException(status_code=422, detail="Each range needs min <= max.")
+    size = len(grid[0]) * len(grid[1]) * len(grid[2])
+    if size > SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"The grid has {size} points. The limit is {SWEEP_MAX_POINTS}.")
+    return grid
+
+
+def loan_choice_prompt(p: FarmerProfile, point: dict, sim: dict, max_safe: float | None) -> prompts.Rendered:
+    return prompts.LOAN_CHOICE.render(
+        name=p.name, state=p.state, crop_type=p.crop_type, income_type=p.income_type,
+        monthly=p.monthly_income_inr, household_size=p.household_size, amount=point["amount_inr"],
+        months=point["tenure_months"], annual_rate=point["annual_rate"], est_emi=point["monthly_emi"],
+        debt_ratio=point["debt_ratio"], surplus=point["surplus_inr"],
+        default_pct=round(point["default_probability"] * 100),
+        bad_season_pct=round(sim["default_probability_one_bad_season"] * 100),
+        reserve_p90=round(sim["reserve_needed_inr"]["p90"]),
+        max_safe=f"Rs.{max_safe:,}" if max_safe else "none in the range asked about",
+    )
+
+
+@app.post("/assess-loan/sweep")
+async def loan_sweep_endpoint(req: LoanSweepRequest, lang: Language = "en", fields: Optional[str] = None):
+    """
+    Every amount x tenure x rate in the ranges, evaluated locally in one
+    pass, with the largest safe amount per tenure and rate. Groq is called
+    once, and only when `explain` names a point to put into words.
+    """
+    return await localize_response(project(await loan_sweep(req), projection.parse(fields)), lang)
+
+
+async def loan_sweep(req: LoanSweepRequest) -> dict:
+    p = req.profile
+    amounts, tenures, rates = sweep_grid(req)
+    start_month = simulation.next_month()
+    key = None
+    if req.explain:
+        key = profile_cache_key("loan-sweep", p, extra={**req.model_dump(exclude={"profile"}),
+                                                        "first_repayment_month": start_month})
+        cached = await cached_response("loan-sweep", key, ("loan_choice",))
+        if cached is not None:
+            return cached
+
+    with stage("simulate"):
+        result = {"sweep": simulation.sweep(p, amounts, tenures, rates, req.max_default_probability,
+                                            start_month=start_month)}
+    result["meta"] = {"provider": "local", "points": len(result["sweep"]["points"]), "cache": "miss"}
+    if not req.explain:
+        return result
+
+    pick = req.explain
+    with stage("simulate"):
+        # The chosen point among the grid's amounts, for its limit at this tenure and rate.
+        line = simulation.sweep(p, sorted({*amounts, round(pick.amount_inr)}), [pick.tenure_months],
+                                [pick.annual_rate], req.max_default_probability, start_month=start_month)
+        sim = simulation.simulate_loan(p, pick.amount_inr, pick.annual_rate, pick.tenure_months,
+                                       start_month=start_month)
+    point = next(x for x in line["points"] if x["amount_inr"] == round(pick.amount_inr))
+    max_safe = line["frontier"][0]["max_safe_amount_inr"]
+    degraded = []
+    models = track_models()
+    explanation = await or_fallback("loan_choice", call_groq(loan_choice_prompt(p, point, sim, max_safe)),
+                                    lambda: fallbacks.loan_choice(point, max_safe), degraded)
+    result["chosen"] = {**point, "max_safe_amount_inr": max_safe, "explanation": explanation, "simulation": sim}
+    result["meta"].update({"provider": "groq", "model": models.get("loan_choice")})
+    if degraded:
+        result["meta"]["fallback"] = degraded
+    else:
+        await response_cache.set(key, result)
+    return result
+
+
+PLAN_ADVICE_KEYS = ("opening_advice", "harvest_strategy", "lean_season_strategy",
+                    "early_payoff_tip", "emergency_advice")
+PLAN_MONTH_BATCH = 12
+
+
+def repayment_prompt(profile: FarmerProfile, plan: dict) -> prompts.Rendered:
+    est_emi = plan["monthly_emi"]
+    payoff = plan["early_payoff"]
+    return prompts.REPAYMENT.render(
+        name=profile.name, loan_amount_inr=profile.loan_amount_inr, loan_purpose=profile.loan_purpose,
+        est_emi=est_emi, total_months=plan["total_months"], annual_rate=plan["annual_rate"],
+        monthly=profile.monthly_income_inr, income_type=profile.income_type, crop_type=profile.crop_type,
+        state=profile.state, household_exp=profile.household_size * 2500,
+        faster_emi=est_emi + payoff["extra_per_month"], interest_saved=payoff["interest_saved"],
+        months_saved=payoff["months_saved"],
+    )
+
+
+def apply_season_tips(months: list, tips: dict) -> list:
+    seen = {}
+    for row in months:
+        season_tips = tips.get(row["season"]) or [""]
+        n = seen.get(row["season"], 0)
+        row["tip"] = season_tips[n % len(season_tips)]
+        seen[row["season"]] = n + 1
+    return months
+
+
+async def repayment_events(profile: FarmerProfile, key: str, options: dict, start: datetime.date):
+    """
+    Yield the plan header (local, immediate), then month batches once the
+    seasonal tips have streamed in from Groq, then each advice field.
+    """
+    cached = await cached_response("repayment-plan", key, ("repayment",))
+    if cached is not None:
+        plan = cached["repayment_plan"]
+        months = plan.pop("monthly_breakdown")
+        yield "plan_header", {k: v for k, v in plan.items() if k not in PLAN_ADVICE_KEYS}
+        for i in range(0, len(months), PLAN_MONTH_BATCH):
+            yield "months", months[i:i + PLAN_MONTH_BATCH]
+        yield "advice", {k: plan.get(k) for k in PLAN_ADVICE_KEYS}
+        yield "meta", cached["meta"]
+        return
+
+    opts = {k: v for k, v in options.items() if k != "start"}
+    with stage("schedule"):
+        plan = build_schedule(profile.loan_amount_inr, start=start, months=opts.pop("tenure_months"), **opts)
+    months = plan.pop("monthly_breakdown")
+    header = {
+        "plan_title": f"Your {plan['total_months']}-Month Repayment Plan",
+        **plan,
+        "tenure_options": tenure_options(profile.loan_amount_inr, plan["annual_rate"], plan["method"]),
+    }
+    yield "plan_header", header
+
+    advice = {}
+    degraded = False
+    models = track_models()
+    parser = JSONFieldStream()
+    prompt = repayment_prompt(profile, {**plan, "monthly_breakdown": months})
+    try:
+        async for delta in stream_groq(prompt):
+            for field, value in parser.feed(delta):
+                if field == "season_tips" and isinstance(value, dict):
+                    apply_season_tips(months, value)
+                    for i in range(0, len(months), PLAN_MONTH_BATCH):
+                        yield "months", months[i:i + PLAN_MONTH_BATCH]
+                    advice["season_tips"] = True
+                elif field in PLAN_ADVICE_KEYS:
+                    advice[field] = value
+                    yield "advice", {field: value}
+    except UpstreamUnavailable:
+        # Raised before the first token, so nothing has been sent yet.
+        degraded = True
+        local = fallbacks.plan_advice(plan)
+        apply_season_tips(months, local["season_tips"])
+        for i in range(0, len(months), PLAN_MONTH_BATCH):
+            yield "months", months[i:i + PLAN_MONTH_BATCH]
+        advice = {"season_tips": True, **{k: local[k] for k in PLAN_ADVICE_KEYS}}
+        yield "advice", {k: local[k] for k in PLAN_ADVICE_KEYS}
+    missing = [k for k in ("season_tips", *PLAN_ADVICE_KEYS) if k not in advice]
+    if missing and advice:
+        # The stream stopped early: ask for just the fields it didn't reach,
+        # and take anything still missing from the local advice.
+        try:
+            extra = await call_groq(prompt.follow_up(missing))
+        except InvalidOutput as e:
+            extra = e.partial
+        except UpstreamUnavailable:
+            extra = {}
+        if any(k not in extra for k in missing):
+            degraded = True
+            extra = {**fallbacks.plan_advice(plan), **extra}
+        if "season_tips" in missing:
+            apply_season_tips(months, extra["season_tips"])
+            for i in range(0, len(months), PLAN_MONTH_BATCH):
+                yield "months", months[i:i + PLAN_MONTH_BATCH]
+            advice["season_tips"] = True
+        rest = {k: extra[k] for k in missing if k in PLAN_ADVICE_KEYS}
+        advice.update(rest)
+        if rest:
+            yield "advice", rest
+    if "season_tips" not in advice:
+        apply_season_tips(months, {})
+        for i in range(0, len(months), PLAN_MONTH_BATCH):
+            yield "months", months[i:i + PLAN_MONTH_BATCH]
+
+    meta = {"provider": "groq", "model": models.get("repayment"), "cache": "miss"}
+    if degraded:
+        meta["fallback"] = ["advice"]
+    yield "meta", meta
+    if not degraded:
+        result = {**header, "monthly_breakdown": months, **{k: advice.get(k) for k in PLAN_ADVICE_KEYS}}
+        await response_cache.set(key, {"repayment_plan": result, "meta": meta})
+
+
 @app.post("/repayment-plan")
-async def repayment_plan_endpoint(profile: FarmerProfile):
-    """Generate a detailed month-by-month repayment plan. ~1 Groq call."""
+async def repayment_plan_endpoint(
+    profile: FarmerProfile,
+    tenure_months: int = Query(DEFAULT_TENURE_MONTHS, ge=3, le=120),
+    annual_rate: float = Query(DEFAULT_ANNUAL_RATE, ge=0, le=0.6),
+    method: Literal["reducing", "flat"] = "reducing",
+    balloon_pct: float = Query(0.0, ge=0, lt=1),
+    harvest_extra_inr: float = Query(0.0, ge=0),
+    stream: Optional[StreamFormat] = None,
+    background: bool = False,
+    lang: Language = "en",
+    fields: Optional[str] = None,
+):
+    """
+    Month-by-month plan computed locally; 1 small Groq call for seasonal tips.
+    background=true returns a job id at once (202); poll GET /jobs/{job_id}.
+    """
     if not profile.loan_purpose or not profile.loan_amount_inr:
         raise HTTPException(status_code=400, detail="Loan purpose and amount required")
 
-    est_emi = round(profile.loan_amount_inr * 0.03)
-    household_exp = profile.household_size * 2500
-    tenure = 36  # default 3 years
-
-    prompt = f"""Create a simple, practical repayment plan for {profile.name}. Speak to them directly.
-Warm, friendly tone — like a helpful advisor who cares about them.
-
-THEIR LOAN: Rs.{profile.loan_amount_inr:,.0f} for "{profile.loan_purpose}"
-Monthly repayment: Rs.{est_emi:,}
-Income: Rs.{profile.monthly_income_inr:,.0f}/month ({profile.income_type})
-Crop: {profile.crop_type} in {profile.state}
-Household costs: Rs.{household_exp:,}/month
-
-Generate a {tenure}-month plan. Vary monthly tips by season:
-- Kharif season (Jun-Nov): sowing, growing, harvest for most crops
-- Rabi season (Nov-Apr): second crop season
-- Summer (Mar-May): lean period for most farmers
-
-Return this JSON:
-{{
-  "plan_title": "Your {tenure}-Month Repayment Plan",
-  "monthly_emi": {est_emi},
-  "total_months": {tenure},
-  "total_interest_estimate": <estimate at 12% annual>,
-  "total_paid": <loan + interest>,
-  "opening_advice": "<2 warm sentences to {profile.name} about starting this journey>",
-  "monthly_breakdown": [
-    {{
-      "month": 1,
-      "emi_due": {est_emi},
-      "season": "sowing or growing or harvest or lean",
-      "tip": "<one practical tip for this month>"
-    }}
-  ],
-  "harvest_strategy": "<2 sentences: how to use harvest money to pay extra and finish faster>",
-  "lean_season_strategy": "<2 sentences: how to manage during low-income months>",
-  "early_payoff_tip": "<1 sentence: what you save by paying Rs.{est_emi + 500} instead of Rs.{est_emi}>",
-  "emergency_advice": "<1 honest sentence: what to do if you miss a payment>"
-}}
-
-Include all {tenure} months in monthly_breakdown. Make tips specific and practical for {profile.crop_type} farming."""
-
-    result = call_groq(prompt, max_tokens=2500)
-    return {"repayment_plan": result, "meta": {"provider": "groq", "model": GROQ_MODEL}}
+    start = datetime.date.today()
+    options = {"tenure_months": tenure_months, "annual_rate": annual_rate, "method": method,
+               "balloon_pct": balloon_pct, "harvest_extra_inr": harvest_extra_inr,
+               "start": start.strftime("%Y-%m")}
+    key = profile_cache_key("repayment-plan", profile,
+                            exclude={"land_acres", "risk_exposure", "existing_debt_inr"}, extra=options)
+    tree = projection.parse(fields)
+    if stream:
+        return stream_response(localize_events(project_events(
+            repayment_events(profile, key, options, start), tree), lang), stream)
+    if background:
+        return JSONResponse(await job_queue.submit("repayment-plan", lambda: localized(
+            projected(repayment_plan(profile, key, options, start), tree), lang)), status_code=202)
+    return await localize_response(project(await repayment_plan(profile, key, options, start), tree), lang)
+
+
+async def repayment_plan(profile: FarmerProfile, key: str, options: dict, start: datetime.date) -> dict:
+    cached = await cached_response("repayment-plan", key, ("repayment",))
+    if cached is not None:
+        return cached
+
+    tenure_months, annual_rate, method = options["tenure_months"], options["annual_rate"], options["method"]
+    balloon_pct, harvest_extra_inr = options["balloon_pct"], options["harvest_extra_inr"]
+    with stage("schedule"):
+        plan = build_schedule(profile.loan_amount_inr, annual_rate, tenure_months, method,
+                              balloon_pct, harvest_extra_inr, start)
+    degraded = []
+    models = track_models()
+    advice = await or_fallback("advice", call_groq(repayment_prompt(profile, plan)),
+                               lambda: fallbacks.plan_advice(plan), degraded)
+    apply_season_tips(plan["monthly_breakdown"], advice.get("season_tips") or {})
+
+    result = {
+        "plan_title": f"Your {plan['total_months']}-Month Repayment Plan",
+        **plan,
+        **{k: advice.get(k) for k in PLAN_ADVICE_KEYS},
+        "tenure_options": tenure_options(profile.loan_amount_inr, annual_rate, method),
+    }
+    response = {"repayment_plan": result,
+                "meta": {"provider": "groq", "model": models.get("repayment"), "cache": "miss"}}
+    if degraded:
+        response["meta"]["fallback"] = degraded
+    else:
+        await response_cache.set(key, response)
+    return response
 
-@app.post("/analyse-document")
-async def analyse_document(file: UploadFile = File(...)):
-    """Analyse a loan agreement or financial document for risks."""
-    try:
-        content = await file.read()
-        filename = file.filename or "document"
-        ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
 
-        # Extract text based on file type
-        raw_text = ""
+def document_prompt(text: str, part: str = "document ") -> prompts.Rendered:
+    return prompts.DOCUMENT.render(text=text, part=part)
 
-        if ext in ["txt", "md"]:
-            raw_text = content.decode("utf-8", errors="ignore")
 
-        elif ext == "pdf":
-            try:
-                import io
-                import pdfplumber
-                with pdfplumber.open(io.BytesIO(content)) as pdf:
-                    raw_text = "\n".join(
-                        page.extract_text() or "" for page in pdf.pages
-                    )
-            except ImportError:
-                # fallback: try raw decode
-                raw_text = content.decode("utf-8", errors="ignore")[:8000]
-
-        elif ext in ["doc", "docx"]:
+def sent_chars(prompt: prompts.Rendered, text: str) -> int:
+    """How much of `text` reached the model: the DOCUMENT budget cuts off what does not fit."""
+    sent = prompt.values["text"]
+    return len(text) if sent == text else len(sent.removesuffix(" [...]"))
+
+
+# The longest chunk the DOCUMENT budget carries whole, at a cautious 3.5
+# characters per token (loan agreements run about 4).
+_CHUNK_TEXT_TOKENS = (prompts.DOCUMENT.budget - prompts.DOCUMENT.static_tokens
+                      - prompts.count_tokens("section (999 of 999) of a longer document "))
+DOC_CHUNK_MAX_CHARS = max(1000, int(_CHUNK_TEXT_TOKENS * 3.5) // 500 * 500)
+
+
+async def analyse_chunks(chunk_prompts: list[prompts.Rendered], parallelism: int) -> list[dict | None]:
+    """
+    Map step of the long-document mode: one Groq call per chunk, at most
+    `parallelism` at a time. Once Groq is unavailable the chunks still
+    pending are cancelled; their entries stay None and the caller reduces
+    over the rest.
+    """
+    slots = asyncio.Semaphore(parallelism)
+    parts: list[dict | None] = [None] * len(chunk_prompts)
+
+    async def one(i: int, prompt: prompts.Rendered) -> None:
+        async with slots:
             try:
-                import io
-                import docx
-                doc = docx.Document(io.BytesIO(content))
-                raw_text = "\n".join(p.text for p in doc.paragraphs)
-            except Exception:
-                raw_text = content.decode("utf-8", errors="ignore")[:8000]
+                parts[i] = await call_groq(prompt)
+            except InvalidOutput as e:
+                parts[i] = e.partial  # the other sections fill in what this one lacks
 
-        else:
-            # Try plain text decode for anything else
-            raw_text = content.decode("utf-8", errors="ignore")[:8000]
+    try:
+        async with asyncio.TaskGroup() as group:
+            for i, prompt in enumerate(chunk_prompts):
+                group.create_task(one(i, prompt))
+    except* UpstreamUnavailable:
+        pass
+    return parts
+
+
+@app.post("/analyse-document")
+async def analyse_document(
+    file: UploadFile = File(...),
+    mode: Literal["quick", "full"] = "quick",
+    chunk_chars: int = Query(min(DOC_CHUNK_CHARS, DOC_CHUNK_MAX_CHARS), ge=1000, le=DOC_CHUNK_MAX_CHARS),
+    parallelism: int = Query(DOC_CHUNK_CONCURRENCY, ge=1, le=16),
+    background: bool = False,
+    lang: Language = "en",
+    fields: Optional[str] = None,
+):
+    """
+    Analyse a loan agreement or financial document for risks.
+    mode=quick reads the first DOC_MAX_CHARS; mode=full reads up to
+    DOC_FULL_MAX_CHARS in overlapping chunks analysed in parallel, each
+    small enough (DOC_CHUNK_MAX_CHARS) to reach the model whole.
+    background=true returns a job id at once (202); poll GET /jobs/{job_id}.
+    """
+    filename = file.filename or "document"
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    tree = projection.parse(fields)
+    path, size, sha256 = await spool_upload(file)
+    if not background:
+        return await localize_response(project(
+            await analyse_spooled(path, size, sha256, filename, ext, mode, chunk_chars, parallelism), tree), lang)
+    try:
+        job = await job_queue.submit("analyse-document", lambda: localized(projected(analyse_spooled(
+            path, size, sha256, filename, ext, mode, chunk_chars, parallelism), tree), lang))
+    except BaseException:
+        os.unlink(path)
+        raise
+    return JSONResponse(job, status_code=202)
+
+
+async def analyse_spooled(path: str, size: int, sha256: str, filename: str, ext: str,
+                          mode: str, chunk_chars: int, parallelism: int) -> dict:
+    """The analysis proper, on an upload already spooled to `path`; removes the file when done."""
+    try:
+        t0 = time.perf_counter()
+        key = make_key("analyse-document", {"sha256": sha256, "ext": ext, "mode": mode,
+                                            "chunk_chars": chunk_chars if mode == "full" else None})
+        cached = await cached_response("analyse-document", key, ("document",))
+        if cached is not None:
+            cached["analysis"]["filename"] = filename
+            return cached
+
+        extracted = await extract_in_pool(path, ext, DOC_FULL_MAX_CHARS if mode == "full" else DOC_SCAN_MAX_CHARS)
+        raw_text = extracted["text"]
+        metrics.record_stage("extract", time.perf_counter() - t0)
+        timings = {"extract": round((time.perf_counter() - t0) * 1000)}
+        t1 = time.perf_counter()
+        with stage("scan"):
+            scanned = scan(raw_text)
+        timings["scan"] = round((time.perf_counter() - t1) * 1000, 1)
 
         if not raw_text.strip():
             raise HTTPException(
@@ -579,88 +1076,71 @@ async def analyse_document(file: UploadFile = File(...)):
                 detail="Could not extract text from this file. Try a PDF or text file."
             )
 
-        # Truncate to avoid token limits
-        text_snippet = raw_text[:6000]
-
-        prompt = f"""You are an expert at analysing loan agreements and financial documents to protect Indian farmers from predatory lending.
-
-Carefully read this document and identify ALL risks, hidden clauses, and red flags that could harm a farmer.
-
-DOCUMENT TEXT:
----
-{text_snippet}
----
-
-Be thorough. Look for:
-- Hidden fees, charges, or penalties
-- Variable/floating interest rates disguised in fine print
-- Balloon payments or lump sum demands
-- Collateral clauses that could cause land loss
-- Automatic renewal traps
-- Prepayment penalties
-- Cross-collateralisation (linking multiple assets)
-- Vague or ambiguous language that favours the lender
-- Unrealistic repayment schedules
-- Clauses waiving legal rights
-- Personal guarantee requirements
-- Insurance requirements that benefit lender only
-- Grace period absence
-- Compound interest hidden as flat rate
-
-Return this JSON:
-{{
-  "document_type": "<type of document e.g. Loan Agreement, Promissory Note, Mortgage Deed>",
-  "overall_risk": "low or medium or high or critical",
-  "risk_summary": "<2-3 plain sentences summarising the main danger level for a farmer>",
-  "danger_score": <0-100 where 100 is most dangerous>,
-  "red_flags": [
-    {{
-      "title": "<short name of the issue>",
-      "severity": "low or medium or high or critical",
-      "clause_text": "<exact or near-exact quote from the document if found, else null>",
-      "plain_explanation": "<explain in simple words what this means for the farmer>",
-      "potential_impact": "<what could happen to the farmer because of this>",
-      "recommendation": "<what the farmer should do about this>"
-    }}
-  ],
-  "green_flags": [
-    {{
-      "title": "<something fair or farmer-friendly>",
-      "explanation": "<why this is good>"
-    }}
-  ],
-  "key_terms": {{
-    "interest_rate": "<rate found or null>",
-    "tenure": "<loan period found or null>",
-    "emi_amount": "<monthly payment found or null>",
-    "collateral": "<what is pledged or null>",
-    "processing_fee": "<fee found or null>",
-    "prepayment_penalty": "<penalty found or null>",
-    "late_payment_penalty": "<penalty found or null>"
-  }},
-  "questions_to_ask_lender": [
-    "<specific question the farmer should ask before signing>",
-    "<another important question>",
-    "<another important question>"
-  ],
-  "verdict": "<one honest sentence: should the farmer sign this, negotiate, or walk away?>",
-  "immediate_actions": [
-    "<most urgent thing to do right now>",
-    "<second action>",
-    "<third action>"
-  ]
-}}"""
-
-        result = call_groq(prompt, max_tokens=2000)
+        t1 = time.perf_counter()
+        degraded = []
+        models = track_models()
+        if mode == "full":
+            chunks = chunk_text(raw_text, chunk_chars)
+            chunk_prompts = [document_prompt(c, f"section ({i + 1} of {len(chunks)}) of a longer document ")
+                             for i, c in enumerate(chunks)]
+            parts = await analyse_chunks(chunk_prompts, parallelism)
+            missing = [i + 1 for i, part in enumerate(parts) if part is None]
+            with stage("post"):
+                if len(missing) == len(chunks):
+                    degraded.append("document")
+                    result = fallbacks.document_analysis(scanned)
+                else:
+                    result = merge_analyses(parts)
+                    if missing:
+                        # Sections Groq did not get to are covered by the scanner only.
+                        degraded.append("document_chunks")
+                        result["chunks_missing"] = missing
+            # Chunk ends the budget cut off, and chunks Groq never answered, were not read.
+            unread = sum(len(c) - (sent_chars(prompt, c) if part is not None else 0)
+                         for c, prompt, part in zip(chunks, chunk_prompts, parts))
+            analysed_chars = max(0, len(raw_text) - unread)
+        else:
+            text_snippet = raw_text[:DOC_MAX_CHARS]
+            if len(raw_text) > DOC_MAX_CHARS and scanned["hits"]:
+                # Opening of the document plus the flagged clauses from the rest of it.
+                opening = raw_text[:DOC_MAX_CHARS * 3 // 5]
+                excerpts = relevant_excerpts(raw_text, scanned["hits"], DOC_MAX_CHARS - len(opening), len(opening))
+                if excerpts:
+                    text_snippet = f"{opening}\n\nFLAGGED CLAUSES FROM LATER IN THE DOCUMENT:\n{excerpts}"
+            chunks = [text_snippet]
+            missing = []
+            prompt = document_prompt(text_snippet)
+            result = await or_fallback("document", call_groq(prompt),
+                                       lambda: fallbacks.document_analysis(scanned), degraded)
+            analysed_chars = sent_chars(prompt, text_snippet)
+        with stage("post"):
+            apply_scan(result, scanned)
+        timings["llm"] = round((time.perf_counter() - t1) * 1000)
+        timings["total"] = round((time.perf_counter() - t0) * 1000)
         result["filename"] = filename
-        result["file_size_kb"] = round(len(content) / 1024, 1)
+        result["file_size_kb"] = round(size / 1024, 1)
         result["text_extracted"] = len(raw_text) > 0
-        result["characters_analysed"] = len(text_snippet)
-
-        return {"analysis": result, "meta": {"provider": "groq", "model": GROQ_MODEL}}
+        result["characters_analysed"] = analysed_chars
+        result["characters_scanned"] = len(raw_text)
+        result["chunks_analysed"] = len(chunks) - len(missing)
+        result["pages_read"] = extracted["pages_read"]
+        result["total_pages"] = extracted["total_pages"]
+        result["whole_document_read"] = extracted["complete"] and analysed_chars >= len(raw_text)
+        result["coverage_pct"] = coverage_pct(extracted, analysed_chars, size)
+
+        response = {"analysis": result,
+                    "meta": {"provider": "groq", "model": models.get("document"), "timings_ms": timings,
+                             "cache": "miss"}}
+        if degraded:
+            response["meta"]["fallback"] = degraded
+        else:
+            await response_cache.set(key, response)
+        return response
 
     except HTTPException:
         raise
     except Exception as e:
         print(f"[DOC ANALYSIS ERROR] {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    finally:
+        os.unlink(path)
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Latency histograms per endpoint and stage, exported in the Prometheus text
+format on GET /metrics.
+
+The hot path only does a bisect and two additions per observation; there is
+no client library and no background thread. Counters that already live
+elsewhere (tokens, cache hits, the breaker, the job queue) are read by
+collectors at scrape time instead of being updated on every request.
+
+Stages are timed with `with stage("parse"):` (or record_stage) anywhere
+under a request. MetricsMiddleware opens a Trace per request in a
+contextvar, so a stage lands under the endpoint that caused it, including
+from tasks the request spawned. With SLOW_REQUEST_MS set, requests slower
+than that print a [SLOW] line with their stage breakdown, and the last
+SLOW_REQUEST_KEEP of them are kept for GET /metrics/slow.
+"""
+import bisect
+import contextvars
+import os
+import resource
+import sys
+import time
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_KEEP = int(os.environ.get("SLOW_REQUEST_KEEP", "50"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, n: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + n
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self.values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help, labels, buckets
+        self.values: dict[tuple, list] = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labels) -> None:
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * (len(self.buckets) + 2)
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        for key, row in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {round(row[-2], 6)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {row[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("sahyog_request_seconds", "Request latency, until the last body byte.",
+                            ("endpoint", "method", "status"))
+STAGE_SECONDS = Histogram("sahyog_stage_seconds", "Time spent per stage of a request.", ("endpoint", "stage"))
+LLM_RETRIES = Counter("sahyog_llm_retries_total", "Groq calls retried, by reason.", ("reason",))
+LLM_FALLBACKS = Counter("sahyog_llm_fallbacks_total", "Groq calls moved off an unavailable model.",
+                        ("prompt", "model"))
+IN_FLIGHT = {"requests": 0}
+
+_metrics = [REQUEST_SECONDS, STAGE_SECONDS, LLM_RETRIES, LLM_FALLBACKS]
+_collectors: list[Callable[[], list[str]]] = []
+
+
+def collector(fn: Callable[[], list[str]]) -> Callable[[], list[str]]:
+    """Register a function returning exposition lines, called on every scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+def gauge_lines(name: str, help: str, values: dict, label: str | None = None, kind: str = "gauge") -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for key, value in values.items():
+        lines.append(f'{name}{{{label}="{key}"}} {value}' if label else f"{name} {value}")
+    return lines
+
+
+@collector
+def process_metrics() -> list[str]:
+    # Current RSS from /proc where there is one; the peak works everywhere
+    # (ru_maxrss is in KiB on Linux, bytes on macOS).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    values = {"process_max_resident_memory_bytes": peak if sys.platform == "darwin" else peak * 1024}
+    try:
+        with open("/proc/self/statm") as f:
+            values["process_resident_memory_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    lines = []
+    for name, value in values.items():
+        lines += gauge_lines(name, "Memory of this worker process.", {None: value})
+    return lines
+
+
+def render() -> str:
+    lines = gauge_lines("sahyog_requests_in_flight", "HTTP requests being served.", {None: IN_FLIGHT["requests"]})
+    for metric in _metrics:
+        lines += metric.render()
+    for fn in _collectors:
+        lines += fn()
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    __slots__ = ("_endpoint", "scope", "resolve", "stages")
+
+    def __init__(self, endpoint: str | None = None, scope: dict | None = None, resolve: Callable | None = None):
+        self._endpoint = endpoint
+        self.scope, self.resolve = scope, resolve
+        self.stages: dict[str, float] = {}
+
+    @property
+    def endpoint(self) -> str:
+        if self._endpoint is None:
+            if self.scope is None or "endpoint" not in self.scope:
+                return "unmatched"  # not routed yet
+            self._endpoint = self.resolve(self.scope)
+        return self._endpoint
+
+
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+slow_requests: deque = deque(maxlen=SLOW_REQUEST_KEEP)
+
+
+def start_trace(endpoint: str) -> contextvars.Token:
+    """For work outside a request, e.g. a background job."""
+    return _trace.set(Trace(endpoint))
+
+
+def end_trace(token: contextvars.Token) -> None:
+    _trace.reset(token)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    trace = _trace.get()
+    endpoint = trace.endpoint if trace else "background"
+    STAGE_SECONDS.observe(seconds, endpoint, name)
+    if trace is not None:
+        # Concurrent stages (e.g. the parallel LLM calls of /analyse) add up here.
+        trace.stages[name] = trace.stages.get(name, 0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+class MetricsMiddleware:
+    """Pure ASGI, so streamed responses are timed to their last chunk."""
+
+    def __init__(self, app):
+        self.app = app
+        self.paths: dict = {}
+
+    def _endpoint(self, scope) -> str:
+        # Route templates, not raw paths, so /jobs/{job_id} is one series.
+        endpoint = scope.get("endpoint")
+        if endpoint not in self.paths:
+            app = scope.get("app")
+            for route in getattr(app, "routes", []):
+                self.paths.setdefault(getattr(route, "endpoint", None), getattr(route, "path", None))
+        return self.paths.get(endpoint) or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        trace = Trace(scope=scope, resolve=self._endpoint)
+        token = _trace.set(trace)
+        status = [500]
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        IN_FLIGHT["requests"] += 1
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            IN_FLIGHT["requests"] -= 1
+            _trace.reset(token)
+            elapsed = time.perf_counter() - t0
+            REQUEST_SECONDS.observe(elapsed, trace.endpoint, scope["method"], status[0])
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                sample = {"endpoint": trace.endpoint, "method": scope["method"], "status": status[0],
+                          "ms": round(elapsed * 1000), "at": time.time(),
+                          "stages_ms": {k: round(v * 1000, 1) for k, v in trace.stages.items()}}
+                slow_requests.append(sample)
+                print(f"[SLOW] {scope['method']} {trace.endpoint} {sample['ms']}ms "
+                      + " ".join(f"{k}={v}" for k, v in sample["stages_ms"].items()))
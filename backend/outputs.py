@@ -0,0 +1,253 @@
+"""
+What each prompt asks Groq to return, as Pydantic models, and the repair
+path for answers that do not match.
+
+A truncated answer (max_tokens reached mid-object) is closed off at the
+last complete value by repair_json(), so everything the model did finish
+is kept. check_output() then names the top-level fields that are missing
+or malformed; invalid entries of a list are dropped rather than failing
+the field. call_groq() asks again for just those fields (see
+PromptTemplate.follow_up), and the endpoint fills whatever is still
+missing from its local fallback.
+
+Models are deliberately lenient (free strings instead of enums, extra keys
+allowed): they catch truncation and wrong shapes, not wording.
+"""
+import json
+from collections import defaultdict
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+Number = int | float
+
+
+class LLMOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class ExpenseItem(LLMOutput):
+    label: str
+    value: Number
+
+
+class RiskScore(LLMOutput):
+    label: str
+    score: Number
+    description: str = ""
+
+
+class IncomeVsExpense(LLMOutput):
+    income: Number
+    expenses: Number
+    surplus: Number
+
+
+class FinancialProfile(LLMOutput):
+    income_pattern: str
+    income_stability: str
+    debt_load: str
+    monthly_surplus_estimate_inr: Number
+    financial_vulnerability: str
+    confidence: str
+    confidence_reason: str
+    key_financial_risks: list[str]
+    profile_summary: str
+    expense_breakdown: list[ExpenseItem]
+    risk_scores: list[RiskScore]
+    income_vs_expense: IncomeVsExpense
+
+
+class SchemeAdvice(LLMOutput):
+    scheme_id: str
+    suitability: str
+    suitability_label: str
+    reason: str
+    benefit_effort_score: Number
+    priority: Number
+    action_required: str
+
+
+class SchemeList(LLMOutput):
+    schemes: list[SchemeAdvice]
+
+
+class RiskFactor(LLMOutput):
+    factor: str
+    severity: str
+    impact: str = ""
+    mitigation: str = ""
+
+
+class LoanAssessment(LLMOutput):
+    assessed: bool
+    label: str
+    label_display: str
+    overall_reasoning: str
+    key_metrics: dict
+    repayment_analysis: dict
+    cash_flow_analysis: dict
+    debt_burden_analysis: dict
+    income_shock_resilience: dict
+    loan_purpose_evaluation: dict
+    risk_factors: list[RiskFactor]
+    green_flags: list[str]
+    red_flags: list[str]
+    recommendations: dict
+    repayment_plan_preview: dict
+    confidence: str
+    confidence_reason: str
+
+
+class PriorityAction(LLMOutput):
+    step: Number
+    action: str
+    why: str = ""
+
+
+class Decision(LLMOutput):
+    recommendation: str
+    headline: str
+    reasoning: str
+    priority_actions: list[PriorityAction]
+    what_to_avoid: str
+    documents_needed: list[str]
+    timeline_weeks: Number
+    overall_risk_level: str
+
+
+class SeasonTips(LLMOutput):
+    sowing: list[str]
+    growing: list[str]
+    harvest: list[str]
+    lean: list[str]
+
+
+class RepaymentAdvice(LLMOutput):
+    opening_advice: str
+    season_tips: SeasonTips
+    harvest_strategy: str
+    lean_season_strategy: str
+    early_payoff_tip: str
+    emergency_advice: str
+
+
+class LoanChoice(LLMOutput):
+    headline: str
+    explanation: str
+    tips: list[str]
+
+
+class RedFlag(LLMOutput):
+    title: str
+    severity: str
+    clause_text: str | None = None
+    plain_explanation: str = ""
+    potential_impact: str = ""
+    recommendation: str = ""
+
+
+class GreenFlag(LLMOutput):
+    title: str
+    explanation: str = ""
+
+
+class DocumentAnalysis(LLMOutput):
+    document_type: str | None
+    overall_risk: str
+    risk_summary: str
+    danger_score: Number
+    red_flags: list[RedFlag]
+    green_flags: list[GreenFlag]
+    key_terms: dict[str, str | None]
+    questions_to_ask_lender: list[str]
+    verdict: str
+    immediate_actions: list[str]
+
+
+class Translations(LLMOutput):
+    """Keys are the phrase numbers sent; any that are missing stay in English."""
+
+
+def repair_json(text: str):
+    """
+    Parse `text`, or if it was cut off, the longest prefix that ends on a
+    complete value, with its open strings, arrays and objects closed.
+    Returns None when not even that parses.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    text = text[start:]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    # One pass to find the cut points: just before a ',' and just after a
+    # closing bracket, each with the brackets still open there.
+    closers, cuts = [], []
+    in_string = escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if closers:
+                closers.pop()
+            cuts.append((i + 1, "".join(reversed(closers))))
+            if not closers:
+                break
+        elif ch == ",":
+            cuts.append((i, "".join(reversed(closers))))
+
+    for end, close in reversed(cuts[-64:]):
+        try:
+            return json.loads(text[:end] + close)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def check_output(model: type[LLMOutput], data, only: tuple = ()) -> tuple[dict, list[str]]:
+    """
+    Return (usable part of `data`, top-level fields still needed). Invalid
+    list entries are dropped; a field is needed when it is absent, has the
+    wrong shape, or every entry of its list was invalid. With `only`, just
+    those fields are expected.
+    """
+    if not isinstance(data, dict):
+        return {}, [name for name, f in model.model_fields.items()
+                    if f.is_required() and (not only or name in only)]
+    try:
+        model.model_validate(data)
+        return data, []
+    except ValidationError as e:
+        errors = [err for err in e.errors() if not only or err["loc"][0] in only]
+
+    bad_fields, bad_items = set(), defaultdict(set)
+    for err in errors:
+        loc = err["loc"]
+        if len(loc) > 1 and isinstance(loc[1], int) and isinstance(data.get(loc[0]), list):
+            bad_items[loc[0]].add(loc[1])
+        else:
+            bad_fields.add(loc[0])
+    usable = dict(data)
+    for name, indexes in bad_items.items():
+        kept = [item for i, item in enumerate(data[name]) if i not in indexes]
+        if kept and name not in bad_fields:
+            usable[name] = kept
+        else:
+            bad_fields.add(name)
+    for name in bad_fields:
+        usable.pop(name, None)
+    needed = [name for name, f in model.model_fields.items()
+              if (name in bad_fields or (name not in usable and f.is_required())) and (not only or name in only)]
+    return usable, needed
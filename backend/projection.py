@@ -0,0 +1,52 @@
+"""
+?fields= projection of API responses, so mobile clients can ask for only
+what a screen shows.
+
+`fields` is a comma-separated list of dotted paths into the response, e.g.
+`?fields=final_decision,scheme_recommendations.name,scheme_recommendations.priority`.
+A path through a list applies to each item. `meta` is always kept, since
+it says whether the answer is cached or partly filled locally. Unknown
+paths are ignored.
+"""
+from fastapi import HTTPException
+
+FIELDS_MAX = 50
+
+
+def parse(fields: str | None) -> dict | None:
+    """The paths as a tree ({"a": {"b": {}}}); None when every field is wanted."""
+    if not fields:
+        return None
+    paths = [p.strip() for p in fields.split(",") if p.strip()]
+    if len(paths) > FIELDS_MAX:
+        raise HTTPException(status_code=422, detail=f"At most {FIELDS_MAX} fields can be selected.")
+    tree: dict = {"meta": {}}
+    for path in paths:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def project(value, tree: dict | None):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {k: project(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+
+async def projected(coro, tree: dict | None):
+    """Await an endpoint's result and project it; for work handed to the job queue."""
+    return project(await coro, tree)
+
+
+async def project_events(events, tree: dict | None):
+    """Streamed sections outside the selection are not sent; the rest are projected."""
+    async for event, data in events:
+        if tree is None:
+            yield event, data
+        elif event in tree:
+            yield event, project(data, tree[event])
@@ -0,0 +1,574 @@
+"""
+Prompt templates with token budgets.
+
+Each template is compiled once at import: the static instructions and the
+JSON schema are joined and whitespace-compacted into a single format
+string, and the schema's token count is measured then, so max_tokens is
+sized from the response shape instead of hard-coded per call. render()
+caps free-text inputs, trims the bulky fields (document text, scheme
+details) to what is left of the template's input budget, and returns the
+prompt with its estimated token count.
+
+Tokens are counted locally: with tiktoken installed its cl100k encoding is
+used (close to Llama 3's tokenizer), otherwise a word/punctuation estimate.
+The budgets of the trimmed prompts can be overridden with
+PROMPT_BUDGET_<NAME>, e.g. PROMPT_BUDGET_DOCUMENT.
+"""
+import math
+import os
+import re
+from typing import NamedTuple
+
+import outputs
+from metrics import stage
+
+# Headroom over the expected answer size before a response would be cut off.
+PROMPT_OUTPUT_SLACK = float(os.environ.get("PROMPT_OUTPUT_SLACK", "1.3"))
+PROMPT_SENTENCE_TOKENS = int(os.environ.get("PROMPT_SENTENCE_TOKENS", "24"))
+PROMPT_FIELD_MAX_TOKENS = int(os.environ.get("PROMPT_FIELD_MAX_TOKENS", "64"))
+PROMPT_MAX_OUTPUT_TOKENS = int(os.environ.get("PROMPT_MAX_OUTPUT_TOKENS", "4000"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or no cached encoding offline
+    _encoding = None
+
+_PIECE = re.compile(r"\d{1,3}|[^\W\d_]+|[^\w\s]+|_")
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # BPE keeps common words whole and splits long ones, merges short runs of
+    # punctuation like '": "', and puts digits in groups of three.
+    return sum(1 + (len(p) - 1) // (7 if p[0].isalpha() else 2) for p in _PIECE.findall(text))
+
+
+def fit_tokens(text: str, limit: int) -> str:
+    """Cut `text` to about `limit` tokens, at a line or word boundary where possible."""
+    if limit <= 0:
+        return ""
+    n = count_tokens(text)
+    if n <= limit:
+        return text
+    cut = int(len(text) * limit / n * 0.97)
+    while cut > 0 and count_tokens(text[:cut]) > limit:
+        cut = int(cut * 0.9)
+    head = text[:cut]
+    boundary = max(head.rfind("\n"), head.rfind(" "))
+    if boundary > cut * 0.8:
+        head = head[:boundary]
+    return head.rstrip() + " [...]"
+
+
+_PLACEHOLDER = re.compile(r"<([^<>]*)>")
+_SENTENCES = re.compile(r"\b(\d+|one)(?:-(\d+))?\s+(?:[a-z]+\s+){0,2}?sentences?\b")
+
+
+def answer_tokens(schema: str) -> int:
+    """
+    Expected tokens of a JSON answer shaped like `schema`. A "<2 simple
+    sentences ...>" placeholder counts as two sentences, "<number>" or
+    "<0-100>" as a number, and any other placeholder as a short phrase.
+    """
+    def fill(m: re.Match) -> str:
+        hint = m.group(1)
+        n = _SENTENCES.search(hint)
+        if n:
+            count = int(n.group(2) or (1 if n.group(1) == "one" else n.group(1)))
+            return "x " * (count * PROMPT_SENTENCE_TOKENS)
+        if "number" in hint or not re.search(r"[a-z]", hint):
+            return hint
+        return "x " * (PROMPT_SENTENCE_TOKENS // 2)
+
+    return count_tokens(_PLACEHOLDER.sub(fill, schema))
+
+
+def compact(text: str) -> str:
+    """Drop indentation and trailing spaces, and squeeze blank lines."""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def compact_schema(schema: str) -> str:
+    """Put a JSON schema on one line; indentation is pure token cost."""
+    return re.sub(r"\s*\n\s*", " ", schema.strip())
+
+
+class _Blank(dict):
+    """Stand-in values, for measuring a template before its fields are known."""
+
+    def __missing__(self, key):
+        return 0
+
+
+def schema_fields(schema: str) -> dict[str, str]:
+    """Split a one-line JSON schema into its top-level '"key": <value>' pieces."""
+    fields, depth, start, in_string = {}, 0, None, False
+    for i, ch in enumerate(schema):
+        if in_string:
+            in_string = ch != '"'
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+            if depth == 1:
+                start = i + 1
+        elif ch in "}]" or (ch == "," and depth == 1):
+            if depth == 1 and start is not None:
+                piece = schema[start:i].strip()
+                if piece:
+                    fields[piece.split('"')[1]] = piece
+                start = i + 1
+            if ch != ",":
+                depth -= 1
+    return fields
+
+
+class Rendered(NamedTuple):
+    text: str
+    max_tokens: int
+    name: str
+    tokens: int
+    values: dict = {}
+    is_follow_up: bool = False   # a re-request for what an earlier answer left out
+    only: tuple = ()             # the fields asked for, when not the whole schema
+
+    @property
+    def output(self) -> type[outputs.LLMOutput] | None:
+        template = TEMPLATES.get(self.name)
+        return template.output if template else None
+
+    def follow_up(self, fields: list[str]) -> "Rendered":
+        return TEMPLATES[self.name].follow_up(self, fields)
+
+
+class PromptTemplate:
+    def __init__(self, name: str, text: str, schema: str, output: type[outputs.LLMOutput], budget: int = 0,
+                 trim: tuple = (), item: str | None = None, items: int = 1):
+        """
+        `text` holds a {schema} slot for `schema`. `trim` names the fields
+        that are shortened so the prompt fits `budget` tokens; every other
+        text field is capped at PROMPT_FIELD_MAX_TOKENS. `item` is the
+        part of the schema that repeats once per list entry, `items` times
+        by default. `output` is the model the answer is checked against.
+        """
+        self.name = name
+        self.output = output
+        self.schema = compact_schema(schema)
+        self.template = compact(text).replace("{schema}", self.schema)
+        self.budget = int(os.environ.get(f"PROMPT_BUDGET_{name.upper()}", budget))
+        self.trim = trim
+        self.items = items
+        self.static_tokens = count_tokens(self.template.format_map(_Blank()))
+        self.schema_tokens = answer_tokens(self.schema.format_map(_Blank()))
+        self.item_tokens = answer_tokens(compact_schema(item).format_map(_Blank())) if item else 0
+
+    def max_tokens(self, items: int | None = None) -> int:
+        items = self.items if items is None else items
+        expected = self.schema_tokens + self.item_tokens * max(items - 1, 0)
+        return min(PROMPT_MAX_OUTPUT_TOKENS, math.ceil(expected * PROMPT_OUTPUT_SLACK) + 32)
+
+    def render(self, items: int | None = None, **values) -> Rendered:
+        with stage("prompt"):
+            return self._render(items, values)
+
+    def _render(self, items: int | None, values: dict) -> Rendered:
+        for key, value in values.items():
+            if isinstance(value, str) and key not in self.trim:
+                values[key] = fit_tokens(value, PROMPT_FIELD_MAX_TOKENS)
+        if self.trim:
+            fixed = count_tokens(self.template.format_map(
+                _Blank({k: v for k, v in values.items() if k not in self.trim})))
+            share = max(0, self.budget - fixed) // len(self.trim)
+            for key in self.trim:
+                values[key] = fit_tokens(values[key], share)
+        text = self.template.format(**values)
+        return Rendered(text, self.max_tokens(items), self.name, count_tokens(text), values)
+
+    def follow_up(self, first: Rendered, fields: list[str]) -> Rendered:
+        """
+        The same prompt, asking only for `fields` of the schema: the
+        completion is the costly part, so the input is repeated as is.
+        """
+        pieces = schema_fields(self.schema.format(**first.values))
+        schema = "{ " + ", ".join(pieces[f] for f in fields if f in pieces) + " }"
+        text = (f"{first.text}\n\nYour previous answer was cut off. Return JSON with only these keys: "
+                f"{', '.join(fields)}.\n{schema}")
+        max_tokens = min(PROMPT_MAX_OUTPUT_TOKENS, math.ceil(answer_tokens(schema) * PROMPT_OUTPUT_SLACK) + 32)
+        return Rendered(text, max_tokens, self.name, count_tokens(text), first.values, True, tuple(fields))
+
+
+PROFILE = PromptTemplate("profile", output=outputs.FinancialProfile, text="""
+    Review {name}'s finances and speak directly to them using "you" and "your".
+
+    THEIR DETAILS:
+    - State: {state}, Land: {land_acres} acres, Crop: {crop_type}
+    - Monthly income: Rs.{monthly:,.0f} ({income_type} income)
+    - Household: {household_size} people, Debt: Rs.{existing_debt_inr:,.0f}
+    - Risks: {risks}
+    - Pre-calculated monthly costs: household Rs.{household_exp:,} + debt Rs.{debt_emi:,} + farm inputs Rs.{farm_inputs:,}
+    - Estimated savings left: Rs.{surplus:,}/month
+
+    Write profile_summary and confidence_reason talking directly to {name} in simple words.
+
+    Return this JSON:
+    {schema}
+""", schema="""
+{{
+  "income_pattern": "seasonal or mixed or daily",
+  "income_stability": "stable or moderate or volatile",
+  "debt_load": "low or moderate or high or critical",
+  "monthly_surplus_estimate_inr": {surplus},
+  "financial_vulnerability": "low or medium or high",
+  "confidence": "high or medium or low",
+  "confidence_reason": "<one sentence starting with 'Based on what you shared...'>",
+  "key_financial_risks": ["<plain risk>", "<plain risk>", "<plain risk>"],
+  "profile_summary": "<2 simple sentences to {name} e.g. 'Your income comes mainly from...'>",
+  "expense_breakdown": [
+    {{"label": "Household", "value": {household_exp}, "color": "#4a8fd4"}},
+    {{"label": "Debt EMI", "value": {debt_emi}, "color": "#e05a4a"}},
+    {{"label": "Farm Inputs", "value": {farm_inputs}, "color": "#c87a30"}},
+    {{"label": "Savings", "value": {surplus}, "color": "#3a9a64"}}
+  ],
+  "risk_scores": [
+    {{"label": "Income Risk", "score": <0-100>, "description": "<short plain phrase>"}},
+    {{"label": "Debt Risk", "score": <0-100>, "description": "<short plain phrase>"}},
+    {{"label": "Weather Risk", "score": <0-100>, "description": "<short plain phrase>"}},
+    {{"label": "Market Risk", "score": <0-100>, "description": "<short plain phrase>"}}
+  ],
+  "income_vs_expense": {{
+    "income": {monthly},
+    "expenses": {expenses},
+    "surplus": {surplus}
+  }}
+}}
+""")
+
+# Only the verdict: name, benefit and the other catalogue fields are joined
+# in by scheme_id on the server, so Groq does not spend tokens copying them.
+SCHEME_ITEM = """
+    {{
+      "scheme_id": "<id>",
+      "suitability": "recommended or suitable or low_value",
+      "suitability_label": "<plain label like 'Great for you' or 'Worth trying' or 'Skip for now'>",
+      "reason": "<1-2 simple sentences to {name} explaining why they should/shouldn't apply>",
+      "benefit_effort_score": <1-10 - how much benefit vs effort to apply>,
+      "priority": <1-{n} - ranking based on their situation>,
+      "action_required": "<one action sentence: 'Go to...' or 'Visit...' or 'Call...'>"
+    }}
+"""
+
+SCHEMES = PromptTemplate("schemes", output=outputs.SchemeList, budget=1600, trim=("schemes_info",),
+                         item=SCHEME_ITEM, text="""
+    Advise {name} about government schemes, speaking directly to them using "you".
+
+    THEIR SITUATION:
+    - {state}, {land_acres} acres of {crop_type}, Rs.{monthly:,.0f}/month ({income_type})
+    - Debt: Rs.{existing_debt_inr:,.0f}, Risks: {risks}
+    - Financial health: {vulnerability} vulnerability
+
+    SHORTLISTED SCHEMES (they already meet the eligibility rules; assess all {n}):
+    {schemes_info}
+
+    Use friendly direct language: "You can get this because...", "To apply, go to your local..."
+
+    For each scheme, consider:
+    - Is the benefit substantial for their situation?
+    - Is it worth the effort to apply?
+    - How does it address their specific risks and needs?
+
+    Return JSON with key "schemes" containing array of {n} items:
+    {schema}
+
+    Include ALL {n} schemes in your response.
+""", schema="""
+{{
+  "schemes": [
+""" + SCHEME_ITEM + """
+  ]
+}}
+""")
+
+LOAN = PromptTemplate("loan", output=outputs.LoanAssessment, items=3, item="""
+    {{"factor": "<plain name>", "severity": "high or medium or low", "impact": "<what it means for you>", "mitigation": "<what you can do>"}}
+""", text="""
+    Give {name} honest, friendly loan advice. Speak directly using "you" and "your".
+    Plain language only — like advice from a trusted friend.
+
+    THEIR DETAILS:
+    - {state}, {land_acres} acres of {crop_type}, {income_type} income
+    - Monthly income: Rs.{monthly:,.0f}, Household: {household_size} people
+    - Existing debt: Rs.{existing_debt_inr:,.0f}, Risks: {risks}
+
+    LOAN REQUEST: Rs.{loan_amount_inr:,.0f} for "{loan_purpose}"
+
+    NUMBERS (pre-calculated — use these):
+    - Monthly loan payment would be: Rs.{est_emi:,}
+    - Monthly household costs: Rs.{household_exp:,}
+    - Current debt payment: Rs.{current_debt_emi:,}
+    - Total going out each month: Rs.{total_outgo:,}
+    - Left over after all payments: Rs.{surplus:,}
+    - What % of income goes to debt: {debt_ratio}%
+    - This loan = {loan_to_annual}x your yearly income
+    - You can safely borrow up to: Rs.{safe_capacity:,}
+
+    SIMULATED ({paths:,} possible {months}-month futures with your crop's seasons, droughts, floods, pests and price drops):
+    - Chance of defaulting (payments still behind after a year, or when the loan ends): {default_pct}%
+    - Chance of missing at least one payment: {missed_pct}%
+    - If one season goes badly, chance of defaulting: {bad_season_pct}%
+    - Savings that cover the gaps in 9 of 10 futures: Rs.{reserve_p90:,}
+    - Hardest months: {hardest_months}
+    These results are final: explain them, do not recalculate them.
+
+    All text fields must talk to {name} directly. Keep every sentence short and simple.
+
+    Return this JSON:
+    {schema}
+""", schema="""
+{{
+  "assessed": true,
+  "label": "suitable or risky or not_recommended",
+  "label_display": "<plain 5-word verdict>",
+  "overall_reasoning": "<2 simple sentences to {name}>",
+  "key_metrics": {{
+    "debt_service_ratio": {debt_ratio},
+    "loan_to_income_ratio": {loan_to_annual},
+    "risk_adjusted_capacity": {safe_capacity}
+  }},
+  "repayment_analysis": {{
+    "monthly_emi_estimate": {est_emi},
+    "income_cycle_match": "excellent or good or poor",
+    "timing_concern": "<1 plain sentence or null>",
+    "verdict": "<1 friendly sentence to {name}>"
+  }},
+  "cash_flow_analysis": {{
+    "loan_purpose_timing": "<1 sentence: when you'd spend this money>",
+    "revenue_generation_timeline": "<1 sentence: when you'd earn it back>",
+    "timing_mismatch": true or false,
+    "mismatch_detail": "<1 sentence or null>",
+    "verdict": "<1 friendly sentence>"
+  }},
+  "debt_burden_analysis": {{
+    "current_debt_to_income_ratio": {current_dti},
+    "post_loan_debt_to_income_ratio": {debt_ratio},
+    "debt_load_category": "safe or manageable or stressed or critical",
+    "available_income_after_all_emis": {surplus},
+    "minimum_safe_buffer": <number>,
+    "meets_buffer_requirement": true or false,
+    "verdict": "<1 friendly sentence>"
+  }},
+  "income_shock_resilience": {{
+    "primary_risks": ["<plain risk>", "<plain risk>"],
+    "worst_case_scenario": "<1 plain honest sentence>",
+    "verdict": "<1 friendly sentence>"
+  }},
+  "loan_purpose_evaluation": {{
+    "purpose_category": "productive or semi-productive or consumptive",
+    "roi_potential": "high or medium or low",
+    "productive_value": "<1 sentence: how this helps you>",
+    "alternative_funding": "<1 sentence about cheaper options, or null>",
+    "purpose_risk": "<1 plain sentence about what could go wrong>",
+    "verdict": "<1 friendly sentence>"
+  }},
+  "risk_factors": [
+    {{"factor": "<plain name>", "severity": "high or medium or low", "impact": "<what it means for you>", "mitigation": "<what you can do>"}}
+  ],
+  "green_flags": ["<something good about your situation>", "<another positive>"],
+  "red_flags": ["<honest concern>", "<another concern>"],
+  "recommendations": {{
+    "primary_recommendation": "<2 honest friendly sentences of advice to {name}>",
+    "if_proceeding": "<1 sentence: if you go ahead, do this first>",
+    "safer_alternatives": ["<simpler option>", "<another option>"],
+    "negotiation_tips": ["<tip for the bank>", "<another tip>"]
+  }},
+  "repayment_plan_preview": {{
+    "monthly_emi": {est_emi},
+    "suggested_tenure_months": <24 or 36 or 48 or 60>,
+    "lean_months": [<month numbers when income is low>],
+    "harvest_months": [<month numbers when income is high for {crop_type}>],
+    "strategy": "<1 sentence: how to plan repayments around your harvest>",
+    "buffer_to_save": <monthly amount to set aside>
+  }},
+  "confidence": "high or medium or low",
+  "confidence_reason": "<1 sentence starting with 'Based on what you shared...'>"
+}}
+""")
+
+DECISION = PromptTemplate("decision", output=outputs.Decision, text="""
+    Give {name} one clear, friendly recommendation. Speak directly using "you".
+    Simple language — like advice from a trusted friend.
+
+    SITUATION:
+    - Financial health: {vulnerability} vulnerability
+    - Monthly savings: Rs.{surplus:,}
+    - Best schemes: {top_schemes}
+    - Loan assessment: {loan_label}
+
+    Return JSON talking directly to {name}:
+    {schema}
+""", schema="""
+{{
+  "recommendation": "scheme_first or loan_first or both_together or scheme_only or neither or loan_only",
+  "headline": "<one bold sentence starting with 'You should...' or 'The best next step for you is...'>",
+  "reasoning": "<3-4 simple sentences to {name}>",
+  "priority_actions": [
+    {{"step": 1, "action": "<what you should do>", "why": "<why this helps you>"}},
+    {{"step": 2, "action": "<next step for you>", "why": "<why this matters>"}},
+    {{"step": 3, "action": "<third step>", "why": "<reason>"}}
+  ],
+  "what_to_avoid": "<one sentence starting with 'Avoid...' or 'Do not...'>",
+  "documents_needed": ["<document>", "<document>", "<document>"],
+  "timeline_weeks": <number>,
+  "overall_risk_level": "low or medium or high"
+}}
+""")
+
+REPAYMENT = PromptTemplate("repayment", output=outputs.RepaymentAdvice, text="""
+    Give {name} practical tips for repaying their loan. Speak to them directly.
+    Warm, friendly tone — like a helpful advisor who cares about them.
+
+    THEIR LOAN: Rs.{loan_amount_inr:,.0f} for "{loan_purpose}"
+    Monthly repayment: Rs.{est_emi:,} for {total_months} months ({annual_rate:.0%} a year)
+    Income: Rs.{monthly:,.0f}/month ({income_type})
+    Crop: {crop_type} in {state}
+    Household costs: Rs.{household_exp:,}/month
+    Paying Rs.{faster_emi:,} instead of Rs.{est_emi:,} saves Rs.{interest_saved:,} and finishes {months_saved} months sooner.
+
+    Seasons: sowing (Jun-Jul, Dec), growing (Jan-Feb, Aug-Sep), harvest (Mar-Apr, Oct-Nov), lean (May).
+
+    Return this JSON:
+    {schema}
+
+    Make tips specific and practical for {crop_type} farming.
+""", schema="""
+{{
+  "opening_advice": "<2 warm sentences to {name} about starting this journey>",
+  "season_tips": {{
+    "sowing": ["<practical tip>", "<another tip>"],
+    "growing": ["<practical tip>", "<another tip>"],
+    "harvest": ["<practical tip>", "<another tip>"],
+    "lean": ["<practical tip>", "<another tip>"]
+  }},
+  "harvest_strategy": "<2 sentences: how to use harvest money to pay extra and finish faster>",
+  "lean_season_strategy": "<2 sentences: how to manage during low-income months>",
+  "early_payoff_tip": "<1 sentence using the savings figure above>",
+  "emergency_advice": "<1 honest sentence: what to do if you miss a payment>"
+}}
+""")
+
+LOAN_CHOICE = PromptTemplate("loan_choice", output=outputs.LoanChoice, text="""
+    Explain to {name} what this loan choice means. Speak directly using "you". Plain language only.
+
+    THEIR DETAILS: {state}, {crop_type}, {income_type} income of Rs.{monthly:,.0f}/month, {household_size} people
+
+    CHOSEN LOAN: Rs.{amount:,.0f} over {months} months at {annual_rate:.0%} a year, Rs.{est_emi:,} a month
+    - {debt_ratio}% of income goes to debt; Rs.{surplus:,} left each month
+    - Chance of defaulting (still behind after a year, or at the end): {default_pct}% (one bad season: {bad_season_pct}%)
+    - Savings that cover the gaps in 9 of 10 futures: Rs.{reserve_p90:,}
+    - Largest safe amount over {months} months: {max_safe}
+    These results are final: explain them, do not recalculate them.
+
+    Return this JSON:
+    {schema}
+""", schema="""
+{{
+  "headline": "<one plain sentence: is this a safe choice for you>",
+  "explanation": "<2-3 simple sentences to {name}>",
+  "tips": ["<practical tip>", "<another tip>"]
+}}
+""")
+
+RED_FLAG_ITEM = """
+    {{
+      "title": "<short name of the issue>",
+      "severity": "low or medium or high or critical",
+      "clause_text": "<exact or near-exact quote from the document if found, else null>",
+      "plain_explanation": "<explain in simple words what this means for the farmer>",
+      "potential_impact": "<what could happen to the farmer because of this>",
+      "recommendation": "<what the farmer should do about this>"
+    }}
+"""
+
+DOCUMENT = PromptTemplate("document", output=outputs.DocumentAnalysis, budget=2600, trim=("text",),
+                          item=RED_FLAG_ITEM, items=5, text="""
+    You are an expert at analysing loan agreements and financial documents to protect Indian farmers from predatory lending.
+
+    Carefully read this {part}and identify ALL risks, hidden clauses, and red flags that could harm a farmer.
+
+    DOCUMENT TEXT:
+    ---
+    {text}
+    ---
+
+    Be thorough. Look for:
+    - Hidden fees, charges, or penalties
+    - Variable/floating interest rates disguised in fine print
+    - Balloon payments or lump sum demands
+    - Collateral clauses that could cause land loss
+    - Automatic renewal traps
+    - Prepayment penalties
+    - Cross-collateralisation (linking multiple assets)
+    - Vague or ambiguous language that favours the lender
+    - Unrealistic repayment schedules
+    - Clauses waiving legal rights
+    - Personal guarantee requirements
+    - Insurance requirements that benefit lender only
+    - Grace period absence
+    - Compound interest hidden as flat rate
+
+    Return this JSON:
+    {schema}
+""", schema="""
+{{
+  "document_type": "<type of document e.g. Loan Agreement, Promissory Note, Mortgage Deed>",
+  "overall_risk": "low or medium or high or critical",
+  "risk_summary": "<2-3 plain sentences summarising the main danger level for a farmer>",
+  "danger_score": <0-100 where 100 is most dangerous>,
+  "red_flags": [
+""" + RED_FLAG_ITEM + """
+  ],
+  "green_flags": [
+    {{
+      "title": "<something fair or farmer-friendly>",
+      "explanation": "<why this is good>"
+    }}
+  ],
+  "key_terms": {{
+    "interest_rate": "<rate found or null>",
+    "tenure": "<loan period found or null>",
+    "emi_amount": "<monthly payment found or null>",
+    "collateral": "<what is pledged or null>",
+    "processing_fee": "<fee found or null>",
+    "prepayment_penalty": "<penalty found or null>",
+    "late_payment_penalty": "<penalty found or null>"
+  }},
+  "questions_to_ask_lender": [
+    "<specific question the farmer should ask before signing>",
+    "<another important question>",
+    "<another important question>"
+  ],
+  "verdict": "<one honest sentence: should the farmer sign this, negotiate, or walk away?>",
+  "immediate_actions": [
+    "<most urgent thing to do right now>",
+    "<second action>",
+    "<third action>"
+  ]
+}}
+""")
+
+TRANSLATE = PromptTemplate("translate", output=outputs.Translations, budget=1600, trim=("phrases",), text="""
+    Translate each value of this JSON object from English into {language}, for a farmer reading on a phone.
+    Use simple everyday words, not formal or Sanskritised ones. Keep numbers, Rs. amounts, dates and
+    scheme abbreviations (PM-KISAN, KCC, PMFBY) as they are. Return the same keys with the translated text.
+
+    {phrases}
+
+    Return this JSON:
+    {schema}
+""", schema="""
+{{ "1": "<translation of 1>", "2": "<translation of 2>" }}
+""")
+
+TEMPLATES = {t.name: t for t in (PROFILE, SCHEMES, LOAN, LOAN_CHOICE, DECISION, REPAYMENT, DOCUMENT, TRANSLATE)}
@@ -0,0 +1,383 @@
+"""
+Retry, rate limiting and circuit breaking for Groq calls.
+
+- retry_delay(): jittered exponential backoff that defers to the server's
+  Retry-After when a 429/503 carries one.
+- TokenBucket: keeps us under the account's requests- and tokens-per-minute
+  quota by waiting locally instead of collecting 429s. The quota is
+  per account, so with several workers (uvicorn --workers N, or several
+  hosts) set RATE_LIMIT_BACKEND=sqlite or redis: SQLiteTokenBucket and
+  RedisTokenBucket keep one bucket for all of them, and a 429 seen by one
+  worker holds back the others too.
+- CircuitBreaker: after BREAKER_FAILURES consecutive upstream failures,
+  calls fail fast for BREAKER_COOLDOWN_S, then a single trial call decides
+  whether to close again. Endpoints fall back to cached or locally computed
+  results while it is open.
+- HedgePolicy: when a call is slower than most of its kind (the p95 of
+  recent ones), a second attempt is sent and the first answer wins.
+  Hedges are capped at a share of calls and skipped when the quota is
+  running low, so they cannot eat the budget.
+- SingleFlight: identical calls made while one is already in flight wait
+  for its result instead of going upstream again (e.g. a double-tapped
+  Submit).
+"""
+import abc
+import asyncio
+import os
+from collections import deque
+from collections.abc import Awaitable, Callable
+import random
+import sqlite3
+import threading
+import time
+
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_S = float(os.environ.get("LLM_RETRY_BASE_S", "0.5"))
+LLM_RETRY_MAX_S = float(os.environ.get("LLM_RETRY_MAX_S", "8"))
+# Total time a call may spend waiting between attempts before giving up.
+LLM_RETRY_BUDGET_S = float(os.environ.get("LLM_RETRY_BUDGET_S", "20"))
+
+# Groq quota per minute for the account; 0 disables the limit.
+GROQ_RPM = float(os.environ.get("GROQ_RPM", "1000"))
+GROQ_TPM = float(os.environ.get("GROQ_TPM", "300000"))
+
+# "memory" (per process), "sqlite" (one file shared by the workers on a host)
+# or "redis" (shared by every host; needs `pip install redis`).
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH", "rate_limit.sqlite3")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.environ.get("BREAKER_COOLDOWN_S", "30"))
+
+LLM_COALESCE = os.environ.get("LLM_COALESCE", "1") == "1"
+
+# Hedged requests: off unless LLM_HEDGE=1. A hedge is sent after the
+# LLM_HEDGE_QUANTILE latency of recent calls of the same prompt and model
+# (never sooner than LLM_HEDGE_MIN_S), at most for LLM_HEDGE_MAX_SHARE of
+# calls, and only while both quotas have LLM_HEDGE_MIN_HEADROOM left.
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.environ.get("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_S = float(os.environ.get("LLM_HEDGE_MIN_S", "1.0"))
+LLM_HEDGE_MAX_SHARE = float(os.environ.get("LLM_HEDGE_MAX_SHARE", "0.05"))
+LLM_HEDGE_MIN_HEADROOM = float(os.environ.get("LLM_HEDGE_MIN_HEADROOM", "0.5"))
+LLM_HEDGE_WINDOW = int(os.environ.get("LLM_HEDGE_WINDOW", "200"))
+
+
+def retry_after_s(headers) -> float | None:
+    """Seconds to wait from Retry-After (or Groq's retry-after-ms), if present."""
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form; fall back to our own backoff
+    return None
+
+
+def retry_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Full-jitter exponential backoff for attempt 1, 2, ...; Retry-After wins when given."""
+    if retry_after is not None:
+        return min(retry_after, LLM_RETRY_MAX_S * 4)
+    return random.uniform(0, min(LLM_RETRY_MAX_S, LLM_RETRY_BASE_S * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute up to one minute's worth; acquire() waits for enough."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_s = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        # The lock keeps waiters in arrival order, so big requests aren't starved.
+        async with self._lock:
+            self._refill()
+            while self.level < amount:
+                wait = (amount - self.level) / self.rate
+                self.waited_s += wait
+                await asyncio.sleep(wait)
+                self._refill()
+            self.level -= amount
+
+    async def drain(self, seconds: float) -> None:
+        """Upstream said we are over quota: treat the bucket as empty for `seconds`."""
+        if self.rate > 0:
+            self._refill()
+            self.level = min(self.level, -seconds * self.rate)
+
+    def headroom(self) -> float:
+        """Share of a minute's quota available now (for shared buckets, as of the last update)."""
+        if self.rate <= 0:
+            return 1.0
+        self._refill()
+        return max(self.level, 0) / self.capacity
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"backend": RATE_LIMIT_BACKEND, "per_minute": self.capacity,
+                "available": round(max(self.level, 0)), "waited_s": round(self.waited_s, 1)}
+
+
+class SharedTokenBucket(TokenBucket, abc.ABC):
+    """
+    A TokenBucket whose level lives outside the process. acquire() reserves
+    its amount in one atomic update, letting the level go negative, then
+    sleeps until the reservation is covered. Waiters in every worker are
+    thus served in order without polling the store. `level` and `updated`
+    here only mirror the last update, for stats().
+    """
+
+    def __init__(self, name: str, per_minute: float):
+        super().__init__(per_minute)
+        self.name = name
+
+    @abc.abstractmethod
+    async def _update(self, take: float = 0, floor: float | None = None) -> float:
+        """Refill, then take `take` or lower the level to `floor`; returns the new level."""
+
+    async def acquire(self, amount: float = 1) -> None:
+        if self.rate <= 0:
+            return
+        level = await self._update(take=min(amount, self.capacity))
+        if level < 0:
+            wait = -level / self.rate
+            self.waited_s += wait
+            await asyncio.sleep(wait)
+
+    async def drain(self, seconds: float) -> None:
+        if self.rate > 0:
+            await self._update(floor=-seconds * self.rate)
+
+    def _mirror(self, level: float) -> float:
+        self.level, self.updated = level, time.monotonic()
+        return level
+
+
+class SQLiteTokenBucket(SharedTokenBucket):
+    def __init__(self, name: str, per_minute: float, path: str = RATE_LIMIT_PATH):
+        super().__init__(name, per_minute)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)")
+
+    def _update_sync(self, take: float, floor: float | None) -> float:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the read-modify-write is atomic across processes.
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT level, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                now = time.time()
+                level = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+                level = level - take if floor is None else min(level, floor)
+                self._db.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                                 (self.name, level, now))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self._mirror(level)
+
+    async def _update(self, take: float = 0, floor: float | None = None) -> float:
+        return await asyncio.to_thread(self._update_sync, take, floor)
+
+
+# Refill, then take ARGV[3] or lower the level to ARGV[4]. Uses the Redis
+# clock, so hosts with skewed clocks still agree.
+_REDIS_BUCKET = """
+local rate, capacity, take = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local state = redis.call('HMGET', KEYS[1], 'level', 'updated')
+local level = capacity
+if state[1] then level = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate) end
+if ARGV[4] then level = math.min(level, tonumber(ARGV[4])) else level = level - take end
+redis.call('HSET', KEYS[1], 'level', level, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(level)
+"""
+
+
+class RedisTokenBucket(SharedTokenBucket):
+    def __init__(self, name: str, per_minute: float, url: str = REDIS_URL):
+        super().__init__(name, per_minute)
+        import redis.asyncio  # optional dependency, only needed for this backend
+        self._redis = redis.asyncio.Redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_BUCKET)
+
+    async def _update(self, take: float = 0, floor: float | None = None) -> float:
+        args = [self.rate, self.capacity, take] + ([] if floor is None else [floor])
+        level = await self._script(keys=[f"sahyog:bucket:{self.name}"], args=args)
+        return self._mirror(float(level))
+
+
+def make_bucket(name: str, per_minute: float) -> TokenBucket:
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteTokenBucket(name, per_minute)
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisTokenBucket(name, per_minute)
+    return TokenBucket(per_minute)
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.threshold = failures
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown_s:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        self.rejected += 1
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.trial_running or self.failures >= self.threshold:
+            if self.opened_at is None or self.trial_running:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+    def release(self) -> None:
+        """The call ended without telling us anything about upstream (e.g. a 400)."""
+        self.trial_running = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures,
+                "times_opened": self.times_opened, "rejected": self.rejected}
+
+
+class HedgePolicy:
+    # Below this many samples the tail is a guess, so nothing is hedged.
+    MIN_SAMPLES = 20
+
+    def __init__(self, enabled: bool = LLM_HEDGE, quantile: float = LLM_HEDGE_QUANTILE,
+                 min_delay_s: float = LLM_HEDGE_MIN_S, max_share: float = LLM_HEDGE_MAX_SHARE,
+                 min_headroom: float = LLM_HEDGE_MIN_HEADROOM, window: int = LLM_HEDGE_WINDOW):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay_s = min_delay_s
+        self.max_share = max_share
+        self.min_headroom = min_headroom
+        self.window = window
+        self.latencies: dict[tuple, deque] = {}
+        self.calls = 0    # first attempts
+        self.hedged = 0   # second attempts sent
+        self.won = 0      # second attempts that answered first
+        self.skipped = 0  # slow calls not hedged because of the caps
+
+    def record(self, kind: tuple, seconds: float) -> None:
+        window = self.latencies.get(kind)
+        if window is None:
+            window = self.latencies[kind] = deque(maxlen=self.window)
+        window.append(seconds)
+
+    def delay(self, kind: tuple) -> float | None:
+        """Seconds to wait before hedging a call of this kind; None to not hedge it."""
+        window = self.latencies.get(kind)
+        if not self.enabled or window is None or len(window) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(window)
+        return max(self.min_delay_s, ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))])
+
+    def allow(self, *buckets: TokenBucket) -> bool:
+        if self.hedged + 1 > self.max_share * self.calls or any(
+                b.headroom() < self.min_headroom for b in buckets):
+            self.skipped += 1
+            return False
+        self.hedged += 1
+        return True
+
+    def stats(self) -> dict:
+        delays = {f"{model}:{label}": self.delay((model, label)) for model, label in self.latencies}
+        return {"enabled": self.enabled, "calls": self.calls, "hedged": self.hedged, "won": self.won,
+                "skipped": self.skipped, "delay_s": {k: round(v, 2) for k, v in delays.items() if v is not None}}
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution. The shared
+    task is shielded from each caller's cancellation; it is cancelled only
+    when every caller waiting on it has gone. In-process only: workers do
+    not share calls (identical requests across workers meet in the
+    response cache instead).
+    """
+
+    def __init__(self, enabled: bool = LLM_COALESCE):
+        self.enabled = enabled
+        self._calls: dict = {}  # key -> [task, callers waiting]
+        self.leaders = 0    # calls that went upstream
+        self.joined = 0     # calls that waited for another's result instead
+        self.abandoned = 0  # shared calls cancelled because every caller left
+
+    async def do(self, key, fn: Callable[[], Awaitable]):
+        if not self.enabled:
+            return await fn()
+        entry = self._calls.get(key)
+        if entry is None:
+            entry = self._calls[key] = [asyncio.ensure_future(fn()), 0]
+            entry[0].add_done_callback(lambda _: self._forget(key, entry))
+            self.leaders += 1
+        else:
+            self.joined += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                self.abandoned += 1
+                self._forget(key, entry)
+                task.cancel()
+
+    def __contains__(self, key) -> bool:
+        return key in self._calls
+
+    def _forget(self, key, entry: list) -> None:
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.joined
+        return {"enabled": self.enabled, "in_flight": len(self._calls), "upstream_calls": self.leaders,
+                "saved_calls": self.joined, "abandoned": self.abandoned,
+                "saved_rate": round(self.joined / calls, 3) if calls else 0.0}
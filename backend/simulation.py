@@ -0,0 +1,302 @@
+"""
+Monte Carlo income-shock simulation for loan resilience, with NumPy.
+
+Instead of asking the LLM to guess how a farmer copes with a bad season,
+SIM_PATHS monthly income paths are sampled over the loan's tenure:
+
+- Farm income arrives in the crop's harvest months; wages or a salary
+  (the non-farm share for "mixed" and "fixed" income) arrive every month.
+- Each season (kharif: Jun-Nov, rabi: Dec-May) may bring shocks: drought,
+  flood, pests or crop failure cut that season's harvest, a price crash
+  or poor market access cuts what it sells for, and illness adds a
+  one-off cost. Risks the farmer listed are much likelier than the rest,
+  and drought- or flood-prone states raise those odds.
+
+Household costs, current debt payments and the new EMI come out of every
+month, and what is left carries over. Paths start from what the household
+normally holds to reach its next harvest, plus a month of costs kept back.
+A path "misses a payment" when savings run out. It "defaults" when the
+arrears stay unpaid for more than ARREARS_WINDOW_MONTHS in a row, or are
+still unpaid when the loan's term ends. This follows the bank rule for crop
+loans: a loan becomes non-performing when it is overdue for two crop
+seasons, not when a harvest that will clear it is still to come. Reserves
+needed are the extra savings that would have kept a path from ever
+missing a payment.
+
+All paths run at once as (paths, months) arrays: 10,000 paths over three
+years take about 25 ms. sweep() prices a whole grid of amounts, tenures
+and rates against one set of paths for /assess-loan/sweep. The seed comes
+from the profile, so the same farmer gets the same numbers for the same
+first repayment month.
+"""
+import datetime
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from amortization import DEFAULT_ANNUAL_RATE, DEFAULT_TENURE_MONTHS, emi
+
+SIM_PATHS = int(os.environ.get("SIM_PATHS", "10000"))
+HOUSEHOLD_COST_PER_PERSON = 2500  # a month, as in estimate_finances
+ARREARS_WINDOW_MONTHS = 12  # two crop seasons
+OPENING_BUFFER_MONTHS = 1.0  # of household costs and debt payments, on top of the lean-season carry
+# Share of vulnerability_score from missed payments; the rest is default odds.
+# Payments missed in lean months cost penalty interest, but a harvest clears them.
+MISSED_WEIGHT = 0.25
+SAFE_DEBT_RATIO = 30  # % of income, the "suitable" line of the local loan assessment
+
+# Calendar months in which a crop's income comes in; vegetables sell all year.
+CROP_HARVEST = {
+    "rice": (10, 11), "paddy": (10, 11), "cotton": (10, 11, 12), "soybean": (10,), "maize": (9, 10),
+    "groundnut": (10, 11), "wheat": (3, 4), "pulses": (3, 4), "mustard": (3,), "gram": (3,),
+    "sugarcane": (1, 2, 3), "vegetable": tuple(range(1, 13)), "fruit": (4, 5, 6), "dairy": tuple(range(1, 13)),
+}
+DEFAULT_HARVEST = (3, 4, 10, 11)
+
+# Share of income that depends on the harvest.
+FARM_SHARE = {"seasonal": 1.0, "mixed": 0.6, "daily": 0.3, "fixed": 0.2}
+
+# Per season: chance of the shock for a farmer who listed the risk, and the
+# Beta(a, b) share of farm income it takes. Unlisted risks keep
+# UNLISTED_FACTOR of the chance. Illness is a cost in months of income.
+SHOCKS = {
+    "drought": {"match": ("drought", "rain", "weather"), "chance": 0.20, "loss": (4, 6)},
+    "flood": {"match": ("flood", "cyclone"), "chance": 0.12, "loss": (3, 6)},
+    "crop_failure": {"match": ("pest", "disease", "crop_failure", "crop failure"), "chance": 0.15, "loss": (3, 7)},
+    "price_crash": {"match": ("price", "market_crash"), "chance": 0.20, "loss": (2, 6)},
+    "market_access": {"match": ("market_access", "market access", "transport"), "chance": 0.15, "loss": (1.5, 8)},
+    "illness": {"match": ("illness", "health", "medical"), "chance": 0.10, "cost_months": (0.5, 2.0)},
+}
+UNLISTED_FACTOR = 0.25
+DROUGHT_PRONE = {"rajasthan", "maharashtra", "karnataka", "gujarat", "andhra pradesh", "telangana",
+                 "madhya pradesh", "tamil nadu"}
+FLOOD_PRONE = {"bihar", "assam", "west bengal", "uttar pradesh", "odisha", "kerala"}
+STATE_FACTOR = 1.5
+# Season-to-season spread of yields and prices when nothing goes wrong.
+YIELD_SIGMA = 0.12
+
+
+def harvest_months(crop_type: str) -> tuple:
+    crop = crop_type.casefold()
+    for name, months in CROP_HARVEST.items():
+        if name in crop:
+            return months
+    return DEFAULT_HARVEST
+
+
+def shock_chances(risks: list[str], state: str) -> dict[str, float]:
+    listed = " ".join(r.casefold() for r in risks)
+    st = " ".join(state.split()).casefold()
+    chances = {}
+    for name, shock in SHOCKS.items():
+        chance = shock["chance"] * (1.0 if any(m in listed for m in shock["match"]) else UNLISTED_FACTOR)
+        if (name == "drought" and st in DROUGHT_PRONE) or (name == "flood" and st in FLOOD_PRONE):
+            chance *= STATE_FACTOR
+        chances[name] = round(min(chance, 0.9), 3)
+    return chances
+
+
+def _seed(p) -> int:
+    digest = hashlib.sha256(json.dumps(p.model_dump(), sort_keys=True, default=str).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def next_month() -> int:
+    """Calendar month of the first repayment when the loan is taken now."""
+    return datetime.date.today().month % 12 + 1
+
+
+def calendar(months: int, start_month: int) -> np.ndarray:
+    return (start_month - 1 + np.arange(months)) % 12 + 1
+
+
+def expected_income(p, months: int, start_month: int) -> tuple[np.ndarray, float]:
+    """Farm income by month in a normal season, (months,), and the steady non-farm income."""
+    crop_months = harvest_months(p.crop_type)
+    farm_share = FARM_SHARE.get(p.income_type.casefold(), 0.6)
+    harvest = np.isin(calendar(months, start_month), crop_months)
+    farm = np.where(harvest, p.monthly_income_inr * 12 * farm_share / len(crop_months), 0.0)
+    return farm, p.monthly_income_inr * (1 - farm_share)
+
+
+def opening_savings(p, outgo: float, start_month: int) -> float:
+    """
+    What a household on this income normally holds going into `start_month`:
+    enough from the last harvest to meet its costs until the next one, and
+    OPENING_BUFFER_MONTHS of costs kept back. The profile has no savings
+    figure, and starting every path at zero would count the ordinary lean
+    months as missed payments.
+    """
+    farm, other = expected_income(p, 12, start_month)
+    return max(0.0, -float(np.cumsum(farm + other - outgo).min())) + OPENING_BUFFER_MONTHS * outgo
+
+
+def income_paths(p, months: int, paths: int = SIM_PATHS,
+                 start_month: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Monthly income net of one-off shock costs, (paths, months), from
+    calendar month `start_month`; and how many bad seasons (a third or more
+    of a harvest lost, or an illness) each path had.
+    """
+    rng = np.random.default_rng(_seed(p))
+    # Seasons run Jun-Nov and Dec-May; number them from the first month.
+    season = (start_month - 1 + np.arange(months) - 5) // 6
+    season -= season[0]
+    n_seasons = int(season[-1]) + 1
+
+    farm, other = expected_income(p, months, start_month)
+    factor = np.exp(rng.standard_normal((paths, n_seasons)) * YIELD_SIGMA - YIELD_SIGMA ** 2 / 2)
+    costs = np.zeros((paths, n_seasons))
+    for name, chance in shock_chances(p.risk_exposure, p.state).items():
+        hit = rng.random((paths, n_seasons)) < chance
+        shock = SHOCKS[name]
+        # Sizes are drawn only for the seasons hit; Beta draws dominate the run time otherwise.
+        if "loss" in shock:
+            factor[hit] *= 1 - rng.beta(*shock["loss"], int(hit.sum()))
+        else:
+            costs[hit] += rng.uniform(*shock["cost_months"], int(hit.sum())) * p.monthly_income_inr
+
+    net = farm * factor[:, season] + other
+    # A season's one-off cost falls in its first month.
+    net[:, np.flatnonzero(np.r_[True, season[1:] != season[:-1]])] -= costs
+    bad = ((factor < 2 / 3) & farm.any() | (costs > 0)).sum(axis=1)
+    return net, bad
+
+
+def fixed_outgo(p) -> float:
+    """Household costs and current debt payments, as in estimate_finances."""
+    return p.household_size * HOUSEHOLD_COST_PER_PERSON + round(p.existing_debt_inr * 0.03)
+
+
+def default_limits(before: np.ndarray) -> np.ndarray:
+    """
+    For savings before any loan payment, `before` (paths, months), the
+    largest instalment that does not default on each path for every
+    tenure, as a (paths, months) array indexed by tenure - 1.
+
+    A path is in arrears in month t when e * t > before[t], i.e. when
+    e > before[t] / t, so more months are in arrears as e grows. It
+    defaults when that holds in the loan's last month, or in every month of
+    a run longer than ARREARS_WINDOW_MONTHS. The limit for a tenure is the
+    smaller of before[t] / t in its last month and the smallest run maximum
+    ending within it; running minimums give every tenure at once.
+    """
+    run = ARREARS_WINDOW_MONTHS + 1
+    per_month = before / np.arange(1, before.shape[1] + 1)
+    runs = np.full_like(per_month, np.inf)
+    if before.shape[1] >= run:
+        runs[:, run - 1:] = np.lib.stride_tricks.sliding_window_view(per_month, run, axis=1).max(axis=2)
+    return np.minimum(per_month, np.minimum.accumulate(runs, axis=1))
+
+
+def outcomes(net: np.ndarray, outgo: float, instalments, opening: float = 0.0) -> dict[str, np.ndarray]:
+    """
+    Default and missed-payment odds and reserve percentiles for each of
+    `instalments` (k,) against the same income paths, as (k,) arrays; the
+    reserve percentiles are (3, k) for p50, p90 and p95.
+    """
+    instalments = np.atleast_1d(np.asarray(instalments, dtype=float))
+    months = net.shape[1]
+    before_loan = opening + np.cumsum(net - outgo, axis=1)  # savings carried month to month
+    paid = instalments[:, None] * np.arange(1, months + 1)  # (k, months)
+    shortfall = np.maximum(paid[:, None, :] - before_loan[None], 0.0)  # (k, paths, months)
+    worst = shortfall.max(axis=2)  # (k, paths)
+    defaulted = instalments[:, None] > default_limits(before_loan)[:, -1]
+    return {
+        "default": defaulted.mean(axis=1),
+        "missed": (worst > 0).mean(axis=1),
+        "defaulted": defaulted,
+        "missed_by_month": (shortfall > 0).mean(axis=1),  # (k, months)
+        "reserve": np.percentile(worst, [50, 90, 95], axis=1),
+    }
+
+
+def simulate_loan(p, amount: float | None = None, annual_rate: float = DEFAULT_ANNUAL_RATE,
+                  months: int = DEFAULT_TENURE_MONTHS, paths: int = SIM_PATHS,
+                  start_month: int | None = None) -> dict:
+    """The loan's odds over SIM_PATHS income paths, and the resilience figures the loan prompt reports."""
+    amount = p.loan_amount_inr if amount is None else amount
+    start_month = start_month or next_month()
+    net, bad = income_paths(p, months, paths, start_month)
+    instalment = float(emi(amount, annual_rate, months))
+    outgo = fixed_outgo(p)
+    opening = opening_savings(p, outgo, start_month)
+    res = outcomes(net, outgo, [instalment], opening)
+
+    p_default = float(res["default"][0])
+    p_missed = float(res["missed"][0])
+    # "One bad season": the paths with exactly one, or with any if none has just one.
+    one_bad = bad == 1 if (bad == 1).any() else bad > 0
+    bad_default = float(res["defaulted"][0][one_bad].mean()) if one_bad.any() else p_default
+    p50, p90, p95 = (float(v) for v in res["reserve"][:, 0])
+    by_month = np.bincount(calendar(months, start_month) - 1, weights=res["missed_by_month"][0], minlength=12)
+    hardest = [int(m) + 1 for m in np.argsort(-by_month, kind="stable")[:3] if by_month[m] > 0]
+
+    return {
+        "paths": paths,
+        "months": months,
+        "annual_rate": annual_rate,
+        "first_repayment_month": start_month,
+        "monthly_emi": round(instalment),
+        "monthly_outgo": round(outgo + instalment),
+        "opening_savings_assumed_inr": round(opening, -2),
+        "default_probability": round(p_default, 3),
+        "missed_payment_probability": round(p_missed, 3),
+        "bad_season_probability": round(float((bad > 0).mean()), 3),
+        "default_probability_one_bad_season": round(bad_default, 3),
+        "reserve_needed_inr": {"p50": round(p50, -2), "p90": round(p90, -2), "p95": round(p95, -2)},
+        "months_of_reserves_needed": round(p90 / max(outgo + instalment, 1), 1),
+        "can_weather_one_bad_season": bad_default < 0.1,
+        "vulnerability_score": min(100, round(100 * (MISSED_WEIGHT * p_missed + (1 - MISSED_WEIGHT) * p_default))),
+        "hardest_months": hardest,
+        "shock_chances_per_season": shock_chances(p.risk_exposure, p.state),
+    }
+
+
+def sweep(p, amounts, tenures, rates, max_default: float, paths: int = SIM_PATHS,
+          start_month: int | None = None) -> dict:
+    """
+    Every amount x tenure x rate combination against one set of income
+    paths. A point is safe when debt payments stay within SAFE_DEBT_RATIO
+    of income, something is left each month, and the odds of defaulting
+    are at most `max_default`. The frontier is the largest safe amount for
+    each tenure and rate.
+    """
+    amounts, rates = np.asarray(amounts, dtype=float), np.asarray(rates, dtype=float)
+    tenures = np.asarray(tenures, dtype=int)
+    start_month = start_month or next_month()
+    net, _ = income_paths(p, int(tenures.max()), paths, start_month)
+    outgo = fixed_outgo(p)
+    # One limit per path and tenure: every amount and rate is a comparison against it.
+    limits = default_limits(opening_savings(p, outgo, start_month) + np.cumsum(net - outgo, axis=1))
+
+    instalments = emi(amounts[:, None, None], rates[None, None, :], tenures[None, :, None])  # (A, T, R)
+    default = (instalments[..., None] > limits[:, tenures - 1].T[None, :, None, :]).mean(axis=-1)
+    income = max(p.monthly_income_inr, 1)
+    debt_ratio = (round(p.existing_debt_inr * 0.03) + instalments) / income * 100
+    surplus = p.monthly_income_inr - outgo - instalments
+    safe = (debt_ratio <= SAFE_DEBT_RATIO) & (surplus > 0) & (default <= max_default)
+
+    points = [{
+        "amount_inr": round(float(amounts[a])), "tenure_months": int(tenures[t]),
+        "annual_rate": round(float(rates[r]), 4), "monthly_emi": round(float(instalments[a, t, r])),
+        "debt_ratio": round(float(debt_ratio[a, t, r])), "surplus_inr": round(float(surplus[a, t, r])),
+        "loan_to_annual": round(float(amounts[a]) / (income * 12), 2),
+        "default_probability": round(float(default[a, t, r]), 3), "safe": bool(safe[a, t, r]),
+    } for a, t, r in np.ndindex(instalments.shape)]
+    # Largest safe amount per tenure and rate: the last safe row in amount order.
+    order = np.argsort(amounts, kind="stable")
+    frontier = []
+    for t, r in np.ndindex(len(tenures), len(rates)):
+        ok = order[safe[order, t, r]]
+        best = int(ok[-1]) if ok.size else None
+        frontier.append({
+            "tenure_months": int(tenures[t]), "annual_rate": round(float(rates[r]), 4),
+            "max_safe_amount_inr": None if best is None else round(float(amounts[best])),
+            "monthly_emi": None if best is None else round(float(instalments[best, t, r])),
+            "default_probability": None if best is None else round(float(default[best, t, r]), 3),
+        })
+    return {"paths": paths, "first_repayment_month": start_month, "max_default_probability": max_default,
+            "points": points, "frontier": frontier}
@@ -0,0 +1,42 @@
+"""
+Section-by-section streaming for the slow endpoints.
+
+Endpoints produce an async iterator of (event, data) pairs; stream_response()
+sends each one as soon as it is yielded, as Server-Sent Events or NDJSON, so
+clients on slow networks can render the first section while the rest is
+still being generated.
+"""
+import json
+from collections.abc import AsyncIterator
+from typing import Literal
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+StreamFormat = Literal["sse", "ndjson"]
+
+MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+
+def encode_event(event: str, data, fmt: StreamFormat) -> str:
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+
+def stream_response(events: AsyncIterator[tuple[str, object]], fmt: StreamFormat) -> StreamingResponse:
+    async def body():
+        try:
+            async for event, data in events:
+                yield encode_event(event, data, fmt)
+        except HTTPException as e:
+            yield encode_event("error", {"status_code": e.status_code, "detail": e.detail}, fmt)
+            return
+        yield encode_event("done", {}, fmt)
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        # Stop reverse proxies from buffering the stream into one response.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
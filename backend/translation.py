@@ -0,0 +1,262 @@
+"""
+Server-side translation of responses, for ?lang=hi and friends.
+
+localize() walks a response and collects its user-facing strings. It
+skips ids, enum values ("high", "scheme_first"), colours, numbers and
+meta. Each string is looked up in the phrase cache, and all misses go to
+Groq in one call, split only when they exceed TRANSLATE_BATCH_TOKENS.
+The translations are then put back in place.
+
+The phrase cache is SQLite (TRANSLATION_CACHE_PATH, queried from a worker
+thread), shared by workers and kept across restarts, with a dict in front.
+The repeated vocabulary (scheme names and details, labels, fallback
+wording) is translated once and then served locally. Responses stay cached in English; translation is
+applied on the way out, so one cache entry serves every language.
+TRANSLATION_PRELOAD=hi,mr translates the scheme catalogue at startup.
+
+When Groq is unavailable, or a batch fails for any other reason, strings
+without a cached translation stay in English and meta.fallback gains
+"translation".
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from typing import Literal
+
+import prompts
+from llm import InvalidOutput, UpstreamUnavailable, call_groq
+from metrics import collector, gauge_lines, stage
+
+TRANSLATION_CACHE_PATH = os.environ.get("TRANSLATION_CACHE_PATH", "translations.sqlite3")
+TRANSLATION_MEMORY_ENTRIES = int(os.environ.get("TRANSLATION_MEMORY_ENTRIES", "20000"))
+TRANSLATE_BATCH_TOKENS = int(os.environ.get("TRANSLATE_BATCH_TOKENS", "1000"))
+# Completion tokens per source token: Indic scripts take several tokens a word.
+TRANSLATE_OUTPUT_RATIO = float(os.environ.get("TRANSLATE_OUTPUT_RATIO", "3"))
+TRANSLATION_PRELOAD = [lang for lang in os.environ.get("TRANSLATION_PRELOAD", "").split(",") if lang]
+
+Language = Literal["en", "hi", "mr", "pa", "gu", "bn", "kn", "te", "ta", "ml", "or"]
+LANGUAGES = {
+    "en": "English", "hi": "Hindi", "mr": "Marathi", "pa": "Punjabi", "gu": "Gujarati", "bn": "Bengali",
+    "kn": "Kannada", "te": "Telugu", "ta": "Tamil", "ml": "Malayalam", "or": "Odia",
+}
+
+# Keys whose values are data rather than text, at any depth.
+SKIP_KEYS = {"meta", "id", "scheme_id", "farmer_name", "filename", "color", "job_id", "clause_text"}
+_WORD = re.compile(r"[^\W\d_]{2,}")
+
+
+def _translatable(text: str) -> bool:
+    # Sentences and Capitalised labels; not codes like "high", "scheme_first" or "#4a8fd4".
+    text = text.strip()
+    return bool(_WORD.search(text)) and (" " in text or text[0].isupper())
+
+
+def _walk(value, fn, key: str | None = None):
+    if key in SKIP_KEYS:
+        return value
+    if isinstance(value, str):
+        return fn(value) if _translatable(value) else value
+    if isinstance(value, dict):
+        return {k: _walk(v, fn, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_walk(v, fn, key) for v in value]
+    return value
+
+
+def phrases_of(value, key: str | None = None) -> list[str]:
+    found: dict[str, None] = {}
+
+    def note(text: str) -> str:
+        found[text] = None
+        return text
+
+    _walk(value, note, key)
+    return list(found)
+
+
+class PhraseCache:
+    def __init__(self, path: str = TRANSLATION_CACHE_PATH, memory_entries: int = TRANSLATION_MEMORY_ENTRIES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self._memory: dict[tuple[str, str], str] = {}
+        self._db = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS phrases ("
+                             " lang TEXT NOT NULL, source TEXT NOT NULL, text TEXT NOT NULL,"
+                             " PRIMARY KEY (lang, source))")
+        return self._db
+
+    def _remember(self, lang: str, source: str, text: str) -> None:
+        if len(self._memory) >= self.memory_entries:
+            self._memory.pop(next(iter(self._memory)))
+        self._memory[(lang, source)] = text
+
+    def _get_sync(self, lang: str, phrases: list[str]) -> dict[str, str]:
+        found = {}
+        with self._lock:
+            db = self._connect()
+            for i in range(0, len(phrases), 500):  # SQLite's bound-parameter limit
+                chunk = phrases[i:i + 500]
+                found.update(db.execute(f"SELECT source, text FROM phrases WHERE lang = ? AND source IN "
+                                        f"({','.join('?' * len(chunk))})", (lang, *chunk)).fetchall())
+        return found
+
+    def _set_sync(self, lang: str, pairs: dict[str, str]) -> None:
+        with self._lock:
+            self._connect().executemany("INSERT OR REPLACE INTO phrases (lang, source, text) VALUES (?, ?, ?)",
+                                        [(lang, s, t) for s, t in pairs.items()])
+
+    def _counts_sync(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._connect().execute("SELECT lang, COUNT(*) FROM phrases GROUP BY lang"))
+
+    async def get_many(self, lang: str, phrases: list[str]) -> dict[str, str]:
+        found = {p: self._memory[(lang, p)] for p in phrases if (lang, p) in self._memory}
+        rest = [p for p in phrases if p not in found]
+        if rest:
+            stored = await asyncio.to_thread(self._get_sync, lang, rest)
+            for source, text in stored.items():
+                found[source] = text
+                self._remember(lang, source, text)
+        self.hits += len(found)
+        self.misses += len(phrases) - len(found)
+        return found
+
+    async def set_many(self, lang: str, pairs: dict[str, str]) -> None:
+        await asyncio.to_thread(self._set_sync, lang, pairs)
+        for source, text in pairs.items():
+            self._remember(lang, source, text)
+
+    async def stats(self) -> dict:
+        counts = await asyncio.to_thread(self._counts_sync)
+        total = self.hits + self.misses
+        return {"phrases": counts, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+phrase_cache = PhraseCache()
+
+
+def batches(phrases: list[str], limit: int = TRANSLATE_BATCH_TOKENS) -> list[list[str]]:
+    out, size = [[]], 0
+    for phrase in phrases:
+        n = prompts.count_tokens(phrase) + 4
+        if out[-1] and size + n > limit:
+            out.append([])
+            size = 0
+        out[-1].append(phrase)
+        size += n
+    return out if out[0] else []
+
+
+async def translate_batch(phrases: list[str], lang: str) -> dict[str, str]:
+    numbered = {str(i + 1): p for i, p in enumerate(phrases)}
+    source = json.dumps(numbered, ensure_ascii=False)
+    rendered = prompts.TRANSLATE.render(language=LANGUAGES[lang], phrases=source)
+    # The answer is as long as the input, in a script that costs more tokens.
+    expected = prompts.count_tokens(source) * TRANSLATE_OUTPUT_RATIO
+    max_tokens = min(prompts.PROMPT_MAX_OUTPUT_TOKENS, math.ceil(expected * prompts.PROMPT_OUTPUT_SLACK) + 32)
+    try:
+        data = await call_groq(rendered._replace(max_tokens=max_tokens))
+    except InvalidOutput as e:
+        data = e.partial
+    return {numbered[k]: v.strip() for k, v in data.items() if k in numbered and isinstance(v, str) and v.strip()}
+
+
+async def translate(phrases: list[str], lang: str) -> tuple[dict[str, str], bool]:
+    """Translations of `phrases`, from the cache or Groq; and whether some could not be translated."""
+    if lang == "en" or not phrases:
+        return {}, False
+    with stage("translate_cache"):
+        found = await phrase_cache.get_many(lang, phrases)
+    missing = [p for p in phrases if p not in found]
+    if not missing:
+        return found, False
+    results = await asyncio.gather(*(translate_batch(b, lang) for b in batches(missing)), return_exceptions=True)
+    fresh, unavailable = {}, False
+    for result in results:
+        if isinstance(result, BaseException):
+            # A failed batch stays in English; the answer it decorates is still good.
+            if not isinstance(result, UpstreamUnavailable):
+                print(f"[TRANSLATE ERROR] {lang}: {result!r}")
+            unavailable = True
+        else:
+            fresh.update(result)
+    if fresh:
+        await phrase_cache.set_many(lang, fresh)
+    return {**found, **fresh}, unavailable
+
+
+async def localize(value, lang: str, fallback: list | None = None, key: str | None = None):
+    """
+    `value` with its user-facing strings in `lang` (`key` is the name it
+    sits under, if any); appends "translation" to `fallback` if Groq was down
+    or a batch failed.
+    """
+    if lang == "en":
+        return value
+    done, unavailable = await translate(phrases_of(value, key), lang)
+    if unavailable and fallback is not None:
+        fallback.append("translation")
+    return _walk(value, lambda text: done.get(text, text), key)
+
+
+async def localize_response(result: dict, lang: str) -> dict:
+    """A whole endpoint response: translated in one pass, with meta.lang set."""
+    if lang == "en":
+        return result
+    fallback = []
+    out = await localize(result, lang, fallback)
+    meta = out.get("meta")
+    if isinstance(meta, dict):
+        out["meta"] = meta = dict(meta)
+        meta["lang"] = lang
+        if fallback:
+            meta["fallback"] = sorted({*meta.get("fallback", []), *fallback})
+    return out
+
+
+async def localized(coro, lang: str) -> dict:
+    """Await an endpoint's result and localize it; for work handed to the job queue."""
+    return await localize_response(await coro, lang)
+
+
+async def localize_events(events, lang: str):
+    """Translate each streamed section as it arrives; meta is sent last, so it reports the outcome."""
+    fallback = []
+    async for event, data in events:
+        if lang != "en" and event == "meta" and isinstance(data, dict):
+            data = {**data, "lang": lang}
+            if fallback:
+                data["fallback"] = sorted({*data.get("fallback", []), *fallback})
+        elif lang != "en":
+            data = await localize(data, lang, fallback, key=event)
+        yield event, data
+
+
+async def preload(values, langs: list[str] = TRANSLATION_PRELOAD) -> None:
+    """Translate the fixed vocabulary (e.g. the scheme catalogue) ahead of the first request."""
+    for lang in langs:
+        if lang in LANGUAGES and lang != "en":
+            try:
+                await translate(phrases_of(values), lang)
+            except Exception as e:  # best effort; requests translate on demand anyway
+                print(f"[TRANSLATE] Preload for {lang} failed: {e}")
+
+
+@collector
+def translation_metrics() -> list[str]:
+    return (gauge_lines("sahyog_translation_phrase_hits_total", "Phrases served from the translation cache.",
+                        {None: phrase_cache.hits}, kind="counter")
+            + gauge_lines("sahyog_translation_phrase_misses_total", "Phrases sent to Groq for translation.",
+                          {None: phrase_cache.misses}, kind="counter"))
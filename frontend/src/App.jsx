@@ -62,13 +62,17 @@ const T = {
 };
 
 // ─── Hindi Translation + TTS ──────────────────────────────────────────────────
+// The backend translates through its shared phrase cache, so repeated
+// labels and scheme text come back without another round trip to a translator.
 async function translateToHindi(text) {
   try {
-    const res = await fetch(
-      `https://api.mymemory.translated.net/get?q=${encodeURIComponent(text.slice(0, 500))}&langpair=en|hi`
-    );
+    const res = await fetch(`${API_BASE}/translate`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ texts: [text], lang: "hi" }),
+    });
     const data = await res.json();
-    return data.responseData?.translatedText || text;
+    return data.translations?.[0] || text;
   } catch {
     return text;
   }